@@ -1,27 +1,137 @@
 import os
+import hmac
 import json
+import uuid
+import time
+import base64
 from datetime import datetime
-from flask import Flask, request, jsonify, render_template, redirect, make_response
+import click
+from flask import (
+    Flask, Blueprint, Response, g, request, jsonify, render_template, redirect, make_response, stream_with_context, send_file,
+)
+from werkzeug.security import safe_join
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from services.db import (
-    get_or_create_user, reset_daily_scans_if_needed, increment_free_scan,
-    is_unlocked, unlock_user, save_scan, get_history, log_event,
-    save_stripe_session, complete_stripe_session, get_user_by_id, run_migration,
+    get_or_create_user, scan_job_stats, reserve_scan, release_free_scan,
+    is_unlocked, save_scan, save_scans, get_history, get_trends, rebuild_trends, TREND_SCORES,
+    save_stripe_session, complete_checkout, insert_stripe_event, get_user_by_id,
+    begin_request, end_request, release_request_conn, stick_to_primary, written_until, note_write,
+    enqueue_scan_job, get_scan_job, get_scan, save_scan_enrichment, enqueue_enrich_jobs,
+    get_scan_card, get_recent_scan_cards,
+)
+from services.events import log_event, touch_user
+from services.archive import run_scan_archive
+from services import metrics
+from services.resilience import AIUnavailable, AI_QUEUE_TIMEOUT
+from services.ai import OPENAI_TIMEOUT, analyze_message, analyze_message_stream, analyze_thread, enrich_analysis
+from services.stripe_payments import (
+    create_checkout_session, verify_session, construct_webhook_event, process_stripe_events, record_unlock,
+)
+from services.auth import (
+    get_device_id, set_device_cookie, read_entitlement, set_entitlement_cookie,
 )
-from services.ai import analyze_message
-from services.stripe_payments import create_checkout_session, verify_session, construct_webhook_event
-from services.auth import get_device_id, set_device_cookie
+from services import share_card, heuristics, assets, profiling
+from services.migrations import migrate
+from services.jobs import SCAN_JOB_MAX_ATTEMPTS, run_maintenance
+
+# Routes, hooks and CLI commands hang off this blueprint; create_app() builds
+# the Flask app around it. Nothing here opens a connection or builds an API
+# client at import, so gunicorn can preload this module in the master.
+bp = Blueprint("ghostradar", __name__, cli_group=None)
+
+
+def create_app() -> Flask:
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev-secret-key")
+    app.json = profiling.TimedJSONProvider(app)
+    app.register_blueprint(bp)
+    return app
+
+
+# Matches the CHECK constraint on scans.direction
+DIRECTIONS = ("they", "me")
+# "sync" runs the AI call inside the request; "async" queues it for worker.py
+SCAN_MODE = os.environ.get("SCAN_MODE", "sync")
+# Answer with services/heuristics.py's provisional scores when the AI is unavailable
+HEURISTIC_FALLBACK = os.environ.get("HEURISTIC_FALLBACK", "1") == "1"
+
+
+# ── DB connection per request ─────────────────────────────
+
+# Carries read-your-writes stickiness (see services/db.py read_conn) to the
+# user's next requests, whichever worker serves them.
+PRIMARY_COOKIE = "ghostradar_primary_until"
+
+
+@bp.before_app_request
+def _db_begin():
+    metrics.begin_request()
+    profiling.begin_request(_endpoint_name())
+    begin_request()
+    stick_to_primary(_primary_until(request.cookies.get(PRIMARY_COOKIE)))
+
+
+def _primary_until(value) -> float:
+    try:
+        return float(value or 0)
+    except ValueError:
+        return 0.0
+
+
+@bp.after_app_request
+def _read_your_writes(resp):
+    until = written_until()
+    if until:
+        resp.set_cookie(PRIMARY_COOKIE, f"{until:.3f}", max_age=max(1, round(until - time.time())),
+                        httponly=True, samesite="Lax")
+    return resp
+
+
+@bp.after_app_request
+def _server_timing(resp):
+    endpoint = _endpoint_name()
+    profiling.end_request(endpoint, request.method)
+    resp.headers["Server-Timing"] = metrics.server_timing()
+    metrics.end_request(endpoint, request.method, resp.status_code)
+    return resp
 
-app = Flask(__name__)
-app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev-secret-key")
+
+def _endpoint_name() -> str:
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+@bp.teardown_app_request
+def _db_end(exc):
+    end_request()
+
+
+# ── Current user ──────────────────────────────────────────
+
+def _load_user(device_id: str) -> dict:
+    """The user for read paths: from the signed entitlement cookie when it is
+    valid, otherwise from Postgres (and a fresh cookie goes out)."""
+    user = read_entitlement(device_id)
+    if user is None:
+        user = get_or_create_user(device_id)
+        g.entitlement_user = user
+    touch_user(user["id"])
+    return user
+
+
+@bp.after_app_request
+def _entitlement_cookie(resp):
+    user = g.pop("entitlement_user", None)
+    if user is not None:
+        set_entitlement_cookie(resp, user)
+    return resp
 
 
 # ── Pages ─────────────────────────────────────────────────
 
-@app.route("/")
+@bp.route("/")
 def index():
     device_id = get_device_id()
     resp = make_response(render_template("index.html"))
@@ -29,35 +139,32 @@ def index():
     return resp
 
 
-@app.route("/app")
+@bp.route("/app")
 def app_page():
     device_id = get_device_id()
-    user = get_or_create_user(device_id)
+    user = _load_user(device_id)
     unlocked = is_unlocked(user)
-    resp = make_response(render_template("app.html", unlocked=unlocked))
+    resp = make_response(render_template("app.html", unlocked=unlocked, scan_mode=SCAN_MODE))
     set_device_cookie(resp, device_id)
     return resp
 
 
-@app.route("/success")
+@bp.route("/success")
 def success_page():
     session_id = request.args.get("session_id")
     return render_template("success.html", session_id=session_id)
 
 
-@app.route("/cancel")
+@bp.route("/cancel")
 def cancel_page():
     return render_template("cancel.html")
 
 
 # ── API: Scan ─────────────────────────────────────────────
 
-@app.route("/api/scan", methods=["POST"])
+@bp.route("/api/scan", methods=["POST"])
 def api_scan():
     device_id = get_device_id()
-    user = get_or_create_user(device_id)
-    user = reset_daily_scans_if_needed(user)
-    unlocked = is_unlocked(user)
 
     data = request.get_json(force=True)
     message_text = data.get("message_text", "").strip()
@@ -65,32 +172,259 @@ def api_scan():
 
     if not message_text:
         return jsonify({"error": "Message text is required."}), 400
+    if direction not in DIRECTIONS:
+        return jsonify({"error": "direction must be \"they\" or \"me\"."}), 400
 
-    # Check entitlement
-    if not unlocked and user["free_scans_used_today"] >= 1:
+    # Resolve user + check entitlement (reserves today's free scan atomically)
+    user, unlocked, reserved = reserve_scan(device_id)
+    g.entitlement_user = user
+    if not unlocked and not reserved:
         log_event(user["id"], "paywall_shown")
         return jsonify({"paywall": True}), 402
 
+    # Locked users only see the core fields, so don't pay to generate the rest
+    tier = "full" if unlocked else "core"
+
+    # Async mode: hand the AI call to worker.py and let the client poll
+    if SCAN_MODE == "async" or data.get("async"):
+        job = enqueue_scan_job(user["id"], message_text, direction, reserved, SCAN_JOB_MAX_ATTEMPTS, tier)
+        resp = make_response(jsonify({"job_id": str(job["id"]), "status": job["status"]}), 202)
+        set_device_cookie(resp, device_id)
+        return resp
+
+    # Don't pin a pooled connection for the length of the AI call
+    release_request_conn()
+
     # Call AI
     try:
-        result = analyze_message(message_text, direction)
+        fresh = "no-cache" in request.headers.get("Cache-Control", "")
+        result = analyze_message(message_text, direction, use_cache=not fresh, tier=tier)
     except Exception as e:
+        if reserved:
+            release_free_scan(user["id"])
+        if isinstance(e, AIUnavailable):
+            if HEURISTIC_FALLBACK:
+                log_event(user["id"], "scan_fallback")
+                resp = make_response(jsonify(_provisional_response(message_text, direction, unlocked)))
+                set_device_cookie(resp, device_id)
+                return resp
+            raise
         return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
 
     # Save scan
     result["message_text"] = message_text
     result["direction"] = direction
-    scan = save_scan(user["id"], result)
-
-    # Increment free scan counter if not unlocked
-    if not unlocked:
-        increment_free_scan(user["id"])
+    try:
+        scan = save_scan(user["id"], result)
+    except Exception:
+        if reserved:
+            release_free_scan(user["id"])
+        raise
 
     log_event(user["id"], "scan_completed")
 
-    # Build response
+    resp = make_response(jsonify(_scan_response(scan["id"], result, unlocked)))
+    set_device_cookie(resp, device_id)
+    return resp
+
+
+@bp.route("/api/scan/stream", methods=["POST"])
+def api_scan_stream():
+    """Same as /api/scan, but streams fields as Server-Sent Events as the model emits them.
+
+    Events: "field" ({name, value}) per completed field, then "done" with the
+    full /api/scan payload once the scan is saved, or "error".
+    """
+    device_id = get_device_id()
+
+    data = request.get_json(force=True)
+    message_text = data.get("message_text", "").strip()
+    direction = data.get("direction", "they")
+
+    if not message_text:
+        return jsonify({"error": "Message text is required."}), 400
+    if direction not in DIRECTIONS:
+        return jsonify({"error": "direction must be \"they\" or \"me\"."}), 400
+
+    user, unlocked, reserved = reserve_scan(device_id)
+    g.entitlement_user = user
+    if not unlocked and not reserved:
+        log_event(user["id"], "paywall_shown")
+        return jsonify({"paywall": True}), 402
+
+    # The scan is saved inside the stream, after the headers (and the
+    # read-your-writes cookie) have gone out, so claim the window up front.
+    note_write(user["id"], lead=AI_QUEUE_TIMEOUT + OPENAI_TIMEOUT)
+    release_request_conn()
+    fresh = "no-cache" in request.headers.get("Cache-Control", "")
+
+    def generate():
+        completed = False
+        # Instant local estimate; the model's fields replace it as they arrive
+        yield _sse("provisional", _provisional_response(message_text, direction, unlocked))
+        try:
+            result = None
+            tier = "full" if unlocked else "core"
+            for kind, name, value in analyze_message_stream(message_text, direction, use_cache=not fresh, tier=tier):
+                if kind == "result":
+                    result = value
+                elif unlocked or name not in PAID_FIELDS:
+                    yield _sse("field", {"name": name, "value": value})
+
+            result["message_text"] = message_text
+            result["direction"] = direction
+            scan = save_scan(user["id"], result)
+            completed = True
+            log_event(user["id"], "scan_completed", {"stream": True})
+            yield _sse("done", _scan_response(scan["id"], result, unlocked))
+        except AIUnavailable as e:
+            if HEURISTIC_FALLBACK and result is None:
+                log_event(user["id"], "scan_fallback", {"stream": True})
+                yield _sse("done", _provisional_response(message_text, direction, unlocked))
+            else:
+                yield _sse("error", {"error": str(e), "retry_after": round(e.retry_after)})
+        except Exception as e:
+            yield _sse("error", {"error": f"Analysis failed: {str(e)}"})
+        finally:
+            # Also covers the client disconnecting mid-stream (GeneratorExit)
+            if reserved and not completed:
+                release_free_scan(user["id"])
+
+    resp = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    set_device_cookie(resp, device_id)
+    return resp
+
+
+THREAD_MAX_MESSAGES = int(os.environ.get("THREAD_MAX_MESSAGES", "10"))
+
+
+@bp.route("/api/scan/thread", methods=["POST"])
+def api_scan_thread():
+    """Scan an ordered list of messages from one conversation in a single model call.
+
+    Body: {"messages": [{"message_text", "direction"}, ...]}, oldest first.
+    Each message counts as one scan against the free allowance.
+    """
+    device_id = get_device_id()
+
+    data = request.get_json(force=True)
+    entries = data.get("messages")
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"error": "messages must be a non-empty list."}), 400
+    if len(entries) > THREAD_MAX_MESSAGES:
+        return jsonify({"error": f"At most {THREAD_MAX_MESSAGES} messages per thread."}), 400
+    messages = []
+    for e in entries:
+        message_text = (e.get("message_text") or "").strip() if isinstance(e, dict) else ""
+        if not message_text:
+            return jsonify({"error": "Message text is required."}), 400
+        if e.get("direction", "they") not in DIRECTIONS:
+            return jsonify({"error": "direction must be \"they\" or \"me\"."}), 400
+        messages.append({"message_text": message_text, "direction": e.get("direction", "they")})
+
+    user, unlocked, reserved = reserve_scan(device_id, len(messages))
+    g.entitlement_user = user
+    if not unlocked and not reserved:
+        log_event(user["id"], "paywall_shown")
+        return jsonify({"paywall": True}), 402
+
+    tier = "full" if unlocked else "core"
+    release_request_conn()
+
+    try:
+        fresh = "no-cache" in request.headers.get("Cache-Control", "")
+        thread = analyze_thread(messages, use_cache=not fresh, tier=tier)
+    except Exception as e:
+        if reserved:
+            release_free_scan(user["id"], len(messages))
+        if isinstance(e, AIUnavailable):
+            raise
+        return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
+
+    results = [dict(r, **m) for r, m in zip(thread["results"], messages)]
+    try:
+        scans = save_scans(user["id"], results)
+    except Exception:
+        if reserved:
+            release_free_scan(user["id"], len(messages))
+        raise
+
+    log_event(user["id"], "scan_completed", {"thread": len(scans)})
+
+    resp = make_response(jsonify({
+        "thread_summary": thread["thread_summary"],
+        "scans": [_scan_response(scan["id"], result, unlocked) for scan, result in zip(scans, results)],
+    }))
+    set_device_cookie(resp, device_id)
+    return resp
+
+
+@bp.route("/api/scan/<scan_id>")
+def api_scan_detail(scan_id):
+    """A saved scan. Unlocked users get hidden signals + replies, generated on first view."""
+    device_id = get_device_id()
+    user = _load_user(device_id)
+    unlocked = is_unlocked(user)
+    scan = get_scan(scan_id, user["id"]) if _is_uuid(scan_id) else None
+    if not scan:
+        return jsonify({"error": "Scan not found."}), 404
+
+    if unlocked and not scan["enriched"]:
+        release_request_conn()
+        try:
+            enrichment = enrich_analysis(scan["message_text"], scan["direction"], scan)
+        except AIUnavailable:
+            raise
+        except Exception as e:
+            return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
+        scan = save_scan_enrichment(scan["id"], enrichment)
+        if scan is None:
+            return jsonify({"error": "Scan not found."}), 404
+
+    resp = make_response(jsonify(_scan_response(scan["id"], scan, unlocked)))
+    set_device_cookie(resp, device_id)
+    return resp
+
+
+@bp.route("/api/scan/jobs/<job_id>")
+def api_scan_job(job_id):
+    device_id = get_device_id()
+    user = _load_user(device_id)
+    job = get_scan_job(job_id, user["id"]) if _is_uuid(job_id) else None
+    if not job:
+        return jsonify({"error": "Job not found."}), 404
+
+    if job["status"] == "done":
+        # job carries the scan's columns; id is missing only if the scan is gone
+        if job["id"] is None:
+            return jsonify({"error": "Scan not found."}), 404
+        body = {"status": "done", "result": _scan_response(job["scan_id"], job, is_unlocked(user))}
+        return jsonify(body)
+    if job["status"] == "failed":
+        return jsonify({"status": "failed", "error": f"Analysis failed: {job['error']}"})
+
+    resp = make_response(jsonify({"status": job["status"]}))
+    resp.headers["Retry-After"] = "1"
+    return resp
+
+
+@bp.app_errorhandler(AIUnavailable)
+def ai_unavailable(e):
+    """OpenAI is down or we're shedding load: fail fast instead of tying up the worker."""
+    resp = make_response(jsonify({"error": str(e), "retry_after": round(e.retry_after)}), 503)
+    resp.headers["Retry-After"] = str(max(1, round(e.retry_after)))
+    return resp
+
+
+# Hidden signals + replies are the paid unlock
+PAID_FIELDS = ("hidden_signals", "replies")
+
+
+def _scan_response(scan_id, result: dict, unlocked: bool) -> dict:
     response_data = {
-        "id": str(scan["id"]),
+        "id": str(scan_id),
         "interest_score": result["interest_score"],
         "red_flag_risk": result["red_flag_risk"],
         "emotional_distance": result["emotional_distance"],
@@ -100,32 +434,70 @@ def api_scan():
         "hidden_signals_count": result["hidden_signals_count"],
         "archetype": result.get("archetype", ""),
         "locked": not unlocked,
+        "share_card_url": share_card.card_url(scan_id),
     }
 
     # Summary + archetype always visible (the AI "voice")
     response_data["summary"] = result.get("summary", "")
 
-    # Hidden signals + replies are the paid unlock
     if unlocked:
         response_data["hidden_signals"] = result.get("hidden_signals", [])
         response_data["replies"] = result.get("replies", {})
     else:
         response_data["hidden_signals"] = []
         response_data["replies"] = {}
+    return response_data
 
-    resp = make_response(jsonify(response_data))
-    set_device_cookie(resp, device_id)
-    return resp
+
+def _provisional_response(message_text: str, direction: str, unlocked: bool) -> dict:
+    """/api/scan's payload from the local heuristic scorer. Not saved: it has
+    no id, and the free scan it used is given back."""
+    result = heuristics.score(message_text, direction)
+    body = _scan_response(None, result, unlocked)
+    body.update(id=None, share_card_url=None, provisional=True)
+    return body
+
+
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
 
 # ── API: History ──────────────────────────────────────────
 
-@app.route("/api/history")
+HISTORY_PAGE_SIZE = 10
+HISTORY_PAGE_MAX = 50
+
+@bp.route("/api/history")
 def api_history():
     device_id = get_device_id()
-    user = get_or_create_user(device_id)
+    user = _load_user(device_id)
     unlocked = is_unlocked(user)
-    scans = get_history(user["id"])
+
+    limit = min(max(request.args.get("limit", HISTORY_PAGE_SIZE, type=int), 1), HISTORY_PAGE_MAX)
+    cursor = request.args.get("cursor")
+    before = _decode_cursor(cursor) if cursor else None
+    if cursor and before is None:
+        return jsonify({"error": "Invalid cursor."}), 400
+
+    # One extra row tells us whether there is another page
+    scans = get_history(user["id"], limit + 1, before)
+    resp = make_response(jsonify(_history_body(scans, limit, before, unlocked)))
+    set_device_cookie(resp, device_id)
+    return resp
+
+
+def _history_body(scans: list, limit: int, before, unlocked: bool) -> dict:
+    """The /api/history payload from up to limit + 1 rows (shared with asgi.py)."""
+    next_cursor = _encode_cursor(scans[limit - 1]) if len(scans) > limit else None
+    scans = scans[:limit]
 
     results = []
     for s in scans:
@@ -144,9 +516,9 @@ def api_history():
             item["summary"] = s["summary"]
         results.append(item)
 
-    # Compute trends if 2+ scans
+    # Compute trends if 2+ scans (first page only: they compare the latest two)
     trends = {}
-    if len(results) >= 2:
+    if before is None and len(results) >= 2:
         latest = results[0]
         previous = results[1]
         for key in ["interest_score", "ghost_probability"]:
@@ -158,30 +530,177 @@ def api_history():
             else:
                 trends[key] = "stable"
 
-    resp = make_response(jsonify({"scans": results, "trends": trends, "locked": not unlocked}))
+    return {"scans": results, "trends": trends, "locked": not unlocked, "next_cursor": next_cursor}
+
+
+@bp.route("/api/trends")
+def api_trends():
+    device_id = get_device_id()
+    user = _load_user(device_id)
+    unlocked = is_unlocked(user)
+    agg = get_trends(user["id"])
+
+    body = {"scan_count": 0, "locked": not unlocked}
+    if agg and agg["scan_count"]:
+        # recent is newest first; slopes are points per scan, oldest to newest
+        recent = agg["recent"]
+        slopes = {k: _slope([p[k] or 0 for p in reversed(recent)]) for k in TREND_SCORES}
+        body.update({
+            "scan_count": agg["scan_count"],
+            "last_scan_at": agg["last_scan_at"].isoformat() if agg["last_scan_at"] else None,
+            "averages": {k: round(agg[f"{k}_sum"] / agg["scan_count"], 1) for k in TREND_SCORES},
+            "ewma": {k: round(agg[f"{k}_ewma"], 1) for k in TREND_SCORES},
+            "slopes": {k: round(v, 2) for k, v in slopes.items()},
+            "trends": {
+                k: "rising" if v > 1 else "falling" if v < -1 else "stable"
+                for k, v in slopes.items()
+            },
+            "recent": recent if unlocked else [{k: v for k, v in p.items() if k != "archetype"} for p in recent],
+        })
+        if unlocked:
+            body["archetypes"] = agg["archetypes"]
+
+    resp = make_response(jsonify(body))
     set_device_cookie(resp, device_id)
     return resp
 
 
+def _slope(values: list) -> float:
+    """Least-squares slope of values against their index."""
+    n = len(values)
+    if n < 2:
+        return 0.0
+    mean_x = (n - 1) / 2
+    mean_y = sum(values) / n
+    num = sum((i - mean_x) * (y - mean_y) for i, y in enumerate(values))
+    den = sum((i - mean_x) ** 2 for i in range(n))
+    return num / den
+
+
+def _encode_cursor(scan: dict) -> str:
+    raw = f"{scan['created_at'].isoformat()}|{scan['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, scan_id = raw.split("|")
+        return datetime.fromisoformat(created_at), str(uuid.UUID(scan_id))
+    except ValueError:
+        return None
+
+
+# ── Share cards ───────────────────────────────────────────
+
+@bp.route("/share/<scan_id>")
+def share_page(scan_id):
+    # Landing page for shared links; its og:image is the rendered card
+    if not _is_uuid(scan_id) or not get_scan_card(scan_id):
+        return redirect("/")
+    return render_template("share.html", card_url=share_card.card_url(scan_id))
+
+
+@bp.route("/share/<scan_id>.png")
+def share_card_png(scan_id):
+    if not _is_uuid(scan_id):
+        return jsonify({"error": "Scan not found."}), 404
+    path = share_card.card_path(scan_id)
+    if not os.path.exists(path):
+        scan = get_scan_card(scan_id)
+        if not scan:
+            return jsonify({"error": "Scan not found."}), 404
+        path = share_card.write_card(scan)
+
+    resp = send_file(path, mimetype="image/png", etag=share_card.card_etag(scan_id), max_age=31536000)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+
+# ── Static assets (see scripts/build_static.py) ─────────
+
+@bp.app_template_global()
+def asset_url(name: str) -> str:
+    return assets.asset_url(name)
+
+
+@bp.route("/static/dist/<path:filename>")
+def static_dist(filename):
+    path, encoding = assets.precompressed(filename, request.accept_encodings)
+    if path is None:
+        return jsonify({"error": "Not found."}), 404
+    resp = send_file(
+        path, mimetype=assets.mimetype(filename), max_age=assets.IMMUTABLE_MAX_AGE,
+        etag=f"{filename}.{encoding or 'identity'}",
+    )
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+
 # ── API: Events ───────────────────────────────────────────
 
-@app.route("/api/event", methods=["POST"])
+MAX_EVENTS_PER_POST = 50
+MAX_EVENT_NAME_LENGTH = 64
+MAX_EVENT_META_BYTES = 2048
+
+
+@bp.route("/api/event", methods=["POST"])
 def api_event():
     device_id = get_device_id()
-    user = get_or_create_user(device_id)
-    data = request.get_json(force=True)
-    event_name = data.get("event_name", "unknown")
-    meta = data.get("meta", {})
-    log_event(user["id"], event_name, meta)
+    user = _load_user(device_id)
+    if not _log_events(user["id"], request.get_json(force=True)):
+        return jsonify({"error": "Expected an event object or a list of events."}), 400
     return jsonify({"ok": True})
 
 
+def _log_events(user_id, data) -> bool:
+    """Log a single event, {"events": [...]} or a bare list of events (so the
+    client can coalesce). False if the body is none of those."""
+    if isinstance(data, list):
+        events = data
+    elif isinstance(data, dict):
+        events = data.get("events") if isinstance(data.get("events"), list) else [data]
+    else:
+        return False
+    dropped = max(len(events) - MAX_EVENTS_PER_POST, 0)
+    for e in events[:MAX_EVENTS_PER_POST]:
+        if _valid_event(e):
+            log_event(user_id, e.get("event_name", "unknown"), e.get("meta") or {})
+        else:
+            dropped += 1
+    if dropped:
+        metrics.EVENTS.labels("dropped").inc(dropped)
+    return True
+
+
+def _valid_event(e) -> bool:
+    # Events share one multi-row INSERT with other users' events; anything
+    # Postgres would refuse (non-text names, NUL bytes, non-object meta)
+    # stops here.
+    if not isinstance(e, dict):
+        return False
+    name = e.get("event_name", "unknown")
+    meta = e.get("meta") or {}
+    if not isinstance(name, str) or not name or len(name) > MAX_EVENT_NAME_LENGTH or "\x00" in name:
+        return False
+    if not isinstance(meta, dict):
+        return False
+    encoded = json.dumps(meta)
+    return len(encoded) <= MAX_EVENT_META_BYTES and "\\u0000" not in encoded
+
+
 # ── API: Stripe Checkout ─────────────────────────────────
 
-@app.route("/api/create-checkout", methods=["POST"])
+@bp.route("/api/create-checkout", methods=["POST"])
 def api_create_checkout():
     device_id = get_device_id()
     user = get_or_create_user(device_id)
+    touch_user(user["id"])
     data = request.get_json(force=True)
     plan = "monthly"
 
@@ -201,7 +720,7 @@ def api_create_checkout():
 
 # ── API: Confirm ──────────────────────────────────────────
 
-@app.route("/api/confirm")
+@bp.route("/api/confirm")
 def api_confirm():
     session_id = request.args.get("session_id")
     if not session_id:
@@ -209,16 +728,31 @@ def api_confirm():
 
     result = verify_session(session_id)
     if result:
-        unlock_user(result["user_id"], result["plan"])
-        complete_stripe_session(session_id)
-        log_event(result["user_id"], "purchase_completed", {"plan": result["plan"]})
+        # No-op if the webhook already completed this session
+        unlock = complete_checkout(session_id, result["user_id"], result["plan"])
+        if unlock:
+            record_unlock(unlock, "confirm")
+            _enrich_after_purchase(unlock["user_id"])
+        # The buyer's own browser: hand it an unlocked entitlement right away
+        user = get_user_by_id(result["user_id"])
+        if user and user["device_id"] == get_device_id():
+            g.entitlement_user = user
         return jsonify({"unlocked": True, "plan": result["plan"]})
     return jsonify({"unlocked": False}), 400
 
 
+def _enrich_after_purchase(user_id):
+    """Pre-generate paid fields for the scans a new subscriber is most likely to open.
+
+    Only with a worker running (async mode); otherwise /api/scan/<id> enriches on view.
+    """
+    if SCAN_MODE == "async":
+        enqueue_enrich_jobs(user_id)
+
+
 # ── Webhook: Stripe ───────────────────────────────────────
 
-@app.route("/webhook/stripe", methods=["POST"])
+@bp.route("/webhook/stripe", methods=["POST"])
 def webhook_stripe():
     payload = request.get_data()
     sig = request.headers.get("Stripe-Signature")
@@ -228,53 +762,144 @@ def webhook_stripe():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        user_id = session.get("metadata", {}).get("user_id")
-        plan = session.get("metadata", {}).get("plan")
-        if user_id and plan:
-            unlock_user(user_id, plan)
-            complete_stripe_session(session["id"])
-            log_event(user_id, "purchase_completed", {"plan": plan, "via": "webhook"})
+    # Store and ack; applying it happens after the response is sent
+    insert_stripe_event(event["id"], event["type"], payload.decode("utf-8"), event["created"])
+    resp = jsonify({"received": True})
+    resp.call_on_close(_drain_stripe_events)
+    return resp, 200
 
-    return jsonify({"received": True}), 200
 
+def _drain_stripe_events():
+    try:
+        for unlock in process_stripe_events():
+            _enrich_after_purchase(unlock["user_id"])
+    except Exception as e:
+        print(f"Stripe event processing failed: {e}")
 
-# ── CLI: Migrate ──────────────────────────────────────────
 
-@app.cli.command("migrate")
-def migrate_cmd():
-    run_migration()
+# ── Metrics ───────────────────────────────────────────────
 
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
 
-# ── Auto-migrate on startup ──────────────────────────────
 
-def auto_migrate():
-    """Run migration if tables don't exist yet."""
+@bp.route("/metrics")
+def prometheus_metrics():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
     try:
-        from services.db import get_conn
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT EXISTS (SELECT FROM pg_tables WHERE schemaname='public' AND tablename='users')")
-        exists = cur.fetchone()["exists"]
-        conn.close()
-        if not exists:
-            print("Tables not found, running migration...")
-            run_migration()
-        else:
-            print("Database tables already exist.")
+        queue = scan_job_stats()
+        for stat, value in queue.items():
+            metrics.SCAN_QUEUE.labels(stat).set(float(value or 0))
     except Exception as e:
-        print(f"Auto-migrate check: {e}")
-        # Try running migration anyway
-        try:
-            run_migration()
-        except Exception as e2:
-            print(f"Migration failed: {e2}")
+        print(f"Scan queue stats unavailable: {e}")
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+# ── Admin: profiling ──────────────────────────────────────
+
+# Bearer token for /admin/*; the admin routes 404 without it.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def _admin_authorized() -> bool:
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {ADMIN_TOKEN}",
+    )
+
 
-auto_migrate()
+@bp.route("/admin/profile", methods=["GET"])
+def admin_profile():
+    """This worker's sampler state, per-route CPU vs wall time and the
+    profiles on disk."""
+    if not _admin_authorized():
+        return jsonify({"error": "Not found."}), 404
+    return jsonify(profiling.status())
+
+
+@bp.route("/admin/profile", methods=["POST"])
+def admin_profile_toggle():
+    """{"seconds": N} samples every worker for N seconds; 0 stops early."""
+    if not _admin_authorized():
+        return jsonify({"error": "Not found."}), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = min(max(float(data.get("seconds", 60)), 0), 3600)
+    except (TypeError, ValueError):
+        return jsonify({"error": "seconds must be a number."}), 400
+    until = profiling.request_sampling(seconds)
+    return jsonify({"sampling": seconds > 0, "until": until or None})
+
+
+@bp.route("/admin/profile/<name>")
+def admin_profile_file(name):
+    if not _admin_authorized():
+        return jsonify({"error": "Not found."}), 404
+    path = safe_join(profiling.PROFILE_DIR, name)
+    if path is None or not name.endswith(".folded") or not os.path.isfile(path):
+        return jsonify({"error": "Not found."}), 404
+    return send_file(path, mimetype="text/plain", as_attachment=True)
+
+
+# ── CLI: Migrate ──────────────────────────────────────────
+
+@bp.cli.command("migrate")
+def migrate_cmd():
+    applied = migrate()
+    print(f"Applied {len(applied)} migrations." if applied else "Schema is up to date.")
+
+
+@bp.cli.command("backfill-trends")
+def backfill_trends_cmd():
+    """Rebuild user_trends from the scans table."""
+    count = rebuild_trends()
+    print(f"Rebuilt trend aggregates for {count} users.")
+
+
+@bp.cli.command("render-share-cards")
+@click.option("--days", default=7, help="Render cards for scans from the last N days.")
+@click.option("--limit", default=1000, help="At most this many scans, newest first.")
+def render_share_cards_cmd(days, limit):
+    """Pre-render share cards that aren't cached yet."""
+    rendered = 0
+    for scan in get_recent_scan_cards(days, limit):
+        if not os.path.exists(share_card.card_path(scan["id"])):
+            share_card.write_card(scan)
+            rendered += 1
+    print(f"Rendered {rendered} share cards.")
+
+
+@bp.cli.command("process-stripe-events")
+def process_stripe_events_cmd():
+    """Apply pending Stripe webhook events."""
+    unlocks = process_stripe_events()
+    print(f"Applied {len(unlocks)} unlocks.")
+
+
+@bp.cli.command("events-maintenance")
+def events_maintenance_cmd():
+    """Create events partitions, roll up events_daily, apply retention and
+    purge expired analysis_cache rows and finished scan jobs."""
+    if not run_maintenance():
+        print("Events maintenance already running elsewhere (or failed, see above).")
+
+
+@bp.cli.command("archive-scans")
+@click.option("--days", type=int, default=None, help="Archive scans older than N days (default SCAN_ARCHIVE_AFTER_DAYS).")
+@click.option("--batch-size", type=int, default=None, help="Rows moved per transaction (default SCAN_ARCHIVE_BATCH_SIZE).")
+@click.option("--max-batches", type=int, default=None, help="Stop after this many batches.")
+@click.option("--vacuum", is_flag=True, help="VACUUM (ANALYZE) scans afterwards.")
+def archive_scans_cmd(days, batch_size, max_batches, vacuum):
+    """Move old scans into scans_archive in small batches."""
+    report = run_scan_archive(days, batch_size, max_batches, vacuum)
+    print(
+        f"Archived {report['moved']} scans: {report['raw_bytes']} row bytes moved, "
+        f"{report['archived_bytes']} bytes in scans_archive (net {report.get('row_bytes_saved', 0):+d})."
+    )
 
 
 # ── Run ───────────────────────────────────────────────────
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    migrate()
+    create_app().run(debug=True, port=5000)
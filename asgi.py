@@ -0,0 +1,234 @@
+"""ASGI entry point: the hot JSON endpoints on asyncio, everything else on Flask.
+
+/api/scan, /api/history and /api/event run as Starlette handlers on
+AsyncOpenAI and an async Postgres pool (services/db_async.py), so a worker
+waiting on the model holds a coroutine instead of a thread. Every other route
+is the unchanged Flask app, mounted through a2wsgi. The sync deployment
+(gunicorn app:create_app()) remains the default; to serve this instead:
+
+    uvicorn asgi:app --workers 4
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+"""
+import os
+import time
+import uuid
+import asyncio
+import functools
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+from app import (
+    create_app, SCAN_MODE, DIRECTIONS, HEURISTIC_FALLBACK, HISTORY_PAGE_SIZE, HISTORY_PAGE_MAX, PRIMARY_COOKIE,
+    _scan_response, _provisional_response, _history_body, _log_events, _decode_cursor, _primary_until,
+)
+from services import db_async, metrics
+from services.ai import analyze_message_async
+from services.auth import (
+    COOKIE_NAME, ENTITLEMENT_COOKIE, ENTITLEMENT_REFRESH, ENTITLEMENT_TTL,
+    apply_entitlement_bumps, decode_entitlement, set_device_cookie, set_entitlement_cookie,
+)
+from services.db import is_unlocked, stick_to_primary, written_until
+from services.events import log_event, touch_user
+from services.jobs import SCAN_JOB_MAX_ATTEMPTS
+from services.resilience import AIUnavailable
+
+# Threads a2wsgi runs the mounted Flask app on (per worker process).
+ASGI_WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", "10"))
+
+
+# ── request plumbing ──────────────────────────────────────
+
+def _endpoint(fn):
+    """Server-Timing, request metrics, read-your-writes stickiness and the
+    AIUnavailable 503, as the Flask hooks do for the sync routes."""
+    @functools.wraps(fn)
+    async def wrapper(request):
+        metrics.begin_request()
+        stick_to_primary(_primary_until(request.cookies.get(PRIMARY_COOKIE)))
+        status = 500
+        try:
+            try:
+                resp = await fn(request)
+            except AIUnavailable as e:
+                resp = JSONResponse({"error": str(e), "retry_after": round(e.retry_after)}, 503)
+                resp.headers["Retry-After"] = str(max(1, round(e.retry_after)))
+            until = written_until()
+            if until:
+                resp.set_cookie(PRIMARY_COOKIE, f"{until:.3f}", max_age=max(1, round(until - time.time())),
+                                httponly=True, samesite="Lax")
+            resp.headers["Server-Timing"] = metrics.server_timing()
+            status = resp.status_code
+            return resp
+        finally:
+            # Unhandled exceptions are recorded as 500s
+            metrics.end_request(request.url.path, request.method, status)
+    return wrapper
+
+
+def _device_id(request) -> str:
+    return request.cookies.get(COOKIE_NAME) or str(uuid.uuid4())
+
+
+async def _json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def _load_user(request, device_id: str) -> tuple[dict, bool]:
+    """Like app._load_user. Returns (user, fresh); fresh users need a new
+    entitlement cookie."""
+    user = decode_entitlement(request.cookies.get(ENTITLEMENT_COOKIE), device_id, refresh=False)
+    fresh = user is None
+    if fresh:
+        user = await db_async.get_or_create_user(device_id)
+    touch_user(user["id"])
+    return user, fresh
+
+
+# ── API ───────────────────────────────────────────────────
+
+@_endpoint
+async def api_scan(request):
+    device_id = _device_id(request)
+    data = await _json(request)
+    if data is None:
+        return JSONResponse({"error": "Invalid JSON."}, 400)
+    message_text = data.get("message_text", "").strip()
+    direction = data.get("direction", "they")
+
+    if not message_text:
+        return JSONResponse({"error": "Message text is required."}, 400)
+    if direction not in DIRECTIONS:
+        return JSONResponse({"error": 'direction must be "they" or "me".'}, 400)
+
+    user, unlocked, reserved = await db_async.reserve_scan(device_id)
+    if not unlocked and not reserved:
+        log_event(user["id"], "paywall_shown")
+        resp = JSONResponse({"paywall": True}, 402)
+        set_entitlement_cookie(resp, user)
+        return resp
+
+    tier = "full" if unlocked else "core"
+
+    if SCAN_MODE == "async" or data.get("async"):
+        job = await db_async.enqueue_scan_job(
+            user["id"], message_text, direction, reserved, SCAN_JOB_MAX_ATTEMPTS, tier,
+        )
+        resp = JSONResponse({"job_id": str(job["id"]), "status": job["status"]}, 202)
+        set_device_cookie(resp, device_id)
+        set_entitlement_cookie(resp, user)
+        return resp
+
+    try:
+        fresh = "no-cache" in request.headers.get("cache-control", "")
+        result = await analyze_message_async(message_text, direction, use_cache=not fresh, tier=tier)
+    except Exception as e:
+        if reserved:
+            await db_async.release_free_scan(user["id"])
+        if isinstance(e, AIUnavailable):
+            if HEURISTIC_FALLBACK:
+                log_event(user["id"], "scan_fallback")
+                resp = JSONResponse(_provisional_response(message_text, direction, unlocked))
+                set_device_cookie(resp, device_id)
+                set_entitlement_cookie(resp, user)
+                return resp
+            raise
+        return JSONResponse({"error": f"Analysis failed: {str(e)}"}, 500)
+
+    result["message_text"] = message_text
+    result["direction"] = direction
+    try:
+        scan = await db_async.save_scan(user["id"], result)
+    except Exception:
+        if reserved:
+            await db_async.release_free_scan(user["id"])
+        raise
+
+    log_event(user["id"], "scan_completed")
+
+    resp = JSONResponse(_scan_response(scan["id"], result, unlocked))
+    set_device_cookie(resp, device_id)
+    set_entitlement_cookie(resp, user)
+    return resp
+
+
+@_endpoint
+async def api_history(request):
+    device_id = _device_id(request)
+    user, fresh = await _load_user(request, device_id)
+    unlocked = is_unlocked(user)
+
+    try:
+        limit = int(request.query_params.get("limit", HISTORY_PAGE_SIZE))
+    except ValueError:
+        limit = HISTORY_PAGE_SIZE
+    limit = min(max(limit, 1), HISTORY_PAGE_MAX)
+    cursor = request.query_params.get("cursor")
+    before = _decode_cursor(cursor) if cursor else None
+    if cursor and before is None:
+        return JSONResponse({"error": "Invalid cursor."}, 400)
+
+    scans = await db_async.get_history(user["id"], limit + 1, before)
+    resp = JSONResponse(_history_body(scans, limit, before, unlocked))
+    set_device_cookie(resp, device_id)
+    if fresh:
+        set_entitlement_cookie(resp, user)
+    return resp
+
+
+@_endpoint
+async def api_event(request):
+    device_id = _device_id(request)
+    user, fresh = await _load_user(request, device_id)
+    try:
+        data = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "Invalid JSON."}, 400)
+    if not _log_events(user["id"], data):
+        return JSONResponse({"error": "Expected an event object or a list of events."}, 400)
+    resp = JSONResponse({"ok": True})
+    if fresh:
+        set_entitlement_cookie(resp, user)
+    return resp
+
+
+# ── app ───────────────────────────────────────────────────
+
+async def _refresh_entitlements():
+    # services/auth.py's version floor, refreshed off the request path
+    while True:
+        try:
+            apply_entitlement_bumps(await db_async.entitlement_bumps(ENTITLEMENT_TTL))
+        except Exception as e:
+            print(f"Entitlement refresh failed: {e}")
+        await asyncio.sleep(ENTITLEMENT_REFRESH)
+
+
+@asynccontextmanager
+async def lifespan(_):
+    # Runs in each worker process, after any fork
+    await db_async.open_pool()
+    refresher = asyncio.create_task(_refresh_entitlements())
+    try:
+        yield
+    finally:
+        refresher.cancel()
+        await db_async.close_pool()
+
+
+app = Starlette(
+    routes=[
+        Route("/api/scan", api_scan, methods=["POST"]),
+        Route("/api/history", api_history, methods=["GET"]),
+        Route("/api/event", api_event, methods=["POST"]),
+        Mount("/", WSGIMiddleware(create_app(), workers=ASGI_WSGI_THREADS)),
+    ],
+    lifespan=lifespan,
+)
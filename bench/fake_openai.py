@@ -0,0 +1,197 @@
+"""Local stand-in for the OpenAI Responses API.
+
+Answers POST /v1/responses (plain and stream=true) with a payload that
+matches whatever JSON schema the request asks for, after a latency drawn
+from a configurable distribution. Point the app at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+    python -m bench.fake_openai --port 8081 --latency lognormal --median 2.0 --sigma 0.5
+"""
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ARCHETYPES = ["Hot/Cold", "Avoidant-Leaning", "Anxious-Leaning", "Direct Communicator", "Unclear Pattern"]
+
+
+class Latency:
+    """fixed: always median; uniform: median +/- spread; lognormal: median * e^(sigma * N(0,1))."""
+
+    def __init__(self, dist: str = "lognormal", median: float = 1.5, sigma: float = 0.5, spread: float = 0.5):
+        self.dist = dist
+        self.median = median
+        self.sigma = sigma
+        self.spread = spread
+
+    def sample(self) -> float:
+        if self.dist == "fixed":
+            return self.median
+        if self.dist == "uniform":
+            return max(0.0, random.uniform(self.median - self.spread, self.median + self.spread))
+        return self.median * math.exp(self.sigma * random.gauss(0, 1))
+
+
+def fake_value(name: str, schema: dict, defs: dict):
+    """Generate a plausible value for one property of a ScanResult-style schema."""
+    if "$ref" in schema:
+        schema = defs[schema["$ref"].split("/")[-1]]
+    kind = schema.get("type")
+    if kind == "object":
+        return fake_object(schema, defs)
+    if kind == "array":
+        return [fake_value(name, schema["items"], defs) for _ in range(random.randint(1, 3))]
+    if kind == "integer":
+        return random.randint(1, 5) if name == "hidden_signals_count" else random.randint(0, 100)
+    if name == "archetype":
+        return random.choice(ARCHETYPES)
+    if name == "confidence":
+        return random.choice(["Low", "Medium", "High"])
+    if name == "reply_window":
+        return random.choice(["Likely 1-3 hours", "Likely 6-12 hours", "Likely 1-2 days"])
+    return f"Pattern likely suggests {name.replace('_', ' ')} (benchmark)."
+
+
+def fake_object(schema: dict, defs: dict) -> dict:
+    return {name: fake_value(name, prop, defs) for name, prop in schema.get("properties", {}).items()}
+
+
+def build_response(request: dict, text: str) -> dict:
+    input_tokens = sum(len(str(m.get("content", ""))) for m in request.get("input", [])) // 4
+    output_tokens = len(text) // 4
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": request.get("model", "gpt-4o-mini"),
+        "status": "completed",
+        "output": [{
+            "type": "message",
+            "id": f"msg_{uuid.uuid4().hex}",
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = Latency()
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/responses"):
+            return self._json(404, {"error": {"message": "not found"}})
+
+        delay = self.latency.sample()
+        if random.random() < self.error_rate:
+            time.sleep(delay / 2)
+            return self._json(500, {"error": {"message": "fake upstream error", "type": "server_error"}})
+
+        fmt = body.get("text", {}).get("format", {})
+        schema = fmt.get("schema", {})
+        text = json.dumps(fake_object(schema, schema.get("$defs", {})))
+        response = build_response(body, text)
+
+        if not body.get("stream"):
+            time.sleep(delay)
+            return self._json(200, response)
+        self._stream(response, text, delay)
+
+    def _json(self, status: int, data: dict):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, response: dict, text: str, delay: float):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        message = dict(response["output"][0], content=[], status="in_progress")
+        created = dict(response, status="in_progress", output=[], usage=None)
+        seq = iter(range(1_000_000))
+
+        def send(event: dict):
+            event["sequence_number"] = next(seq)
+            self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+
+        # A quarter of the latency is time-to-first-token; the rest is spread over the deltas.
+        time.sleep(delay / 4)
+        send({"type": "response.created", "response": created})
+        send({"type": "response.output_item.added", "output_index": 0, "item": message})
+        send({
+            "type": "response.content_part.added", "item_id": message["id"], "output_index": 0,
+            "content_index": 0, "part": {"type": "output_text", "text": "", "annotations": []},
+        })
+        chunks = [text[i:i + 16] for i in range(0, len(text), 16)]
+        for chunk in chunks:
+            time.sleep(delay * 0.75 / len(chunks))
+            send({
+                "type": "response.output_text.delta", "item_id": message["id"],
+                "output_index": 0, "content_index": 0, "delta": chunk,
+            })
+        send({
+            "type": "response.output_text.done", "item_id": message["id"],
+            "output_index": 0, "content_index": 0, "text": text,
+        })
+        send({"type": "response.completed", "response": response})
+
+
+def start(port: int = 0, latency: Latency = None, error_rate: float = 0.0):
+    """Start the fake server in a background thread; returns (server, base_url)."""
+    handler = type("Handler", (FakeOpenAIHandler,), {
+        "latency": latency or Latency(),
+        "error_rate": error_rate,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--median", type=float, default=1.5, help="median latency, seconds")
+    parser.add_argument("--sigma", type=float, default=0.5, help="lognormal shape")
+    parser.add_argument("--spread", type=float, default=0.5, help="uniform +/- seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, url = start(args.port, Latency(args.latency, args.median, args.sigma, args.spread), args.error_rate)
+    print(f"Fake OpenAI listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Signed Stripe webhook payloads, so /webhook/stripe can be driven offline.
+
+The app verifies signatures with stripe.Webhook.construct_event; run it with
+STRIPE_WEBHOOK_SECRET set to the same secret used here.
+"""
+import hmac
+import json
+import time
+import uuid
+import hashlib
+
+WEBHOOK_SECRET = "whsec_bench"
+
+
+def sign(payload: bytes, secret: str = WEBHOOK_SECRET, timestamp: int = None) -> str:
+    """Build a Stripe-Signature header for payload."""
+    timestamp = int(timestamp or time.time())
+    signed = f"{timestamp}.".encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def checkout_completed(user_id: str, plan: str = "monthly", session_id: str = None) -> bytes:
+    """A checkout.session.completed event for user_id, as raw JSON bytes."""
+    session_id = session_id or f"cs_test_{uuid.uuid4().hex}"
+    event = {
+        "id": f"evt_{uuid.uuid4().hex}",
+        "object": "event",
+        "api_version": "2024-06-20",
+        "created": int(time.time()),
+        "type": "checkout.session.completed",
+        "livemode": False,
+        "pending_webhooks": 1,
+        "request": {"id": None, "idempotency_key": None},
+        "data": {
+            "object": {
+                "id": session_id,
+                "object": "checkout.session",
+                "mode": "subscription",
+                "payment_status": "paid",
+                "status": "complete",
+                "metadata": {"user_id": str(user_id), "plan": plan},
+            }
+        },
+    }
+    return json.dumps(event).encode()
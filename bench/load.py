@@ -0,0 +1,356 @@
+"""Offline load test for the GhostRadar web app.
+
+Boots a throwaway Postgres (bench/pg_fixture.py), the fake OpenAI server
+(bench/fake_openai.py) and the app under gunicorn, then drives each endpoint
+in turn and reports latency percentiles, throughput, DB statements and
+transactions per request and Postgres connection counts as JSON.
+
+    python -m bench.load --workers 2 --concurrency 16 --requests 400 --out bench_output.json
+    python -m bench.load --baseline bench_output.json   # also print deltas against an earlier run
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import psycopg2
+
+from bench import fake_openai, fake_stripe
+from bench.pg_fixture import postgres, _free_port
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ["scan", "history", "event", "webhook"]
+REPEATED_MESSAGE = "hey"
+
+
+# ── scenarios: one request each, return the HTTP status ──
+
+def _request(conn, method, path, user, body=None, headers=None):
+    headers = dict(headers or {})
+    headers["Cookie"] = f"ghostradar_device_id={user['device_id']}"
+    if isinstance(body, dict):
+        body = json.dumps(body).encode()
+        headers["Content-Type"] = "application/json"
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def scan(conn, user, i, args):
+    text = REPEATED_MESSAGE if random.random() < args.cache_hit_ratio else f"bench message {uuid.uuid4().hex}"
+    return _request(conn, "POST", "/api/scan", user, {"message_text": text, "direction": "they"})
+
+
+def history(conn, user, i, args):
+    return _request(conn, "GET", "/api/history", user)
+
+
+def event(conn, user, i, args):
+    events = [{"event_name": "bench_event", "meta": {"i": i, "n": n}} for n in range(args.events_per_post)]
+    return _request(conn, "POST", "/api/event", user, {"events": events})
+
+
+def webhook(conn, user, i, args):
+    payload = fake_stripe.checkout_completed(user["id"])
+    headers = {"Stripe-Signature": fake_stripe.sign(payload), "Content-Type": "application/json"}
+    return _request(conn, "POST", "/webhook/stripe", user, payload, headers)
+
+
+SCENARIOS = {"scan": scan, "history": history, "event": event, "webhook": webhook}
+
+
+# ── Postgres-side counters ──
+
+class DBStats:
+    def __init__(self, url):
+        self.conn = psycopg2.connect(url)
+        self.conn.autocommit = True
+        with self.conn.cursor() as cur:
+            cur.execute("SHOW server_version_num")
+            self.has_sessions = int(cur.fetchone()[0]) >= 140000
+            try:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS pg_stat_statements")
+                cur.execute("SELECT 1 FROM pg_stat_statements LIMIT 1")
+                self.has_statements = True
+            except psycopg2.Error:
+                self.has_statements = False
+
+    def snapshot(self) -> dict:
+        # Backends report pg_stat_database counters with a short delay
+        time.sleep(1.1)
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT pg_stat_clear_snapshot()")
+            cur.execute(
+                f"""SELECT xact_commit + xact_rollback, {'sessions' if self.has_sessions else 'NULL'}
+                    FROM pg_stat_database WHERE datname = current_database()"""
+            )
+            xacts, sessions = cur.fetchone()
+            statements = None
+            if self.has_statements:
+                cur.execute(
+                    """SELECT COALESCE(SUM(calls), 0) FROM pg_stat_statements
+                       WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                         AND query NOT ILIKE '%pg_stat%'"""
+                )
+                statements = int(cur.fetchone()[0])
+        return {"xacts": xacts, "sessions": sessions, "statements": statements}
+
+    @contextmanager
+    def sample_backends(self, interval=0.1):
+        """Track the peak number of app connections while the block runs."""
+        peak = {"backends": 0, "queries": 0}
+        stop = threading.Event()
+        conn = psycopg2.connect(self.conn.dsn)
+        conn.autocommit = True
+
+        def run():
+            with conn.cursor() as cur:
+                while not stop.wait(interval):
+                    cur.execute(
+                        """SELECT COUNT(*) FROM pg_stat_activity
+                           WHERE datname = current_database() AND backend_type = 'client backend'
+                             AND pid NOT IN (pg_backend_pid(), %s)""",
+                        (self.conn.get_backend_pid(),),
+                    )
+                    peak["backends"] = max(peak["backends"], cur.fetchone()[0])
+                    peak["queries"] += 1
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            yield peak
+        finally:
+            stop.set()
+            thread.join()
+            conn.close()
+
+
+def _delta(after, before, key, requests):
+    if after[key] is None or before[key] is None:
+        return None
+    return round((after[key] - before[key]) / requests, 2)
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[k] * 1000, 2)
+
+
+def run_phase(name, host, port, users, args, db):
+    scenario = SCENARIOS[name]
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def worker():
+        conn = http.client.HTTPConnection(host, port, timeout=120)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            user = users[i % len(users)]
+            start = time.perf_counter()
+            try:
+                status = scenario(conn, user, i, args)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=120)
+                status = "error"
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[str(status)] += 1
+        conn.close()
+
+    before = db.snapshot()
+    with db.sample_backends() as peak:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        duration = time.perf_counter() - started
+    after = db.snapshot()
+    # The sampler's own autocommit queries are transactions too
+    after["xacts"] -= peak["queries"]
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "duration_s": round(duration, 3),
+        "requests_per_s": round(len(latencies) / duration, 2) if duration else None,
+        "latency_ms": {
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+            "max": _percentile(latencies, 100),
+        },
+        "status_counts": dict(statuses),
+        "db": {
+            "statements_per_request": _delta(after, before, "statements", len(latencies)),
+            "transactions_per_request": _delta(after, before, "xacts", len(latencies)),
+            # minus the sampler's own connection
+            "connections_opened": (after["sessions"] - before["sessions"] - 1) if after["sessions"] is not None else None,
+            "peak_connections": peak["backends"],
+        },
+    }
+
+
+# ── environment ──
+
+def migrate(db_url):
+    env = dict(os.environ, DATABASE_URL=db_url)
+    subprocess.run(
+        [sys.executable, "-c", "from services.migrations import migrate; migrate()"],
+        cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL,
+    )
+
+
+def seed_users(db_url, count):
+    """Unlocked users, so /api/scan exercises the full path instead of the paywall."""
+    conn = psycopg2.connect(db_url)
+    users = []
+    with conn.cursor() as cur:
+        for _ in range(count):
+            device_id = f"bench-{uuid.uuid4()}"
+            cur.execute(
+                """INSERT INTO users (device_id, plan, unlocked_until)
+                   VALUES (%s, 'monthly', NOW() + INTERVAL '30 days') RETURNING id""",
+                (device_id,),
+            )
+            users.append({"id": str(cur.fetchone()[0]), "device_id": device_id})
+    conn.commit()
+    conn.close()
+    return users
+
+
+@contextmanager
+def app_server(db_url, openai_url, workers, extra_env=None):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=db_url,
+        OPENAI_API_KEY="sk-bench",
+        OPENAI_BASE_URL=openai_url,
+        STRIPE_SECRET_KEY="sk_test_bench",
+        STRIPE_WEBHOOK_SECRET=fake_stripe.WEBHOOK_SECRET,
+        **(extra_env or {}),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:create_app()",
+         "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--timeout", "120"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+                conn.request("GET", "/")
+                conn.getresponse().read()
+                conn.close()
+                break
+            except OSError:
+                if proc.poll() is not None or time.time() > deadline:
+                    raise RuntimeError("App server failed to start.")
+                time.sleep(0.2)
+        yield "127.0.0.1", port
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: dict, current: dict):
+    """Print per-endpoint changes against an earlier report."""
+    for name, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        parts = []
+        for key in ("p50", "p95", "p99"):
+            old, new = before["latency_ms"][key], now["latency_ms"][key]
+            if old and new:
+                parts.append(f"{key} {old:.1f}->{new:.1f}ms ({(new - old) / old:+.0%})")
+        old, new = before["requests_per_s"], now["requests_per_s"]
+        if old and new:
+            parts.append(f"rps {old:.1f}->{new:.1f} ({(new - old) / old:+.0%})")
+        print(f"{name}: " + ", ".join(parts), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--events-per-post", type=int, default=5)
+    parser.add_argument("--cache-hit-ratio", type=float, default=0.0, help="share of scans reusing one message")
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--median", type=float, default=1.5, help="fake OpenAI median latency, seconds")
+    parser.add_argument("--sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake OpenAI 500 rate")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    endpoints = [e for e in args.endpoints.split(",") if e]
+    latency = fake_openai.Latency(args.latency, args.median, args.sigma)
+    fake_server, openai_url = fake_openai.start(latency=latency, error_rate=args.error_rate)
+
+    results = {}
+    with postgres() as db_url:
+        migrate(db_url)
+        users = seed_users(db_url, args.users)
+        db = DBStats(db_url)
+        with app_server(db_url, openai_url, args.workers) as (host, port):
+            for name in endpoints:
+                print(f"Running {name}…", file=sys.stderr)
+                results[name] = run_phase(name, host, port, users, args, db)
+    fake_server.shutdown()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "args": vars(args),
+            "pg_stat_statements": db.has_statements,
+        },
+        "endpoints": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
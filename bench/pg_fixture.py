@@ -0,0 +1,76 @@
+"""Throwaway local Postgres for benchmarks.
+
+Uses BENCH_DATABASE_URL if set; otherwise runs initdb + pg_ctl (from PATH or
+`pg_config --bindir`) in a temp directory on a free port, with
+pg_stat_statements preloaded when the extension is installed.
+"""
+import os
+import shutil
+import socket
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+import psycopg2
+
+
+def _bindir() -> str:
+    initdb = shutil.which("initdb")
+    if initdb:
+        return os.path.dirname(initdb)
+    try:
+        return subprocess.check_output(["pg_config", "--bindir"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        raise RuntimeError("Postgres binaries not found; install Postgres or set BENCH_DATABASE_URL.")
+
+
+def _has_pg_stat_statements(bindir: str) -> bool:
+    try:
+        libdir = subprocess.check_output([os.path.join(bindir, "pg_config"), "--pkglibdir"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return any(os.path.exists(os.path.join(libdir, f"pg_stat_statements{ext}")) for ext in (".so", ".dylib"))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def postgres():
+    """Yield a DATABASE_URL for an empty, migrated-later database."""
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if url:
+        yield url
+        return
+
+    bindir = _bindir()
+    datadir = tempfile.mkdtemp(prefix="ghostradar-bench-pg-")
+    port = _free_port()
+    options = f"-p {port} -k {datadir} -c listen_addresses=127.0.0.1 -c max_connections=300 -c fsync=off"
+    if _has_pg_stat_statements(bindir):
+        options += " -c shared_preload_libraries=pg_stat_statements"
+    try:
+        subprocess.run(
+            [os.path.join(bindir, "initdb"), "-D", datadir, "-U", "bench", "--auth=trust", "-E", "UTF8"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        subprocess.run(
+            [os.path.join(bindir, "pg_ctl"), "-D", datadir, "-o", options, "-w", "-l",
+             os.path.join(datadir, "postgres.log"), "start"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        admin = psycopg2.connect(host="127.0.0.1", port=port, user="bench", dbname="postgres")
+        admin.autocommit = True
+        with admin.cursor() as cur:
+            cur.execute("CREATE DATABASE ghostradar_bench")
+        admin.close()
+        yield f"postgresql://bench@127.0.0.1:{port}/ghostradar_bench"
+    finally:
+        subprocess.run(
+            [os.path.join(bindir, "pg_ctl"), "-D", datadir, "-m", "immediate", "stop"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        shutil.rmtree(datadir, ignore_errors=True)
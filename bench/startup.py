@@ -0,0 +1,208 @@
+"""Startup benchmark: import cost and per-worker memory, with and without preload.
+
+Measures how long a fresh interpreter takes to import the app and build it
+with create_app(), then boots gunicorn with GUNICORN_PRELOAD=1 and =0 and
+reports, for each, time until the first response, RSS and PSS per worker
+(PSS splits shared pages between the processes sharing them, so it shows
+what preloading saves) and how long the server takes to answer again after
+every worker is killed. Needs Linux (/proc); no Postgres or API keys -- the
+app opens no connections until a request needs one.
+
+    python -m bench.startup --workers 4 --out startup.json
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import statistics
+import subprocess
+import http.client
+from datetime import datetime, timezone
+
+from bench.pg_fixture import _free_port
+from bench.load import git_commit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import app
+app.create_app()
+print(time.perf_counter() - start)
+"""
+
+
+# ── import time ──
+
+def import_times(runs: int) -> dict:
+    env = dict(os.environ, MIGRATE_ON_START="0")
+    samples = [
+        float(subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env, text=True))
+        for _ in range(runs)
+    ]
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "min_ms": round(min(samples) * 1000, 1),
+        "slowest_modules": slowest_imports(),
+    }
+
+
+def slowest_imports(top: int = 10) -> list:
+    """The app's direct imports ranked by cumulative time (python -X importtime)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, env=dict(os.environ, MIGRATE_ON_START="0"), capture_output=True, text=True,
+    )
+    # Lines are "import time: self | cumulative | <2 spaces per level>name" and
+    # a module's line comes after those of everything it imported.
+    pending, totals = {}, {}
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[0].startswith("import time:") or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:]
+        level = (len(name) - len(name.lstrip())) // 2
+        if level == 1:
+            pending[name.strip()] = int(parts[1])
+        elif level == 0:
+            if name.strip() == "app":
+                totals = pending
+            pending = {}
+    ranked = sorted(totals.items(), key=lambda kv: -kv[1])[:top]
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for name, us in ranked]
+
+
+# ── gunicorn boot ──
+
+def _children(pid: int) -> list:
+    kids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # ppid is the 4th field, after "(comm)" which may contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            kids.append(int(entry))
+    return kids
+
+
+def _memory_kb(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key.lower()] = int(rest.split()[0])
+    return values
+
+
+def _wait_until_serving(port: int, proc, timeout: float = 60) -> float:
+    start = time.perf_counter()
+    while True:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            conn.close()
+            return time.perf_counter() - start
+        except OSError:
+            if proc.poll() is not None or time.perf_counter() - start > timeout:
+                raise RuntimeError("App server failed to start.")
+            time.sleep(0.02)
+
+
+def _wait_for_workers(master: int, workers: int, exclude=(), timeout: float = 60) -> list:
+    deadline = time.time() + timeout
+    while True:
+        pids = [p for p in _children(master) if p not in exclude]
+        if len(pids) >= workers:
+            return pids
+        if time.time() > deadline:
+            raise RuntimeError("Workers did not come up.")
+        time.sleep(0.02)
+
+
+def boot(preload: bool, workers: int) -> dict:
+    port = _free_port()
+    env = dict(
+        os.environ,
+        GUNICORN_PRELOAD="1" if preload else "0",
+        MIGRATE_ON_START="0",
+        PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp(prefix="ghostradar-bench-metrics-"),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:create_app()",
+         "--bind", f"127.0.0.1:{port}", "--workers", str(workers)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        first_response = _wait_until_serving(port, proc)
+        pids = _wait_for_workers(proc.pid, workers)
+        # Let every worker finish importing (without preload) before measuring
+        time.sleep(2)
+        for _ in range(workers * 4):
+            _wait_until_serving(port, proc)
+        memory = [_memory_kb(pid) for pid in pids]
+        master = _memory_kb(proc.pid)
+
+        start = time.perf_counter()
+        for pid in pids:
+            os.kill(pid, signal.SIGKILL)
+        _wait_for_workers(proc.pid, 1, exclude=pids)
+        recovery = time.perf_counter() - start + _wait_until_serving(port, proc)
+
+        return {
+            "first_response_s": round(first_response, 3),
+            "recovery_after_kill_s": round(recovery, 3),
+            "master_rss_mb": round(master["rss"] / 1024, 1),
+            "worker_rss_mb": round(statistics.mean(m["rss"] for m in memory) / 1024, 1),
+            "worker_pss_mb": round(statistics.mean(m["pss"] for m in memory) / 1024, 1),
+            "total_pss_mb": round((master["pss"] + sum(m["pss"] for m in memory)) / 1024, 1),
+        }
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--import-runs", type=int, default=5)
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    print("Timing imports…", file=sys.stderr)
+    imports = import_times(args.import_runs)
+    servers = {}
+    for preload in (True, False):
+        name = "preload" if preload else "no_preload"
+        print(f"Booting gunicorn ({name})…", file=sys.stderr)
+        servers[name] = boot(preload, args.workers)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "args": vars(args),
+        },
+        "import": imports,
+        "gunicorn": servers,
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
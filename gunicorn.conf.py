@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+
+# Import the app (Flask, openai, stripe, pydantic schemas, ...) once in the
+# master so workers fork with it already loaded and share those pages. The
+# app holds no sockets at import: DB pool and API clients are built lazily
+# per process. Set GUNICORN_PRELOAD=0 to import in each worker instead.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# Sync workers are killed after this many seconds on one request. AI calls
+# give up at AI_DEADLINE (services/resilience.py), which must stay below it.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+
+# Shared directory so /metrics aggregates every worker process.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "ghostradar-metrics"))
+
+
+def on_starting(server):
+    # Stale files from a previous run would be summed into the new totals.
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+    # Schema changes happen once here, in the master, before any worker boots.
+    if os.environ.get("MIGRATE_ON_START", "1") == "1":
+        from dotenv import load_dotenv
+        load_dotenv()
+        from services.migrations import migrate
+        migrate()
+
+
+def post_fork(server, worker):
+    # With preload_app every worker is a fork of the master. Sockets and
+    # threads don't carry over usefully: a shared Postgres or HTTP connection
+    # interleaves two processes' traffic, and the master's threads don't run
+    # in the child. So per-process state in services/ (DB pools, OpenAI and
+    # Stripe clients, the event flusher, the profile sampler) remembers the
+    # pid that built it and is rebuilt lazily when the pid changes. This
+    # just drops the DB pools eagerly, before the worker serves anything.
+    from services.db import reset_pool
+    reset_pool()
+
+
+def worker_exit(server, worker):
+    # Write out buffered analytics before the pool goes away.
+    from services.events import flush_events
+    from services.db import close_pool
+    from services import profiling
+    flush_events()
+    close_pool()
+    profiling.flush()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,9 @@
+-- Shared cache of AI analyses, keyed by normalized input + model + prompt version
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    cache_key TEXT PRIMARY KEY,
+    result JSONB NOT NULL,
+    hits INT DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_cache_created ON analysis_cache(created_at);
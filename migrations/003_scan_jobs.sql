@@ -0,0 +1,21 @@
+-- Background scan queue (claimed with FOR UPDATE SKIP LOCKED by worker.py)
+CREATE TABLE IF NOT EXISTS scan_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+    message_text TEXT NOT NULL,
+    direction TEXT DEFAULT 'they' CHECK (direction IN ('they','me')),
+    reserved BOOLEAN DEFAULT FALSE,
+    status TEXT DEFAULT 'queued' CHECK (status IN ('queued','running','done','failed')),
+    attempts INT DEFAULT 0,
+    max_attempts INT DEFAULT 3,
+    run_after TIMESTAMP DEFAULT NOW(),
+    locked_at TIMESTAMP,
+    scan_id UUID REFERENCES scans(id) ON DELETE SET NULL,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_queued ON scan_jobs(run_after) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_running ON scan_jobs(locked_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_user ON scan_jobs(user_id);
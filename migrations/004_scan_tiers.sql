@@ -0,0 +1,6 @@
+-- Tiered generation: locked users get a core analysis; hidden signals and
+-- replies are filled in later ("enriched") when the user unlocks.
+ALTER TABLE scans ADD COLUMN IF NOT EXISTS enriched BOOLEAN DEFAULT TRUE;
+
+ALTER TABLE scan_jobs ADD COLUMN IF NOT EXISTS kind TEXT DEFAULT 'scan';
+ALTER TABLE scan_jobs ADD COLUMN IF NOT EXISTS tier TEXT DEFAULT 'full';
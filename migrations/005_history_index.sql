@@ -0,0 +1,6 @@
+-- History is read newest-first per user and paged by a (created_at, id)
+-- cursor; this index serves each page as a short range scan.
+CREATE INDEX IF NOT EXISTS idx_scans_user_created ON scans(user_id, created_at DESC, id DESC);
+
+-- Superseded: user_id is the leading column of the index above.
+DROP INDEX IF EXISTS idx_scans_user;
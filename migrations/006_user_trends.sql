@@ -0,0 +1,19 @@
+-- Per-user trend aggregates, maintained by save_scan in the same transaction
+-- as the scan insert so /api/trends is a single-row read. Rebuild from scans
+-- with `flask backfill-trends`.
+CREATE TABLE IF NOT EXISTS user_trends (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    scan_count INT NOT NULL DEFAULT 0,
+    interest_score_sum BIGINT NOT NULL DEFAULT 0,
+    red_flag_risk_sum BIGINT NOT NULL DEFAULT 0,
+    emotional_distance_sum BIGINT NOT NULL DEFAULT 0,
+    ghost_probability_sum BIGINT NOT NULL DEFAULT 0,
+    interest_score_ewma DOUBLE PRECISION,
+    red_flag_risk_ewma DOUBLE PRECISION,
+    emotional_distance_ewma DOUBLE PRECISION,
+    ghost_probability_ewma DOUBLE PRECISION,
+    archetypes JSONB NOT NULL DEFAULT '{}',  -- archetype -> count
+    recent JSONB NOT NULL DEFAULT '[]',      -- last TREND_RECENT_SCANS scans, newest first
+    last_scan_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
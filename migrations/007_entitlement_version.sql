@@ -0,0 +1,3 @@
+-- Bumped by unlock_user; signed entitlement tokens carrying an older
+-- version are no longer honoured.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS entitlement_version INT NOT NULL DEFAULT 0;
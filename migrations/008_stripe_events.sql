@@ -0,0 +1,15 @@
+-- Raw Stripe webhook events, keyed by event id so retries and duplicates
+-- are dropped on insert. processed_at is set once the event is applied.
+CREATE TABLE IF NOT EXISTS stripe_events (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    stripe_created TIMESTAMP,
+    received_at TIMESTAMP DEFAULT NOW(),
+    processed_at TIMESTAMP,
+    attempts INT DEFAULT 0,
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_stripe_events_pending
+    ON stripe_events(stripe_created, received_at) WHERE processed_at IS NULL;
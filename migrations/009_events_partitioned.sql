@@ -0,0 +1,67 @@
+-- events becomes a monthly range-partitioned table. Old months are rolled up
+-- into events_daily and their partitions dropped by the event maintenance
+-- run (services/events.py), so inserts and funnel queries stay flat.
+
+CREATE OR REPLACE FUNCTION ensure_event_partitions(months_ahead INT DEFAULT 3, start_month DATE DEFAULT NULL)
+RETURNS INT LANGUAGE plpgsql AS $$
+DECLARE
+    m DATE := date_trunc('month', COALESCE(start_month, CURRENT_DATE))::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    part TEXT;
+    created INT := 0;
+BEGIN
+    WHILE m <= last_month LOOP
+        part := 'events_p' || to_char(m, 'YYYYMM');
+        IF to_regclass(part) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF events FOR VALUES FROM (%L) TO (%L)',
+                part, m, (m + INTERVAL '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+        m := (m + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END $$;
+
+-- One-time conversion of the original plain table (rows are copied over).
+DO $$
+DECLARE
+    first_month DATE;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('public.events') AND relkind = 'r') THEN
+        ALTER TABLE events RENAME TO events_unpartitioned;
+        ALTER TABLE events_unpartitioned RENAME CONSTRAINT events_pkey TO events_unpartitioned_pkey;
+        DROP INDEX IF EXISTS idx_events_user;
+
+        CREATE TABLE events (
+            id UUID NOT NULL DEFAULT gen_random_uuid(),
+            user_id UUID,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            event_name TEXT NOT NULL,
+            meta JSONB DEFAULT '{}',
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);
+
+        SELECT MIN(created_at)::date INTO first_month FROM events_unpartitioned;
+        PERFORM ensure_event_partitions(3, first_month);
+        INSERT INTO events (id, user_id, created_at, event_name, meta)
+            SELECT id, user_id, COALESCE(created_at, NOW()), event_name, meta FROM events_unpartitioned;
+        DROP TABLE events_unpartitioned;
+    END IF;
+END $$;
+
+SELECT ensure_event_partitions(3);
+
+CREATE INDEX IF NOT EXISTS idx_events_user ON events(user_id);
+CREATE INDEX IF NOT EXISTS idx_events_name_created ON events(event_name, created_at);
+-- Rows arrive in created_at order: a BRIN index keeps the rollup's range scans cheap
+CREATE INDEX IF NOT EXISTS idx_events_created_brin ON events USING brin (created_at);
+
+CREATE TABLE IF NOT EXISTS events_daily (
+    day DATE NOT NULL,
+    event_name TEXT NOT NULL,
+    events BIGINT NOT NULL,
+    users BIGINT NOT NULL,
+    PRIMARY KEY (day, event_name)
+);
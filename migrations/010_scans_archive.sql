@@ -0,0 +1,34 @@
+-- Old scans move here (services/archive.py). Only what history, share cards
+-- and trends read stays in columns. message_text, hidden_signals and replies
+-- go into one zlib-compressed JSON blob (detail) that is only read to show a
+-- single archived scan.
+CREATE TABLE IF NOT EXISTS scans_archive (
+    id UUID PRIMARY KEY,
+    user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+    created_at TIMESTAMP NOT NULL,
+    direction TEXT,
+    interest_score INT,
+    red_flag_risk INT,
+    emotional_distance INT,
+    ghost_probability INT,
+    reply_window TEXT,
+    confidence TEXT,
+    hidden_signals_count INT,
+    archetype TEXT,
+    summary TEXT,
+    enriched BOOLEAN,
+    detail BYTEA,
+    archived_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Same cursor order as idx_scans_user_created, for history pages past the cutoff.
+CREATE INDEX IF NOT EXISTS idx_scans_archive_user_created ON scans_archive(user_id, created_at DESC, id DESC);
+
+-- Archive batches take the oldest rows in (created_at, id) order; this lets
+-- each batch stop after batch_size index entries instead of sorting every
+-- row past the cutoff.
+CREATE INDEX IF NOT EXISTS idx_scans_created ON scans(created_at, id);
+
+-- Deleting a scan sets scan_jobs.scan_id to NULL; without this index every
+-- deleted row scans scan_jobs.
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_scan ON scan_jobs(scan_id) WHERE scan_id IS NOT NULL;
@@ -0,0 +1,6 @@
+-- When entitlement_version last changed. Every process polls for recent
+-- bumps (services/auth.py) so an unlock applied anywhere revokes older
+-- signed tokens everywhere within ENTITLEMENT_REFRESH seconds.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS entitlement_bumped_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_users_entitlement_bumped
+    ON users(entitlement_bumped_at) WHERE entitlement_bumped_at IS NOT NULL;
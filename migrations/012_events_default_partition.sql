@@ -0,0 +1,44 @@
+-- Catch-all partition: with event maintenance off (or behind), events past
+-- the last monthly partition land here instead of failing to insert.
+CREATE TABLE IF NOT EXISTS events_default PARTITION OF events DEFAULT;
+
+-- A month can't be created as a partition while events_default holds rows
+-- for it, so such rows are moved into the new partition before it is
+-- attached.
+CREATE OR REPLACE FUNCTION ensure_event_partitions(months_ahead INT DEFAULT 3, start_month DATE DEFAULT NULL)
+RETURNS INT LANGUAGE plpgsql AS $$
+DECLARE
+    m DATE := date_trunc('month', COALESCE(start_month, CURRENT_DATE))::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    next_month DATE;
+    part TEXT;
+    created INT := 0;
+BEGIN
+    WHILE m <= last_month LOOP
+        part := 'events_p' || to_char(m, 'YYYYMM');
+        next_month := (m + INTERVAL '1 month')::date;
+        IF to_regclass(part) IS NULL THEN
+            IF to_regclass('events_default') IS NOT NULL
+               AND EXISTS (SELECT 1 FROM events_default WHERE created_at >= m AND created_at < next_month) THEN
+                EXECUTE format('CREATE TABLE %I (LIKE events INCLUDING DEFAULTS)', part);
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM events_default WHERE created_at >= %L AND created_at < %L RETURNING *)
+                     INSERT INTO %I SELECT * FROM moved',
+                    m, next_month, part
+                );
+                EXECUTE format(
+                    'ALTER TABLE events ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    part, m, next_month
+                );
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF events FOR VALUES FROM (%L) TO (%L)',
+                    part, m, next_month
+                );
+            END IF;
+            created := created + 1;
+        END IF;
+        m := next_month;
+    END LOOP;
+    RETURN created;
+END $$;
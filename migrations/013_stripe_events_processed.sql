@@ -0,0 +1,4 @@
+-- Lets the worker purge applied webhook events by age (see
+-- purge_stripe_events) without scanning the table.
+CREATE INDEX IF NOT EXISTS idx_stripe_events_processed
+    ON stripe_events(processed_at) WHERE processed_at IS NOT NULL;
@@ -0,0 +1,9 @@
+-- Archiving a scan deletes it from scans, and ON DELETE SET NULL then lost
+-- the job's scan_id, so a finished job could no longer find its (archived)
+-- scan. Scans are only deleted by archiving or with their user, whose jobs
+-- cascade, so the reference is kept without a foreign key.
+ALTER TABLE scan_jobs DROP CONSTRAINT IF EXISTS scan_jobs_scan_id_fkey;
+
+-- Finished jobs are purged by age during maintenance (purge_scan_jobs).
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_finished
+    ON scan_jobs(finished_at) WHERE status IN ('done', 'failed');
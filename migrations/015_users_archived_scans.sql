@@ -0,0 +1,6 @@
+-- Set by archive_scan_batch once any of a user's scans is archived; history
+-- pages that run out of live scans only query scans_archive when it is set.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS has_archived_scans BOOLEAN DEFAULT FALSE;
+
+UPDATE users u SET has_archived_scans = TRUE
+WHERE NOT u.has_archived_scans AND EXISTS (SELECT 1 FROM scans_archive a WHERE a.user_id = u.id);
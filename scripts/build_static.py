@@ -0,0 +1,132 @@
+"""Build fingerprinted, precompressed copies of the static assets.
+
+Minifies each asset, names the result after a hash of its content
+(app.js -> dist/app.3f9a1c2b7d.js), writes .gz and .br variants next to it
+and records the mapping in static/dist/manifest.json. Templates reference
+assets through asset_url() (services/assets.py), which reads that manifest,
+and /static/dist/ serves the files with Cache-Control: immutable. Run it on
+every deploy, after installing requirements:
+
+    python -m scripts.build_static
+"""
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+
+import brotli
+
+from services.assets import STATIC_DIR, DIST_DIR, MANIFEST_PATH
+
+ASSETS = ("styles.css", "app.js", "share.js")
+
+
+# ── minifiers ─────────────────────────────────────────────
+#
+# Deliberately conservative: nothing that needs a real parser. Compression
+# does most of the work; these only drop what gzip/brotli can't (comments,
+# indentation).
+
+# Quoted strings and url(...) are copied verbatim; comments are dropped.
+_CSS_LITERAL = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|url\([^)]*\))|/\*.*?\*/""", re.S | re.I)
+
+
+def _squeeze_css(css: str) -> str:
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}")
+
+
+def minify_css(source: str) -> str:
+    parts = []
+    code = []
+    pos = 0
+    for m in _CSS_LITERAL.finditer(source):
+        code.append(source[pos:m.start()])
+        pos = m.end()
+        if m.group(1) is None:
+            code.append(" ")
+            continue
+        parts.append(_squeeze_css("".join(code)))
+        parts.append(m.group(1))
+        code = []
+    code.append(source[pos:])
+    parts.append(_squeeze_css("".join(code)))
+    return "".join(parts).strip() + "\n"
+
+
+def minify_js(source: str) -> str:
+    # Line-based so automatic semicolon insertion is never affected: strip
+    # indentation, blank lines and comments that start a line. Code after a
+    # closing */ on the same line is kept.
+    lines = []
+    in_comment = False
+    for line in source.splitlines():
+        line = line.strip()
+        if in_comment:
+            if "*/" not in line:
+                continue
+            line = line.split("*/", 1)[1].strip()
+            in_comment = False
+        while line.startswith("/*"):
+            end = line.find("*/", 2)
+            if end == -1:
+                in_comment = True
+                line = ""
+                break
+            line = line[end + 2:].strip()
+        if not line or line.startswith("//"):
+            continue
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+# ── build ─────────────────────────────────────────────────
+
+def build(names=ASSETS) -> dict:
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.makedirs(DIST_DIR)
+    manifest = {}
+    for name in names:
+        with open(os.path.join(STATIC_DIR, name), encoding="utf-8") as f:
+            source = f.read()
+        base, ext = os.path.splitext(name)
+        data = MINIFIERS.get(ext, lambda s: s)(source).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        hashed = f"{base}.{digest}{ext}"
+        path = os.path.join(DIST_DIR, hashed)
+        with open(path, "wb") as f:
+            f.write(data)
+        # mtime=0 keeps the .gz byte-identical across builds
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+        manifest[name] = f"dist/{hashed}"
+        print(
+            f"{name}: {len(source.encode('utf-8'))} -> {len(data)} bytes, "
+            f"gzip {os.path.getsize(path + '.gz')}, br {os.path.getsize(path + '.br')}  ({manifest[name]})"
+        )
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("assets", nargs="*", default=list(ASSETS), help="files under static/")
+    args = parser.parse_args()
+    build(args.assets)
+    print(f"Wrote {MANIFEST_PATH}")
+
+
+if __name__ == "__main__":
+    main()
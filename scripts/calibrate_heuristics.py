@@ -0,0 +1,152 @@
+"""Fit services/heuristics.py's weights against historical scans.
+
+Reads (message_text, direction, scores, archetype) from the scans table,
+fits one ridge regression per score on the heuristic feature vector and the
+mean scores per archetype, reports mean absolute error on a held-out fifth
+before and after, and writes the weights file the scorer loads at import.
+
+    python -m scripts.calibrate_heuristics --limit 50000 --out services/heuristic_weights.json
+"""
+import sys
+import json
+import hashlib
+import argparse
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services import heuristics
+from services.db import get_conn
+
+ROWS_SQL = """SELECT id, message_text, direction, interest_score, red_flag_risk,
+                     emotional_distance, ghost_probability, archetype
+              FROM scans
+              WHERE message_text <> '' AND interest_score IS NOT NULL
+              ORDER BY created_at DESC
+              LIMIT %s"""
+
+
+def load_rows(limit: int) -> list:
+    with get_conn(request_scoped=False) as conn:
+        with conn.cursor() as cur:
+            cur.execute(ROWS_SQL, (limit,))
+            rows = [dict(r) for r in cur.fetchall()]
+        conn.rollback()
+    return rows
+
+
+def _holdout(row) -> bool:
+    # Stable split: the same scan always lands on the same side
+    return hashlib.sha256(str(row["id"]).encode()).digest()[0] < 52
+
+
+# ── ridge regression (normal equations, no numpy) ─────────
+
+def _solve(a: list, b: list) -> list:
+    """Gaussian elimination with partial pivoting; a is square."""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        m[col], m[pivot] = m[pivot], m[col]
+        if abs(m[col][col]) < 1e-12:
+            continue
+        for r in range(n):
+            if r != col and m[r][col]:
+                f = m[r][col] / m[col][col]
+                m[r] = [x - f * y for x, y in zip(m[r], m[col])]
+    return [m[i][n] / m[i][i] if abs(m[i][i]) >= 1e-12 else 0.0 for i in range(n)]
+
+
+def fit(xs: list, ys: list, ridge: float) -> tuple[float, list]:
+    """Least squares with an unpenalized bias; returns (bias, coefficients)."""
+    k = len(xs[0]) + 1
+    xtx = [[0.0] * k for _ in range(k)]
+    xty = [0.0] * k
+    for x, y in zip(xs, ys):
+        row = [1.0] + x
+        for i in range(k):
+            xty[i] += row[i] * y
+            ri = row[i]
+            if ri:
+                xtx_i = xtx[i]
+                for j in range(k):
+                    xtx_i[j] += ri * row[j]
+    for i in range(1, k):
+        xtx[i][i] += ridge
+    w = _solve(xtx, xty)
+    return w[0], w[1:]
+
+
+def mae(model: dict, xs: list, rows: list) -> dict:
+    errors = {s: 0.0 for s in heuristics.SCORES}
+    hits = 0
+    for x, row in zip(xs, rows):
+        predicted = heuristics.predict(x, model)
+        for s in heuristics.SCORES:
+            errors[s] += abs(predicted[s] - (row[s] or 0))
+        hits += heuristics.archetype_for(predicted, model) == row["archetype"]
+    n = len(rows) or 1
+    return {**{s: round(e / n, 2) for s, e in errors.items()}, "archetype_accuracy": round(hits / n, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--limit", type=int, default=50000, help="newest scans to fit on")
+    parser.add_argument("--ridge", type=float, default=1.0, help="L2 penalty on the coefficients")
+    parser.add_argument("--min-rows", type=int, default=200)
+    parser.add_argument("--out", default=heuristics.HEURISTIC_WEIGHTS)
+    args = parser.parse_args()
+
+    rows = load_rows(args.limit)
+    if len(rows) < args.min_rows:
+        sys.exit(f"Only {len(rows)} scans; need at least {args.min_rows} to calibrate.")
+    xs = [heuristics.features(r["message_text"], r["direction"]) for r in rows]
+    train = [(x, r) for x, r in zip(xs, rows) if not _holdout(r)]
+    test = [(x, r) for x, r in zip(xs, rows) if _holdout(r)]
+    train_x, train_rows = [x for x, _ in train], [r for _, r in train]
+    test_x, test_rows = [x for x, _ in test], [r for _, r in test]
+
+    scores = {}
+    for s in heuristics.SCORES:
+        bias, coefs = fit(train_x, [r[s] or 0 for r in train_rows], args.ridge)
+        scores[s] = [round(bias, 4), [round(c, 4) for c in coefs]]
+
+    archetypes = {}
+    for name in heuristics.ARCHETYPES:
+        members = [r for r in train_rows if r["archetype"] == name]
+        if members:
+            archetypes[name] = [
+                round(sum(r[k] or 0 for r in members) / len(members), 1)
+                for k in ("interest_score", "emotional_distance", "ghost_probability")
+            ]
+        else:
+            archetypes[name] = heuristics.DEFAULT_WEIGHTS["archetypes"][name]
+
+    weights = {
+        "features": list(heuristics.FEATURES),
+        "scores": scores,
+        "archetypes": archetypes,
+        "meta": {
+            "fitted_at": datetime.now(timezone.utc).isoformat(),
+            "rows": len(rows),
+            "ridge": args.ridge,
+        },
+    }
+    report = {
+        "train_rows": len(train_rows),
+        "holdout_rows": len(test_rows),
+        "holdout_mae_before": mae(heuristics.load_weights(args.out), test_x, test_rows),
+        "holdout_mae_after": mae(heuristics._compile(weights), test_x, test_rows),
+    }
+    with open(args.out, "w") as f:
+        json.dump(weights, f, indent=2)
+        f.write("\n")
+    print(json.dumps(report, indent=2))
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
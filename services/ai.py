@@ -1,9 +1,56 @@
 import os
 import json
-from openai import OpenAI
+import threading
+from openai import OpenAI, AsyncOpenAI
 from pydantic import BaseModel
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+from services import cache, resilience, metrics
+
+OPENAI_TIMEOUT = resilience.OPENAI_TIMEOUT
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_async_client = None
+_async_client_pid = None
+
+
+def get_client() -> OpenAI:
+    """The process's OpenAI client, built on first use (and per forked
+    worker, see gunicorn.conf.py)."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                # Retries are handled by services/resilience.py, not the SDK.
+                _client = OpenAI(
+                    api_key=os.environ.get("OPENAI_API_KEY"),
+                    timeout=OPENAI_TIMEOUT,
+                    max_retries=0,
+                )
+                _client_pid = pid
+    return _client
+
+
+def get_async_client() -> AsyncOpenAI:
+    """get_client() for asgi.py. Only ever used from the worker's event loop."""
+    global _async_client, _async_client_pid
+    pid = os.getpid()
+    if _async_client is None or _async_client_pid != pid:
+        _async_client = AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            timeout=OPENAI_TIMEOUT,
+            max_retries=0,
+        )
+        _async_client_pid = pid
+    return _async_client
+
+
+MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
+# Bump whenever SYSTEM_PROMPT, the user prompt or the schema changes; it is
+# part of the analysis cache key.
+PROMPT_VERSION = "3"
 
 # ── Pydantic schema for structured output ─────────────────
 
@@ -16,20 +63,53 @@ class Replies(BaseModel):
     playful: str
     direct: str
 
-class ScanResult(BaseModel):
+# Field order is the order the model emits them in; the always-visible fields
+# come first so streaming clients can render them before the rest arrives.
+class ScanCore(BaseModel):
     interest_score: int
     red_flag_risk: int
     emotional_distance: int
     ghost_probability: int
+    archetype: str
+    summary: str
     reply_window: str
     confidence: str
     hidden_signals_count: int
+
+# The paid fields: the longest, most token-heavy part of a scan. Locked users
+# only get ScanCore; these are generated on unlock by enrich_analysis.
+class ScanEnrichment(BaseModel):
+    hidden_signals: list[HiddenSignal]
+    replies: Replies
+
+class ScanResult(ScanCore):
     hidden_signals: list[HiddenSignal]
-    archetype: str
-    summary: str
     replies: Replies
 
 
+TIERS = {"full": ScanResult, "core": ScanCore}
+
+# A whole conversation in one call: one result per message, in order.
+class ThreadCore(BaseModel):
+    results: list[ScanCore]
+    thread_summary: str
+
+class ThreadResult(BaseModel):
+    results: list[ScanResult]
+    thread_summary: str
+
+
+THREAD_TIERS = {"full": ThreadResult, "core": ThreadCore}
+
+# Rough output sizes, for the TPM budget before real usage is known
+_OUTPUT_TOKENS = {"full": 700, "core": 200, "enrich": 550}
+
+_TIER_TASKS = {
+    "full": "Detect hidden communication patterns, estimate ghost probability, and generate reply suggestions.",
+    "core": "Estimate ghost probability and count the hidden communication patterns you detect.",
+}
+
+
 SYSTEM_PROMPT = """You are GhostRadar, an AI that analyzes text messages for social/romantic signals.
 
 RULES:
@@ -47,8 +127,7 @@ RULES:
 - Each reply option should be a suggested response message (1-2 sentences)."""
 
 
-def analyze_message(message_text: str, direction: str = "they") -> dict:
-    """Call OpenAI Responses API with structured output to analyze a message."""
+def _build_input(message_text: str, direction: str, tier: str = "full") -> list:
     direction_label = "sent by someone to the user" if direction == "they" else "sent by the user to someone"
 
     user_prompt = f"""Analyze this message that was {direction_label}:
@@ -56,19 +135,258 @@ def analyze_message(message_text: str, direction: str = "they") -> dict:
 \"\"\"{message_text}\"\"\"
 
 Provide dramatic but probabilistic signal analysis. Be engaging and slightly suspenseful in the summary.
-Detect hidden communication patterns, estimate ghost probability, and generate reply suggestions."""
+{_TIER_TASKS[tier]}"""
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _build_thread_input(messages: list, tier: str = "full") -> list:
+    parts = []
+    for i, m in enumerate(messages, 1):
+        direction_label = "sent by someone to the user" if m["direction"] == "they" else "sent by the user to someone"
+        parts.append(f"Message {i} ({direction_label}):\n\"\"\"{m['message_text']}\"\"\"")
+    messages_text = "\n\n".join(parts)
+
+    user_prompt = f"""Analyze this conversation thread of {len(messages)} messages, oldest first:
+
+{messages_text}
+
+Return exactly {len(messages)} results, one per message and in the same order, each analyzing that
+message in the context of the thread. {_TIER_TASKS[tier]}
+Then give a thread_summary: 1-2 dramatic sentences on where the conversation as a whole is heading."""
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _estimate_tokens(messages: list, kind: str) -> int:
+    return sum(len(m["content"]) for m in messages) // 4 + _OUTPUT_TOKENS[kind]
+
+
+def _cache_key(message_text: str, direction: str, tier: str) -> str:
+    return cache.cache_key(message_text, direction, MODEL, f"{PROMPT_VERSION}:{tier}")
+
+
+def analyze_message(message_text: str, direction: str = "they", use_cache: bool = True, tier: str = "full") -> dict:
+    """Call OpenAI Responses API with structured output to analyze a message.
+
+    tier="core" skips hidden signals and replies (see enrich_analysis).
+    Identical (normalized) messages are served from the analysis cache without
+    calling the model; pass use_cache=False to force a fresh analysis.
+    """
+    key = _cache_key(message_text, direction, tier)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    messages = _build_input(message_text, direction, tier)
+    with metrics.timer("ai", tier):
+        response = resilience.call(
+            lambda: get_client().responses.parse(model=MODEL, input=messages, text_format=TIERS[tier]),
+            _estimate_tokens(messages, tier),
+        )
+    metrics.record_ai_usage(tier, response.usage)
+
+    result = response.output_parsed
+    if result is None:
+        raise ValueError("AI refused to analyze this message.")
+
+    data = result.model_dump()
+    cache.put(key, data)
+    return data
+
+
+async def analyze_message_async(message_text: str, direction: str = "they", use_cache: bool = True,
+                                tier: str = "full") -> dict:
+    """analyze_message on AsyncOpenAI and the async cache tier, for asgi.py."""
+    key = _cache_key(message_text, direction, tier)
+    if use_cache:
+        cached = await cache.get_async(key)
+        if cached is not None:
+            return cached
+
+    messages = _build_input(message_text, direction, tier)
+    with metrics.timer("ai", tier):
+        response = await resilience.call_async(
+            lambda: get_async_client().responses.parse(model=MODEL, input=messages, text_format=TIERS[tier]),
+            _estimate_tokens(messages, tier),
+        )
+    metrics.record_ai_usage(tier, response.usage)
+
+    result = response.output_parsed
+    if result is None:
+        raise ValueError("AI refused to analyze this message.")
+
+    data = result.model_dump()
+    await cache.put_async(key, data)
+    return data
+
+
+def analyze_thread(messages: list, use_cache: bool = True, tier: str = "full") -> dict:
+    """Analyze an ordered list of {message_text, direction} in one model call.
+
+    The system prompt and the round trip are paid once for the thread.
+    Returns {"results": [one analysis per message], "thread_summary": str}.
+    """
+    thread = json.dumps([[m["direction"], cache.normalize_message(m["message_text"])] for m in messages])
+    key = _cache_key(thread, "thread", tier)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    prompt = _build_thread_input(messages, tier)
+    estimated = sum(len(m["content"]) for m in prompt) // 4 + _OUTPUT_TOKENS[tier] * len(messages)
+    with metrics.timer("ai", f"thread_{tier}"):
+        response = resilience.call(
+            lambda: get_client().responses.parse(model=MODEL, input=prompt, text_format=THREAD_TIERS[tier]),
+            estimated,
+        )
+    metrics.record_ai_usage(f"thread_{tier}", response.usage)
+
+    result = response.output_parsed
+    if result is None:
+        raise ValueError("AI refused to analyze this thread.")
+    if len(result.results) != len(messages):
+        raise ValueError(f"AI returned {len(result.results)} results for {len(messages)} messages.")
+
+    data = result.model_dump()
+    cache.put(key, data)
+    return data
 
-    response = client.responses.parse(
-        model="gpt-4o-mini",
-        input=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
-        text_format=ScanResult,
-    )
+
+def enrich_analysis(message_text: str, direction: str, core: dict, use_cache: bool = True) -> dict:
+    """Generate the paid fields (hidden_signals, replies) for a core analysis."""
+    count = core.get("hidden_signals_count") or 1
+    key = _cache_key(message_text, direction, f"enrich:{count}")
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    earlier = {k: core.get(k) for k in ScanCore.model_fields}
+    messages = _build_input(message_text, direction, "core")
+    messages.append({
+        "role": "user",
+        "content": f"""Your earlier analysis of this message was:
+{json.dumps(earlier)}
+
+Stay consistent with it. Describe exactly {count} hidden signals and generate reply suggestions.""",
+    })
+
+    with metrics.timer("ai", "enrich"):
+        response = resilience.call(
+            lambda: get_client().responses.parse(model=MODEL, input=messages, text_format=ScanEnrichment),
+            _estimate_tokens(messages, "enrich"),
+        )
+    metrics.record_ai_usage("enrich", response.usage)
+
+    result = response.output_parsed
+    if result is None:
+        raise ValueError("AI refused to analyze this message.")
+
+    data = result.model_dump()
+    cache.put(key, data)
+    return data
+
+
+def analyze_message_stream(message_text: str, direction: str = "they", use_cache: bool = True, tier: str = "full"):
+    """Streaming variant of analyze_message.
+
+    Yields ("field", name, value) for each top-level field as soon as the
+    model has finished emitting it, then ("result", None, data) with the
+    complete, validated result.
+    """
+    key = _cache_key(message_text, direction, tier)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            for name, value in cached.items():
+                yield "field", name, value
+            yield "result", None, cached
+            return
+
+    buf = ""
+    pos = 0
+    messages = _build_input(message_text, direction, tier)
+    # No retries once fields have gone out; admission control still applies.
+    try:
+        with (
+            metrics.timer("ai", f"stream_{tier}"),
+            resilience.guard(_estimate_tokens(messages, tier)) as usage,
+            get_client().responses.stream(model=MODEL, input=messages, text_format=TIERS[tier]) as stream,
+        ):
+            for event in stream:
+                if event.type != "response.output_text.delta":
+                    continue
+                buf += event.delta
+                fields, pos = _complete_fields(buf, pos)
+                for name, value in fields.items():
+                    yield "field", name, value
+            response = stream.get_final_response()
+            if response.usage:
+                usage["tokens"] = response.usage.total_tokens
+            metrics.record_ai_usage(f"stream_{tier}", response.usage)
+    except Exception as e:
+        if resilience.is_transient(e):
+            raise resilience.AIUnavailable(f"AI request failed: {e}") from e
+        raise
 
     result = response.output_parsed
     if result is None:
         raise ValueError("AI refused to analyze this message.")
 
-    return result.model_dump()
+    data = result.model_dump()
+    cache.put(key, data)
+    yield "result", None, data
+
+
+_decoder = json.JSONDecoder()
+
+
+def _complete_fields(buf: str, start: int = 0) -> tuple[dict, int]:
+    """Parse the top-level fields completed in a partial JSON object since start.
+
+    Returns the new fields and the offset to resume from on the next call, so
+    each delta only re-parses the field still in progress.
+    """
+    fields = {}
+    n = len(buf)
+    i = _skip_ws(buf, start)
+    if start == 0:
+        if i >= n or buf[i] != "{":
+            return fields, 0
+        i += 1
+    resume = i
+    while True:
+        i = _skip_ws(buf, i)
+        if i >= n or buf[i] == "}":
+            return fields, resume
+        try:
+            name, i = _decoder.raw_decode(buf, i)
+            i = _skip_ws(buf, i)
+            if i >= n or buf[i] != ":":
+                return fields, resume
+            value, i = _decoder.raw_decode(buf, _skip_ws(buf, i + 1))
+        except ValueError:
+            return fields, resume
+        # A number at the very end of the buffer may still be growing ("4" -> "42")
+        i = _skip_ws(buf, i)
+        if i >= n or buf[i] not in ",}":
+            return fields, resume
+        fields[name] = value
+        if buf[i] == ",":
+            i += 1
+        resume = i
+
+
+def _skip_ws(buf: str, i: int) -> int:
+    while i < len(buf) and buf[i] in " \t\r\n":
+        i += 1
+    return i
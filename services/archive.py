@@ -0,0 +1,60 @@
+import os
+import time
+
+from services.db import archive_scan_batch, scan_storage, vacuum_scans
+
+# Scans older than this move to scans_archive (migrations/010); 0 = never.
+SCAN_ARCHIVE_AFTER_DAYS = int(os.environ.get("SCAN_ARCHIVE_AFTER_DAYS", "180"))
+SCAN_ARCHIVE_BATCH_SIZE = int(os.environ.get("SCAN_ARCHIVE_BATCH_SIZE", "500"))
+# Seconds between batches, so replication and autovacuum keep up.
+SCAN_ARCHIVE_PAUSE = float(os.environ.get("SCAN_ARCHIVE_PAUSE", "0.2"))
+
+
+# ── scan archive ──────────────────────────────────────────
+#
+# Moves old scans out of the hot table a batch at a time. Each batch is its
+# own short transaction that locks only the rows it moves, so scans keeps
+# taking inserts and history reads throughout; get_history, get_scan and
+# get_scan_card read through to the archive. Deleted rows' space is reused
+# by new scans once (auto)vacuum has seen them; returning it to the OS
+# needs VACUUM FULL or pg_repack in a maintenance window.
+
+def run_scan_archive(older_than_days: int = None, batch_size: int = None,
+                     max_batches: int = None, vacuum: bool = False) -> dict:
+    older_than_days = SCAN_ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or SCAN_ARCHIVE_BATCH_SIZE
+    report = {"batches": 0, "moved": 0, "raw_bytes": 0, "archived_bytes": 0}
+    if older_than_days <= 0:
+        return report
+
+    before = scan_storage()
+    while max_batches is None or report["batches"] < max_batches:
+        batch = archive_scan_batch(older_than_days, batch_size)
+        if not batch["moved"]:
+            break
+        report["batches"] += 1
+        for key in ("moved", "raw_bytes", "archived_bytes"):
+            report[key] += batch[key]
+        if batch["moved"] < batch_size:
+            break
+        time.sleep(SCAN_ARCHIVE_PAUSE)
+
+    if vacuum and report["moved"]:
+        vacuum_scans()
+    after = scan_storage()
+    report.update(
+        scans_bytes_before=before["scans_bytes"],
+        scans_bytes_after=after["scans_bytes"],
+        archive_bytes=after["archive_bytes"],
+        archive_rows=after["archive_rows"],
+        # Row bytes moved out of scans minus what the archive rows take up.
+        # Can be negative for small rows (the archive row has its own
+        # header and a zlib blob), so it is reported as-is.
+        row_bytes_saved=report["raw_bytes"] - report["archived_bytes"],
+    )
+    print(
+        f"scan archive: moved={report['moved']} in {report['batches']} batches, "
+        f"rows {report['raw_bytes']} -> {report['archived_bytes']} bytes, "
+        f"scans table {before['scans_bytes']} -> {after['scans_bytes']} bytes"
+    )
+    return report
@@ -0,0 +1,63 @@
+import os
+import json
+import mimetypes
+
+from werkzeug.security import safe_join
+
+STATIC_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "static"))
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.environ.get("STATIC_MANIFEST", os.path.join(DIST_DIR, "manifest.json"))
+
+# Hashed file names change with their content, so browsers and CDNs may keep them forever.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Accept-Encoding token -> suffix of the precompressed file, best first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest = None
+
+
+# ── fingerprinted static assets ───────────────────────────
+#
+# scripts/build_static.py writes minified, content-hashed copies of the
+# static files to static/dist/ with .gz and .br variants, plus a manifest of
+# original name -> hashed path. asset_url() resolves template references
+# through it; without a build (local development) it falls back to the raw
+# /static/ file.
+
+def manifest() -> dict:
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH) as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            _manifest = {}
+    return _manifest
+
+
+def asset_url(name: str) -> str:
+    return f"/static/{manifest().get(name, name)}"
+
+
+def precompressed(filename: str, accept_encoding) -> tuple[str | None, str | None]:
+    """(path, content encoding) of the best variant of a dist file the
+    client accepts, or (None, None) if there is no such file.
+    accept_encoding is werkzeug's request.accept_encodings.
+
+    Only the hashed names listed in the manifest are served, so everything
+    /static/dist/ returns is safe to cache as immutable; manifest.json and
+    the .gz/.br files themselves are not reachable directly."""
+    if f"dist/{filename}" not in manifest().values():
+        return None, None
+    path = safe_join(DIST_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        return None, None
+    for encoding, suffix in ENCODINGS:
+        if accept_encoding[encoding] and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+def mimetype(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
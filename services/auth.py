@@ -1,9 +1,30 @@
+import os
+import time
 import uuid
+import threading
+from datetime import datetime
 from flask import request, make_response
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+from services.db import entitlement_bumps
 
 COOKIE_NAME = "ghostradar_device_id"
 COOKIE_MAX_AGE = 365 * 24 * 60 * 60  # 1 year
 
+ENTITLEMENT_COOKIE = "ghostradar_entitlement"
+# How long a signed entitlement is trusted before it is re-read from Postgres.
+ENTITLEMENT_TTL = int(os.environ.get("ENTITLEMENT_TTL", "300"))
+
+# How often each process re-reads recent entitlement_version bumps; bounds
+# how late an unlock from another process (e.g. a webhook) shows up.
+ENTITLEMENT_REFRESH = float(os.environ.get("ENTITLEMENT_REFRESH", "5"))
+
+_serializer = URLSafeTimedSerializer(os.environ.get("FLASK_SECRET_KEY", "dev-secret-key"), salt="entitlement")
+# user_id -> lowest entitlement_version still honoured in this process
+_version_floor = {}
+_floor_lock = threading.Lock()
+_floor_refreshed = 0.0
+
 
 def get_device_id() -> str:
     """Get or create device_id from cookie."""
@@ -24,3 +45,91 @@ def set_device_cookie(response, device_id: str):
         secure=False,  # set True in production with HTTPS
     )
     return response
+
+
+# ── signed entitlement ────────────────────────────────────
+#
+# A short-lived signed copy of what read paths need from the users row (id,
+# plan, unlocked_until), bound to the device cookie. Pages and read-only APIs
+# authorize from it without touching Postgres; anything that writes the user
+# re-issues it. unlock_user bumps users.entitlement_version and stamps
+# entitlement_bumped_at. Every process re-reads the bumps of the last
+# ENTITLEMENT_TTL seconds (older tokens have expired anyway) at most every
+# ENTITLEMENT_REFRESH seconds -- one small indexed query per process, not per
+# request -- and rejects tokens carrying an older version. The process that
+# ran the unlock applies it at once through revoke_entitlement.
+
+def read_entitlement(device_id: str) -> dict | None:
+    """The user dict from a valid entitlement cookie, or None."""
+    return decode_entitlement(request.cookies.get(ENTITLEMENT_COOKIE), device_id)
+
+
+def decode_entitlement(token: str | None, device_id: str, refresh: bool = True) -> dict | None:
+    """read_entitlement without Flask's request. asgi.py passes refresh=False:
+    the version floor query is blocking, so it refreshes the floor from a
+    background task instead (apply_entitlement_bumps)."""
+    if not token:
+        return None
+    try:
+        data = _serializer.loads(token, max_age=ENTITLEMENT_TTL)
+    except BadSignature:
+        return None
+    if refresh:
+        _refresh_version_floor()
+    if data.get("d") != device_id or data.get("v", 0) < _version_floor.get(data.get("u"), 0):
+        return None
+    return {
+        "id": data["u"],
+        "device_id": device_id,
+        "plan": data["p"],
+        "unlocked_until": datetime.fromisoformat(data["x"]) if data.get("x") else None,
+        "entitlement_version": data.get("v", 0),
+    }
+
+
+def set_entitlement_cookie(response, user: dict):
+    token = _serializer.dumps({
+        "d": user["device_id"],
+        "u": str(user["id"]),
+        "p": user["plan"],
+        "x": user["unlocked_until"].isoformat() if user.get("unlocked_until") else None,
+        "v": user.get("entitlement_version") or 0,
+    })
+    response.set_cookie(
+        ENTITLEMENT_COOKIE,
+        token,
+        max_age=ENTITLEMENT_TTL,
+        httponly=True,
+        samesite="Lax",
+        secure=False,  # set True in production with HTTPS
+    )
+    return response
+
+
+def revoke_entitlement(user_id, version: int):
+    """Stop honouring this user's tokens older than version."""
+    _version_floor[str(user_id)] = max(version, _version_floor.get(str(user_id), 0))
+
+
+def apply_entitlement_bumps(bumps: dict):
+    """Revoke older tokens for each user_id -> entitlement_version."""
+    for user_id, version in bumps.items():
+        revoke_entitlement(user_id, version)
+
+
+def _refresh_version_floor():
+    global _floor_refreshed
+    if time.monotonic() - _floor_refreshed < ENTITLEMENT_REFRESH:
+        return
+    # One thread refreshes; the others keep using the current floor
+    if not _floor_lock.acquire(blocking=False):
+        return
+    try:
+        apply_entitlement_bumps(entitlement_bumps(ENTITLEMENT_TTL))
+        _floor_refreshed = time.monotonic()
+    except Exception as e:
+        # Keep the last floor; try again next refresh
+        _floor_refreshed = time.monotonic()
+        print(f"Entitlement refresh failed: {e}")
+    finally:
+        _floor_lock.release()
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from services.db import get_cached_analysis, put_cached_analysis, purge_cached_analyses
+from services import db_async
+from services.metrics import CACHE_LOOKUPS
+
+ANALYSIS_CACHE_ENABLED = os.environ.get("ANALYSIS_CACHE_ENABLED", "1") == "1"
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", "2000"))
+ANALYSIS_CACHE_TTL = int(os.environ.get("ANALYSIS_CACHE_TTL", str(6 * 60 * 60)))  # in-process, seconds
+ANALYSIS_CACHE_DB_TTL = int(os.environ.get("ANALYSIS_CACHE_DB_TTL", str(30 * 24 * 60 * 60)))  # shared, seconds
+ANALYSIS_CACHE_PURGE_BATCH = int(os.environ.get("ANALYSIS_CACHE_PURGE_BATCH", "1000"))
+
+
+# ── analysis cache ────────────────────────────────────────
+#
+# Two tiers in front of the model: a per-process LRU with TTL, and the
+# analysis_cache table shared by every worker. Keys are content hashes of the
+# normalized message plus everything that changes the model's answer
+# (direction, model, prompt version), so bumping PROMPT_VERSION in
+# services/ai.py invalidates old entries.
+
+_lru = OrderedDict()
+_lock = threading.Lock()
+
+
+def normalize_message(message_text: str) -> str:
+    text = unicodedata.normalize("NFKC", message_text)
+    return " ".join(text.split())
+
+
+def cache_key(message_text: str, direction: str, model: str, prompt_version: str) -> str:
+    raw = "\x1f".join([normalize_message(message_text), direction, model, prompt_version])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get(key: str):
+    """Return a copy of the cached analysis for key, or None."""
+    if not ANALYSIS_CACHE_ENABLED:
+        return None
+    result = _recall(key)
+    if result is not None:
+        return result
+    try:
+        result = get_cached_analysis(key, ANALYSIS_CACHE_DB_TTL)
+    except Exception as e:
+        print(f"Analysis cache lookup failed: {e}")
+        result = None
+    return _found(key, result)
+
+
+async def get_async(key: str):
+    """get() for asgi.py: the shared tier is read through the async pool."""
+    if not ANALYSIS_CACHE_ENABLED:
+        return None
+    result = _recall(key)
+    if result is not None:
+        return result
+    try:
+        result = await db_async.get_cached_analysis(key, ANALYSIS_CACHE_DB_TTL)
+    except Exception as e:
+        print(f"Analysis cache lookup failed: {e}")
+        result = None
+    return _found(key, result)
+
+
+def _recall(key: str):
+    now = time.monotonic()
+    with _lock:
+        entry = _lru.get(key)
+        if entry is not None:
+            expires, payload = entry
+            if expires > now:
+                _lru.move_to_end(key)
+                CACHE_LOOKUPS.labels("memory_hit").inc()
+                return json.loads(payload)
+            del _lru[key]
+    return None
+
+
+def _found(key: str, result):
+    if result is None:
+        CACHE_LOOKUPS.labels("miss").inc()
+        return None
+    CACHE_LOOKUPS.labels("db_hit").inc()
+    _remember(key, json.dumps(result))
+    return result
+
+
+def put(key: str, result: dict):
+    if not ANALYSIS_CACHE_ENABLED:
+        return
+    _remember(key, json.dumps(result))
+    try:
+        put_cached_analysis(key, result)
+    except Exception as e:
+        print(f"Analysis cache store failed: {e}")
+
+
+async def put_async(key: str, result: dict):
+    if not ANALYSIS_CACHE_ENABLED:
+        return
+    _remember(key, json.dumps(result))
+    try:
+        await db_async.put_cached_analysis(key, result)
+    except Exception as e:
+        print(f"Analysis cache store failed: {e}")
+
+
+def _remember(key: str, payload: str):
+    # Stored serialized so callers can never mutate a cached result in place.
+    with _lock:
+        _lru[key] = (time.monotonic() + ANALYSIS_CACHE_TTL, payload)
+        _lru.move_to_end(key)
+        while len(_lru) > ANALYSIS_CACHE_MAX_ENTRIES:
+            _lru.popitem(last=False)
+
+
+def purge_expired() -> int:
+    """Delete analysis_cache rows past ANALYSIS_CACHE_DB_TTL (run periodically
+    by worker.py's maintenance pass)."""
+    deleted = purge_cached_analyses(ANALYSIS_CACHE_DB_TTL, ANALYSIS_CACHE_PURGE_BATCH)
+    if deleted:
+        print(f"analysis cache: purged {deleted} expired entries")
+    return deleted
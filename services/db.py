@@ -1,87 +1,349 @@
 import os
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+from services.metrics import timed
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+# How long a checkout waits for a free connection when all DB_POOL_MAX are in use.
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+# Run a "SELECT 1" on checkout to weed out connections the server dropped.
+DB_POOL_PING = os.environ.get("DB_POOL_PING", "1") == "1"
+# Optional streaming replica for read-only helpers (see read_conn).
+DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+# After a user's own write, their reads stay on the primary this long; keep
+# it above the replica's usual replication lag.
+REPLICA_STICKY_SECONDS = float(os.environ.get("REPLICA_STICKY_SECONDS", "10"))
+# Advisory lock keys. Any constants work; they just have to be the same in
+# every process and differ from each other.
+EVENT_MAINTENANCE_LOCK = 7410016
+MIGRATION_LOCK = 7410017  # services/migrations.py
+
+
+# ── connection pool ───────────────────────────────────────
+#
+# One pool per process (two with a replica), rebuilt in each forked worker
+# (see post_fork in gunicorn.conf.py). The parent's sockets are abandoned
+# rather than closed: closing them from the child would terminate the
+# parent's sessions too.
+#
+# ThreadedConnectionPool raises PoolError the moment it is exhausted, so each
+# pool is fronted by a semaphore of DB_POOL_MAX slots: a burst of requests
+# (or the background threads) queues for up to DB_POOL_TIMEOUT instead of
+# failing.
+
+_DSNS = {"primary": DATABASE_URL, "replica": DATABASE_REPLICA_URL}
+_pools = {}
+_slots = {}
+_pool_pid = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
 
+def _get_pool(role: str = "primary") -> ThreadedConnectionPool:
+    global _pool_pid
+    pid = os.getpid()
+    if _pool_pid != pid or role not in _pools:
+        with _pool_lock:
+            if _pool_pid != pid:
+                _pools.clear()
+                _slots.clear()
+                _pool_pid = pid
+            if role not in _pools:
+                _slots[role] = threading.Semaphore(DB_POOL_MAX)
+                _pools[role] = ThreadedConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX, _DSNS[role],
+                    cursor_factory=RealDictCursor,
+                )
+    return _pools[role]
+
+
+def reset_pool():
+    """Drop the pools inherited from a parent process (call after fork)."""
+    global _pool_pid
+    with _pool_lock:
+        _pools.clear()
+        _slots.clear()
+        _pool_pid = None
+    _local.__dict__.clear()
 
-def get_conn():
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
 
+def close_pool():
+    """Close every pooled connection owned by this process (worker shutdown)."""
+    global _pool_pid
+    with _pool_lock:
+        if _pool_pid == os.getpid():
+            for pool in _pools.values():
+                pool.closeall()
+        _pools.clear()
+        _slots.clear()
+        _pool_pid = None
 
-def run_migration():
-    """Run the SQL migration file against the database."""
-    migration_path = os.path.join(os.path.dirname(__file__), "..", "migrations", "001_init.sql")
-    with open(migration_path, "r") as f:
-        sql = f.read()
-    conn = get_conn()
+
+def _healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    if conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if DB_POOL_PING:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+    return True
+
+
+def _checkout(role: str = "primary"):
+    pool = _get_pool(role)
+    slots = _slots[role]
+    if not slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise PoolError(f"No database connection free within {DB_POOL_TIMEOUT:g}s (DB_POOL_MAX={DB_POOL_MAX}).")
     try:
-        with conn.cursor() as cur:
-            cur.execute(sql)
-        conn.commit()
-        print("Migration applied successfully.")
-    except Exception as e:
-        conn.rollback()
-        print(f"Migration error: {e}")
+        # Every connection in the pool may be stale after a DB restart; try
+        # each slot once before giving up.
+        for _ in range(DB_POOL_MAX + 1):
+            conn = pool.getconn()
+            if _healthy(conn):
+                return conn
+            pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("No healthy database connection available.")
+    except BaseException:
+        slots.release()
+        raise
+
+
+def _checkin(conn, role: str = "primary"):
+    pool = _get_pool(role)
+    slots = _slots[role]
+    try:
+        if conn.closed:
+            pool.putconn(conn, close=True)
+            return
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            pool.putconn(conn)
+        except psycopg2.Error:
+            pool.putconn(conn, close=True)
     finally:
-        conn.close()
+        slots.release()
 
 
-# ── user helpers ──────────────────────────────────────────
+@contextmanager
+def get_conn(request_scoped: bool = True):
+    """Borrow a pooled connection.
 
-def get_or_create_user(device_id: str) -> dict:
-    conn = get_conn()
+    Inside a request scope (see begin_request) every helper shares the same
+    connection; otherwise each call checks one out and returns it on exit.
+    Helpers that run around slow external calls pass request_scoped=False so
+    they never leave a connection pinned while the request waits.
+    """
+    if request_scoped and getattr(_local, "scoped", False):
+        if _local.conn is None:
+            _local.conn = _checkout()
+        try:
+            yield _local.conn
+        except Exception:
+            # Don't let one failed helper poison the rest of the request.
+            if not _local.conn.closed:
+                _local.conn.rollback()
+            raise
+        return
+    conn = _checkout()
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM users WHERE device_id = %s", (device_id,))
-            user = cur.fetchone()
-            if user:
-                cur.execute("UPDATE users SET last_seen = NOW() WHERE id = %s", (user["id"],))
-                conn.commit()
-                # refresh
-                cur.execute("SELECT * FROM users WHERE id = %s", (user["id"],))
-                return dict(cur.fetchone())
-            cur.execute(
-                "INSERT INTO users (device_id) VALUES (%s) RETURNING *",
-                (device_id,),
-            )
-            conn.commit()
-            return dict(cur.fetchone())
+        yield conn
     finally:
-        conn.close()
+        _checkin(conn)
 
 
-def reset_daily_scans_if_needed(user: dict) -> dict:
-    """Reset free_scans_used_today if it's a new day."""
-    from datetime import date
-    today = date.today()
-    scan_day = user.get("free_scans_day")
-    if scan_day is None or (hasattr(scan_day, 'date') and scan_day != today) or (not hasattr(scan_day, 'date') and scan_day != today):
-        conn = get_conn()
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE users SET free_scans_used_today = 0, free_scans_day = %s WHERE id = %s RETURNING *",
-                    (today, user["id"]),
-                )
-                conn.commit()
-                return dict(cur.fetchone())
-        finally:
-            conn.close()
-    return user
+def begin_request():
+    """Pin one connection (checked out lazily) for the rest of this request."""
+    _local.scoped = True
+    _local.conn = None
+
+
+def release_request_conn():
+    """Hand the pinned connection back early, e.g. before a slow AI call.
+
+    The request scope stays active; the next helper checks out a fresh one.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        _checkin(conn)
+
+
+def end_request():
+    release_request_conn()
+    _local.scoped = False
+
+
+# ── read replica ──────────────────────────────────────────
+#
+# Read-only helpers borrow through read_conn(), which uses the replica when
+# DATABASE_REPLICA_URL is set. Helpers that change a user's data call
+# note_write(), and that user's reads go to the primary for
+# REPLICA_STICKY_SECONDS so they always see their own writes. Stickiness is
+# remembered per process and returned by written_until() so the app can
+# carry it to the user's next request (in a cookie) via stick_to_primary().
+
+_recent_writes = {}  # user_id -> monotonic deadline
+_sticky_until: ContextVar = ContextVar("sticky_until", default=0.0)
+_written_until: ContextVar = ContextVar("written_until", default=0.0)
+
+
+def note_write(user_id, lead: float = 0.0):
+    """Keep user_id's reads on the primary for REPLICA_STICKY_SECONDS. lead
+    covers a write the request will make later (e.g. after its response has
+    started streaming), by starting the window that many seconds from now."""
+    if not DATABASE_REPLICA_URL:
+        return
+    now = time.monotonic()
+    _recent_writes[str(user_id)] = now + lead + REPLICA_STICKY_SECONDS
+    _written_until.set(time.time() + lead + REPLICA_STICKY_SECONDS)
+    if len(_recent_writes) > 10000:
+        for key, deadline in list(_recent_writes.items()):
+            if deadline < now:
+                _recent_writes.pop(key, None)
+
 
+def stick_to_primary(until: float):
+    """Route this request's reads to the primary until the given epoch time."""
+    _sticky_until.set(until)
+    _written_until.set(0.0)
 
-def increment_free_scan(user_id: str):
-    conn = get_conn()
+
+def written_until() -> float:
+    """Epoch time until which this request's writer should stay on the primary (0 = no write)."""
+    return _written_until.get()
+
+
+def prefers_primary(user_id=None) -> bool:
+    if not DATABASE_REPLICA_URL or _sticky_until.get() > time.time():
+        return True
+    return user_id is not None and _recent_writes.get(str(user_id), 0) > time.monotonic()
+
+
+@contextmanager
+def read_conn(user_id=None):
+    """A connection for read-only queries: the replica, unless there is none,
+    this user wrote recently, or the replica is unreachable."""
+    if prefers_primary(user_id):
+        with get_conn() as conn:
+            yield conn
+        return
+    try:
+        conn = _checkout("replica")
+    except psycopg2.OperationalError as e:
+        print(f"Replica unavailable, reading from the primary: {e}")
+        with get_conn() as conn:
+            yield conn
+        return
     try:
+        yield conn
+    finally:
+        _checkin(conn, "replica")
+
+
+# ── user helpers ──────────────────────────────────────────
+
+# The SQL of helpers that services/db_async.py mirrors lives in constants so
+# both drivers run exactly the same statements.
+
+USER_BY_DEVICE_SQL = "SELECT * FROM users WHERE device_id = %s"
+CREATE_USER_SQL = """INSERT INTO users (device_id) VALUES (%s)
+                     ON CONFLICT (device_id) DO UPDATE SET last_seen = NOW()
+                     RETURNING *"""
+
+
+@timed("db")
+def get_or_create_user(device_id: str) -> dict:
+    """Resolve (or create) the user for a device.
+
+    A plain read for known devices; last_seen is batched by
+    services.events.touch_user instead of written here.
+    """
+    with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE users SET free_scans_used_today = free_scans_used_today + 1 WHERE id = %s",
-                (user_id,),
-            )
+            cur.execute(USER_BY_DEVICE_SQL, (device_id,))
+            row = cur.fetchone()
+            if row:
+                return dict(row)
+            cur.execute(CREATE_USER_SQL, (device_id,))
+            user = dict(cur.fetchone())
+        conn.commit()
+        return user
+
+
+@timed("db")
+def touch_users(user_ids: list):
+    with get_conn(request_scoped=False) as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE users SET last_seen = NOW() WHERE id = ANY(%s::uuid[])", (list(user_ids),))
+        conn.commit()
+
+
+# ── entitlement ───────────────────────────────────────────
+
+FREE_SCANS_PER_DAY = int(os.environ.get("FREE_SCANS_PER_DAY", "1"))
+
+RESERVE_USER_SQL = """INSERT INTO users (device_id) VALUES (%s)
+                      ON CONFLICT (device_id) DO UPDATE SET
+                          last_seen = NOW(),
+                          free_scans_used_today = CASE
+                              WHEN users.free_scans_day = CURRENT_DATE THEN users.free_scans_used_today
+                              ELSE 0 END,
+                          free_scans_day = CURRENT_DATE
+                      RETURNING *"""
+RESERVE_FREE_SCAN_SQL = """UPDATE users SET free_scans_used_today = free_scans_used_today + %s
+                           WHERE id = %s RETURNING *"""
+RELEASE_FREE_SCAN_SQL = """UPDATE users SET free_scans_used_today = GREATEST(free_scans_used_today - %s, 0)
+                           WHERE id = %s AND free_scans_day = CURRENT_DATE"""
+
+
+@timed("db")
+def reserve_scan(device_id: str, scans: int = 1) -> tuple[dict, bool, bool]:
+    """Resolve the user, roll the free-scan day over and reserve `scans` free
+    scans (all or none).
+
+    Returns (user, unlocked, reserved). The scan may proceed when either flag
+    is set; if it later fails, call release_free_scan for reserved scans.
+
+    The upsert takes the row lock, so concurrent scans from the same device
+    queue behind each other and cannot both pass the daily limit.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(RESERVE_USER_SQL, (device_id,))
+            user = dict(cur.fetchone())
+            unlocked = is_unlocked(user)
+            reserved = False
+            if not unlocked and user["free_scans_used_today"] + scans <= FREE_SCANS_PER_DAY:
+                cur.execute(RESERVE_FREE_SCAN_SQL, (scans, user["id"]))
+                user = dict(cur.fetchone())
+                reserved = True
+        conn.commit()
+        return user, unlocked, reserved
+
+
+@timed("db")
+def release_free_scan(user_id, scans: int = 1):
+    """Give back free scans reserved by reserve_scan (e.g. the AI call failed)."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(RELEASE_FREE_SCAN_SQL, (scans, user_id))
         conn.commit()
-    finally:
-        conn.close()
 
 
 def is_unlocked(user: dict) -> bool:
@@ -91,125 +353,1026 @@ def is_unlocked(user: dict) -> bool:
     return False
 
 
-def unlock_user(user_id: str, plan: str = "monthly"):
+def _unlock_user(cur, user_id) -> int | None:
     from datetime import datetime, timedelta
-    conn = get_conn()
-    try:
+    cur.execute(
+        """UPDATE users SET plan = 'monthly', unlocked_until = %s,
+               entitlement_version = entitlement_version + 1, entitlement_bumped_at = NOW()
+           WHERE id = %s RETURNING entitlement_version""",
+        (datetime.utcnow() + timedelta(days=30), user_id),
+    )
+    row = cur.fetchone()
+    return row["entitlement_version"] if row else None
+
+
+ENTITLEMENT_BUMPS_SQL = """SELECT id, entitlement_version FROM users
+                           WHERE entitlement_bumped_at > NOW() - make_interval(secs => %s)"""
+
+
+def entitlement_bumps(within_seconds: int) -> dict:
+    """user_id -> entitlement_version for users whose version changed in the
+    last within_seconds."""
+    with get_conn(request_scoped=False) as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE users SET plan = 'monthly', unlocked_until = %s WHERE id = %s",
-                (datetime.utcnow() + timedelta(days=30), user_id),
-            )
+            cur.execute(ENTITLEMENT_BUMPS_SQL, (within_seconds,))
+            rows = cur.fetchall()
+        conn.rollback()
+        return {str(r["id"]): r["entitlement_version"] for r in rows}
+
+
+@timed("db")
+def unlock_user(user_id: str, plan: str = "monthly") -> int | None:
+    """Unlock the user and return their new entitlement_version."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            version = _unlock_user(cur, user_id)
         conn.commit()
-    finally:
-        conn.close()
+        note_write(user_id)
+        return version
 
 
 # ── scan helpers ──────────────────────────────────────────
 
+SCAN_INSERT_COLUMNS = """user_id, message_text, direction,
+                         interest_score, red_flag_risk, emotional_distance, ghost_probability,
+                         reply_window, confidence, hidden_signals_count, hidden_signals,
+                         archetype, summary, replies, enriched"""
+SCAN_VALUES = "%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s::jsonb,%s,%s,%s::jsonb,%s"
+INSERT_SCAN_SQL = f"INSERT INTO scans ({SCAN_INSERT_COLUMNS}) VALUES ({SCAN_VALUES}) RETURNING *"
+
+
+def scan_params(user_id, data: dict) -> tuple:
+    import json
+    return (
+        user_id,
+        data["message_text"],
+        data["direction"],
+        data["interest_score"],
+        data["red_flag_risk"],
+        data["emotional_distance"],
+        data["ghost_probability"],
+        data["reply_window"],
+        data["confidence"],
+        data["hidden_signals_count"],
+        json.dumps(data.get("hidden_signals", [])),
+        data.get("archetype", ""),
+        data.get("summary", ""),
+        json.dumps(data.get("replies", {})),
+        # core-tier results carry no paid fields yet
+        "replies" in data,
+    )
+
+
+def _insert_scan(cur, user_id, data: dict) -> dict:
+    cur.execute(INSERT_SCAN_SQL, scan_params(user_id, data))
+    scan = dict(cur.fetchone())
+    cur.execute(TRENDS_UPSERT_SQL, trends_params(scan))
+    return scan
+
+
+@timed("db")
 def save_scan(user_id, data: dict) -> dict:
-    conn = get_conn()
-    try:
+    with get_conn() as conn:
         with conn.cursor() as cur:
-            import json
-            cur.execute(
-                """INSERT INTO scans
-                   (user_id, message_text, direction,
-                    interest_score, red_flag_risk, emotional_distance, ghost_probability,
-                    reply_window, confidence, hidden_signals_count, hidden_signals,
-                    archetype, summary, replies)
-                   VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                   RETURNING *""",
-                (
-                    user_id,
-                    data["message_text"],
-                    data["direction"],
-                    data["interest_score"],
-                    data["red_flag_risk"],
-                    data["emotional_distance"],
-                    data["ghost_probability"],
-                    data["reply_window"],
-                    data["confidence"],
-                    data["hidden_signals_count"],
-                    json.dumps(data.get("hidden_signals", [])),
-                    data.get("archetype", ""),
-                    data.get("summary", ""),
-                    json.dumps(data.get("replies", {})),
-                ),
+            scan = _insert_scan(cur, user_id, data)
+        conn.commit()
+        note_write(user_id)
+        return scan
+
+
+@timed("db")
+def save_scans(user_id, items: list) -> list:
+    """Insert several scans (e.g. one conversation thread) with one multi-row
+    INSERT; returns the rows in the order of items."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            # NOW() is the same for every row; a microsecond apart keeps the
+            # thread's order in history (created_at DESC, id DESC).
+            rows = execute_values(
+                cur,
+                f"INSERT INTO scans ({SCAN_INSERT_COLUMNS}, created_at) VALUES %s RETURNING *",
+                [scan_params(user_id, data) + (i,) for i, data in enumerate(items)],
+                template=f"({SCAN_VALUES}, NOW() + %s * INTERVAL '1 microsecond')",
+                page_size=len(items),
+                fetch=True,
             )
-            conn.commit()
-            return dict(cur.fetchone())
-    finally:
-        conn.close()
+            # RETURNING follows VALUES order for a single-page INSERT
+            scans = [dict(r) for r in rows]
+            # Oldest message first, so the EWMA sees the thread in order
+            for scan in scans:
+                cur.execute(TRENDS_UPSERT_SQL, trends_params(scan))
+        conn.commit()
+        note_write(user_id)
+        return scans
 
 
-def get_history(user_id: str, limit: int = 10) -> list:
-    conn = get_conn()
-    try:
+@timed("db")
+def get_scan(scan_id, user_id):
+    with read_conn(user_id) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT * FROM scans WHERE id = %s AND user_id = %s", (scan_id, user_id))
+            row = cur.fetchone()
+    if row is None and not prefers_primary(user_id):
+        # Possibly not replicated yet (e.g. written by worker.py)
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT * FROM scans WHERE id = %s AND user_id = %s", (scan_id, user_id))
+                row = cur.fetchone()
+    if row is None:
+        return get_archived_scan(scan_id, user_id)
+    return dict(row)
+
+
+CARD_COLUMNS = (
+    "id, interest_score, red_flag_risk, emotional_distance, ghost_probability, reply_window, confidence"
+)
+
+
+@timed("db")
+def get_scan_card(scan_id):
+    """Just the fields a share card shows; share links are public by scan id."""
+    with read_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {CARD_COLUMNS} FROM scans WHERE id = %s", (scan_id,))
+            row = cur.fetchone()
+    if row is None and not prefers_primary():
+        # A link shared seconds after the scan may beat replication
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT {CARD_COLUMNS} FROM scans WHERE id = %s", (scan_id,))
+                row = cur.fetchone()
+    if row is None:
+        with read_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT {CARD_COLUMNS} FROM scans_archive WHERE id = %s", (scan_id,))
+                row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def get_recent_scan_cards(days: int, limit: int) -> list:
+    with read_conn() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                "SELECT * FROM scans WHERE user_id = %s ORDER BY created_at DESC LIMIT %s",
-                (user_id, limit),
+                f"""SELECT {CARD_COLUMNS} FROM scans
+                    WHERE created_at > NOW() - make_interval(days => %s)
+                    ORDER BY created_at DESC LIMIT %s""",
+                (days, limit),
             )
             return [dict(r) for r in cur.fetchall()]
-    finally:
-        conn.close()
 
 
-# ── event helpers ─────────────────────────────────────────
+def _update_scan_enrichment(cur, scan_id, enrichment: dict) -> dict | None:
+    """None if the scan is gone from both scans and scans_archive."""
+    import json
+    cur.execute(
+        """UPDATE scans SET hidden_signals = %s, replies = %s, enriched = TRUE
+           WHERE id = %s RETURNING *""",
+        (json.dumps(enrichment["hidden_signals"]), json.dumps(enrichment["replies"]), scan_id),
+    )
+    row = cur.fetchone()
+    if row is not None:
+        return dict(row)
+
+    # Archived since it was read: the enrichment goes into the compressed detail
+    cur.execute("SELECT detail FROM scans_archive WHERE id = %s FOR UPDATE", (scan_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    detail = dict(decompress_detail(row["detail"]), **{k: enrichment[k] for k in ("hidden_signals", "replies")})
+    cur.execute(
+        "UPDATE scans_archive SET detail = %s, enriched = TRUE WHERE id = %s RETURNING *",
+        (psycopg2.Binary(compress_detail(detail)), scan_id),
+    )
+    return archived_scan(cur.fetchone())
+
 
-def log_event(user_id, event_name: str, meta: dict = None):
+@timed("db")
+def save_scan_enrichment(scan_id, enrichment: dict) -> dict | None:
+    """Store generated hidden_signals/replies into an existing core scan
+    (live or archived). None if the scan no longer exists."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            scan = _update_scan_enrichment(cur, scan_id, enrichment)
+        conn.commit()
+        return scan
+
+
+# ── trend aggregates ──────────────────────────────────────
+#
+# user_trends holds running sums, an EWMA per score, archetype counts and the
+# last TREND_RECENT_SCANS scans for each user. _insert_scan updates it in the
+# same transaction, so it never drifts from scans; rebuild_trends() recomputes
+# it from scratch for existing data.
+
+TREND_SCORES = ("interest_score", "red_flag_risk", "emotional_distance", "ghost_probability")
+TREND_EWMA_ALPHA = float(os.environ.get("TREND_EWMA_ALPHA", "0.3"))
+TREND_RECENT_SCANS = int(os.environ.get("TREND_RECENT_SCANS", "20"))
+
+
+def _trends_upsert_sql() -> str:
+    sums = ", ".join(f"{k}_sum" for k in TREND_SCORES)
+    ewmas = ", ".join(f"{k}_ewma" for k in TREND_SCORES)
+    values = ", ".join(f"COALESCE(%({k})s, 0)" for k in TREND_SCORES)
+    updates = ", ".join(
+        f"{k}_sum = t.{k}_sum + EXCLUDED.{k}_sum, "
+        f"{k}_ewma = COALESCE(t.{k}_ewma + %(alpha)s * (EXCLUDED.{k}_ewma - t.{k}_ewma), EXCLUDED.{k}_ewma)"
+        for k in TREND_SCORES
+    )
+    return f"""INSERT INTO user_trends AS t
+                   (user_id, scan_count, {sums}, {ewmas}, archetypes, recent, last_scan_at)
+               VALUES (
+                   %(user_id)s, 1, {values}, {values},
+                   CASE WHEN %(archetype)s <> '' THEN jsonb_build_object(%(archetype)s::text, 1) ELSE '{{}}'::jsonb END,
+                   jsonb_build_array(%(point)s::jsonb),
+                   %(created_at)s
+               )
+               ON CONFLICT (user_id) DO UPDATE SET
+                   scan_count = t.scan_count + 1,
+                   {updates},
+                   archetypes = CASE WHEN %(archetype)s <> '' THEN t.archetypes || jsonb_build_object(
+                       %(archetype)s::text, COALESCE((t.archetypes ->> %(archetype)s::text)::int, 0) + 1
+                   ) ELSE t.archetypes END,
+                   recent = (
+                       SELECT jsonb_agg(e ORDER BY i)
+                       FROM jsonb_array_elements(EXCLUDED.recent || t.recent) WITH ORDINALITY AS r(e, i)
+                       WHERE i <= %(keep)s
+                   ),
+                   last_scan_at = GREATEST(t.last_scan_at, EXCLUDED.last_scan_at),
+                   updated_at = NOW()"""
+
+
+TRENDS_UPSERT_SQL = _trends_upsert_sql()
+
+
+def trends_params(scan: dict) -> dict:
     import json
-    conn = get_conn()
-    try:
+    point = {
+        "id": str(scan["id"]),
+        "created_at": scan["created_at"].isoformat() if scan["created_at"] else None,
+        "archetype": scan["archetype"] or "",
+        **{k: scan[k] for k in TREND_SCORES},
+    }
+    return {
+        "user_id": scan["user_id"],
+        "archetype": point["archetype"],
+        "point": json.dumps(point),
+        "created_at": scan["created_at"],
+        "alpha": TREND_EWMA_ALPHA,
+        "keep": TREND_RECENT_SCANS,
+        **{k: scan[k] for k in TREND_SCORES},
+    }
+
+
+@timed("db")
+def get_trends(user_id) -> dict | None:
+    with read_conn(user_id) as conn:
         with conn.cursor() as cur:
+            cur.execute("SELECT * FROM user_trends WHERE user_id = %s", (user_id,))
+            row = cur.fetchone()
+            return dict(row) if row else None
+
+
+def rebuild_trends() -> int:
+    """Recompute every user's aggregates from scans (and scans_archive) in one statement.
+
+    The EWMA is expanded into per-row weights: with n scans, the k-th newest
+    (k < n) weighs alpha * (1 - alpha)^(k - 1) and the oldest (1 - alpha)^(n - 1),
+    which matches seeding with the first scan and folding in the rest.
+    """
+    sums = ", ".join(f"{k}_sum" for k in TREND_SCORES)
+    ewmas = ", ".join(f"{k}_ewma" for k in TREND_SCORES)
+    agg_sums = ", ".join(f"SUM(COALESCE(w.{k}, 0))" for k in TREND_SCORES)
+    agg_ewmas = ", ".join(f"SUM(w.weight * COALESCE(w.{k}, 0))" for k in TREND_SCORES)
+    points = ", ".join(f"'{k}', w.{k}" for k in TREND_SCORES)
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in f"{sums}, {ewmas}".split(", "))
+    # Archived scans keep every column trends need
+    columns = f"id, user_id, created_at, archetype, {', '.join(TREND_SCORES)}"
+    source = f"(SELECT {columns} FROM scans UNION ALL SELECT {columns} FROM scans_archive)"
+    with get_conn(request_scoped=False) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""WITH ranked AS (
+                        SELECT s.*,
+                               ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at DESC, id DESC) AS rn,
+                               COUNT(*) OVER (PARTITION BY user_id) AS n
+                        FROM {source} s WHERE user_id IS NOT NULL
+                    ),
+                    w AS (
+                        -- Weights past a few hundred scans are ~0; cut off before POWER underflows
+                        SELECT ranked.*, CASE
+                            WHEN rn > 500 THEN 0
+                            WHEN rn = n THEN POWER(1 - %(alpha)s, rn - 1)
+                            ELSE %(alpha)s * POWER(1 - %(alpha)s, rn - 1)
+                        END AS weight
+                        FROM ranked
+                    ),
+                    arch AS (
+                        SELECT user_id, jsonb_object_agg(archetype, c) AS archetypes
+                        FROM (
+                            SELECT user_id, archetype, COUNT(*) AS c FROM {source} s
+                            WHERE user_id IS NOT NULL AND archetype <> ''
+                            GROUP BY user_id, archetype
+                        ) a
+                        GROUP BY user_id
+                    )
+                    INSERT INTO user_trends
+                        (user_id, scan_count, {sums}, {ewmas}, archetypes, recent, last_scan_at)
+                    SELECT w.user_id, COUNT(*), {agg_sums}, {agg_ewmas},
+                           COALESCE(arch.archetypes, '{{}}'::jsonb),
+                           jsonb_agg(jsonb_build_object(
+                               'id', w.id, 'created_at', w.created_at, 'archetype', COALESCE(w.archetype, ''), {points}
+                           ) ORDER BY w.rn) FILTER (WHERE w.rn <= %(keep)s),
+                           MAX(w.created_at)
+                    FROM w LEFT JOIN arch ON arch.user_id = w.user_id
+                    GROUP BY w.user_id, arch.archetypes
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        scan_count = EXCLUDED.scan_count, {updates},
+                        archetypes = EXCLUDED.archetypes, recent = EXCLUDED.recent,
+                        last_scan_at = EXCLUDED.last_scan_at, updated_at = NOW()""",
+                {"alpha": TREND_EWMA_ALPHA, "keep": TREND_RECENT_SCANS},
+            )
+            count = cur.rowcount
+            # Users whose scans are all gone
             cur.execute(
-                "INSERT INTO events (user_id, event_name, meta) VALUES (%s, %s, %s)",
-                (user_id, event_name, json.dumps(meta or {})),
+                """DELETE FROM user_trends t
+                   WHERE NOT EXISTS (SELECT 1 FROM scans s WHERE s.user_id = t.user_id)
+                     AND NOT EXISTS (SELECT 1 FROM scans_archive a WHERE a.user_id = t.user_id)"""
+            )
+        conn.commit()
+        return count
+
+
+# Only what /api/history returns; skips message_text and the JSONB blobs.
+HISTORY_COLUMNS = (
+    "id, created_at, interest_score, red_flag_risk, emotional_distance, ghost_probability, "
+    "reply_window, confidence, archetype, summary"
+)
+
+
+ARCHIVE_HISTORY_SQL = f"""SELECT {HISTORY_COLUMNS} FROM scans_archive WHERE user_id = %s
+                          ORDER BY created_at DESC, id DESC LIMIT %s"""
+ARCHIVE_HISTORY_BEFORE_SQL = f"""SELECT {HISTORY_COLUMNS} FROM scans_archive
+                                 WHERE user_id = %s AND (created_at, id) < (%s, %s)
+                                 ORDER BY created_at DESC, id DESC LIMIT %s"""
+# The live page joined to the user's has_archived_scans flag, so a short page
+# knows whether the archive is worth asking without another query. A user
+# with no (more) scans comes back as one row whose scan columns are NULL.
+HISTORY_SQL = f"""SELECT h.*, u.has_archived_scans FROM users u
+                  LEFT JOIN LATERAL ({ARCHIVE_HISTORY_SQL.replace("FROM scans_archive", "FROM scans")}) h ON TRUE
+                  WHERE u.id = %s"""
+HISTORY_BEFORE_SQL = f"""SELECT h.*, u.has_archived_scans FROM users u
+                         LEFT JOIN LATERAL ({ARCHIVE_HISTORY_BEFORE_SQL.replace("FROM scans_archive", "FROM scans")}) h ON TRUE
+                         WHERE u.id = %s"""
+
+
+def history_query(user_id, limit: int, before: tuple = None, archive: bool = False) -> tuple[str, tuple]:
+    if before is None:
+        params = (user_id, limit)
+        return (ARCHIVE_HISTORY_SQL, params) if archive else (HISTORY_SQL, params + (user_id,))
+    params = (user_id, before[0], before[1], limit)
+    return (ARCHIVE_HISTORY_BEFORE_SQL, params) if archive else (HISTORY_BEFORE_SQL, params + (user_id,))
+
+
+def live_history(rows: list) -> tuple[list, bool]:
+    """(scans, has_archived_scans) from a HISTORY_SQL result."""
+    return [r for r in rows if r["id"] is not None], bool(rows and rows[0]["has_archived_scans"])
+
+
+def archive_before(rows: list, before: tuple = None):
+    """Cursor where a short page of scans continues in scans_archive.
+    Archived rows are all older than the remaining scans, so the archive
+    picks up the same (created_at, id) order where scans ran out."""
+    return (rows[-1]["created_at"], rows[-1]["id"]) if rows else before
+
+
+@timed("db")
+def get_history(user_id: str, limit: int = 10, before: tuple = None) -> list:
+    """Newest-first scans for a user. before is the (created_at, id) of the
+    last row of the previous page. Pages that run past the live table
+    continue in scans_archive, for users who have archived scans."""
+    with read_conn(user_id) as conn:
+        with conn.cursor() as cur:
+            cur.execute(*history_query(user_id, limit, before))
+            rows, archived = live_history([dict(r) for r in cur.fetchall()])
+            if len(rows) < limit and archived:
+                cur.execute(*history_query(user_id, limit - len(rows), archive_before(rows, before), archive=True))
+                rows += [dict(r) for r in cur.fetchall()]
+            return rows
+
+
+# ── scan job queue ────────────────────────────────────────
+
+# Finished (done/failed) jobs are deleted this long after they finish; 0 = keep.
+SCAN_JOB_RETENTION_DAYS = int(os.environ.get("SCAN_JOB_RETENTION_DAYS", "7"))
+
+ENQUEUE_SCAN_JOB_SQL = """INSERT INTO scan_jobs (user_id, message_text, direction, reserved, max_attempts, tier)
+                          VALUES (%s, %s, %s, %s, %s, %s) RETURNING *"""
+
+
+@timed("db")
+def enqueue_scan_job(user_id, message_text: str, direction: str, reserved: bool,
+                     max_attempts: int = 3, tier: str = "full") -> dict:
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(ENQUEUE_SCAN_JOB_SQL, (user_id, message_text, direction, reserved, max_attempts, tier))
+            job = dict(cur.fetchone())
+        conn.commit()
+        return job
+
+
+@timed("db")
+def enqueue_enrich_jobs(user_id, limit: int = 5) -> int:
+    """Queue enrichment of the user's latest core-only scans (e.g. right after purchase)."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """INSERT INTO scan_jobs (user_id, message_text, direction, kind, scan_id)
+                   SELECT s.user_id, s.message_text, s.direction, 'enrich', s.id
+                   FROM scans s
+                   WHERE s.user_id = %s AND NOT s.enriched
+                     AND NOT EXISTS (
+                         SELECT 1 FROM scan_jobs j
+                         WHERE j.scan_id = s.id AND j.kind = 'enrich' AND j.status IN ('queued', 'running')
+                     )
+                   ORDER BY s.created_at DESC
+                   LIMIT %s""",
+                (user_id, limit),
+            )
+            count = cur.rowcount
+        conn.commit()
+        return count
+
+
+@timed("db")
+def claim_scan_job():
+    """Lock the oldest runnable job for this worker; None if the queue is empty."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """UPDATE scan_jobs SET status = 'running', locked_at = NOW(), attempts = attempts + 1
+                   WHERE id = (
+                       SELECT id FROM scan_jobs
+                       WHERE status = 'queued' AND run_after <= NOW()
+                       ORDER BY run_after
+                       LIMIT 1
+                       FOR UPDATE SKIP LOCKED
+                   )
+                   RETURNING *, EXTRACT(EPOCH FROM NOW() - created_at) AS queued_seconds"""
+            )
+            row = cur.fetchone()
+        conn.commit()
+        return dict(row) if row else None
+
+
+@timed("db")
+def complete_scan_job(job: dict, data: dict) -> dict:
+    """Save the scan and mark the job done in one transaction."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            scan = _insert_scan(cur, job["user_id"], data)
+            cur.execute(
+                "UPDATE scan_jobs SET status = 'done', scan_id = %s, finished_at = NOW(), error = NULL WHERE id = %s",
+                (scan["id"], job["id"]),
+            )
+        conn.commit()
+        return scan
+
+
+@timed("db")
+def complete_enrich_job(job: dict, enrichment: dict = None):
+    """Store the enrichment (if any) and mark the job done in one transaction."""
+    scan = None
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            if enrichment is not None:
+                scan = _update_scan_enrichment(cur, job["scan_id"], enrichment)
+            cur.execute(
+                "UPDATE scan_jobs SET status = 'done', finished_at = NOW(), error = NULL WHERE id = %s",
+                (job["id"],),
+            )
+        conn.commit()
+        return scan
+
+
+@timed("db")
+def fail_scan_job(job: dict, error: str, retry_in_seconds: float) -> bool:
+    """Requeue the job with a delay, or mark it failed once out of attempts.
+
+    Returns True if the job failed for good.
+    """
+    final = job["attempts"] >= job["max_attempts"]
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            if final:
+                cur.execute(
+                    "UPDATE scan_jobs SET status = 'failed', error = %s, finished_at = NOW() WHERE id = %s",
+                    (error, job["id"]),
+                )
+            else:
+                cur.execute(
+                    """UPDATE scan_jobs SET status = 'queued', error = %s, locked_at = NULL,
+                           run_after = NOW() + make_interval(secs => %s)
+                       WHERE id = %s""",
+                    (error, retry_in_seconds, job["id"]),
+                )
+        conn.commit()
+    return final
+
+
+@timed("db")
+def requeue_stale_scan_jobs(timeout_seconds: int) -> tuple[int, list]:
+    """Put back jobs whose worker died mid-run (running longer than timeout).
+
+    Jobs already out of attempts are failed instead of looping forever.
+    Returns (jobs requeued, jobs failed); the caller releases the free scans
+    the failed jobs reserved, as process_one does.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """UPDATE scan_jobs SET
+                       status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                       finished_at = CASE WHEN attempts >= max_attempts THEN NOW() END,
+                       error = COALESCE(error, 'worker timed out'),
+                       locked_at = NULL, run_after = NOW()
+                   WHERE status = 'running' AND locked_at < NOW() - make_interval(secs => %s)
+                   RETURNING id, user_id, status, reserved""",
+                (timeout_seconds,),
+            )
+            rows = [dict(r) for r in cur.fetchall()]
+        conn.commit()
+        failed = [r for r in rows if r["status"] == "failed"]
+        return len(rows) - len(failed), failed
+
+
+@timed("db")
+def get_scan_job(job_id, user_id):
+    """Fetch a user's job together with its scan (if finished)."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """SELECT s.*, j.id AS job_id, j.scan_id AS scan_id, j.status, j.error, j.attempts
+                   FROM scan_jobs j LEFT JOIN scans s ON s.id = j.scan_id
+                   WHERE j.id = %s AND j.user_id = %s""",
+                (job_id, user_id),
+            )
+            row = cur.fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    if job["status"] == "done":
+        # worker.py saved the scan; keep this user's next reads on the primary
+        note_write(user_id)
+        if job["id"] is None and job["scan_id"]:
+            # Archived since: the join finds nothing, get_scan() checks the archive
+            job.update(get_scan(job["scan_id"], user_id) or {})
+    return job
+
+
+@timed("db")
+def scan_job_stats() -> dict:
+    with read_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """SELECT
+                       COUNT(*) FILTER (WHERE status = 'queued') AS queued,
+                       COUNT(*) FILTER (WHERE status = 'running') AS running,
+                       COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(created_at) FILTER (WHERE status = 'queued')), 0)
+                           AS oldest_queued_seconds,
+                       COUNT(*) FILTER (WHERE status = 'failed' AND finished_at > NOW() - INTERVAL '1 hour')
+                           AS failed_last_hour
+                   FROM scan_jobs
+                   WHERE status IN ('queued', 'running') OR finished_at > NOW() - INTERVAL '1 hour'"""
+            )
+            return dict(cur.fetchone())
+
+
+@timed("db")
+def purge_scan_jobs(batch_size: int = 1000) -> int:
+    """Delete done and failed jobs finished more than SCAN_JOB_RETENTION_DAYS
+    ago, batch_size rows per transaction. Returns how many were deleted."""
+    if SCAN_JOB_RETENTION_DAYS <= 0:
+        return 0
+    deleted = 0
+    with get_conn(request_scoped=False) as conn:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """DELETE FROM scan_jobs WHERE id IN (
+                           SELECT id FROM scan_jobs
+                           WHERE status IN ('done', 'failed')
+                             AND finished_at < NOW() - make_interval(days => %s)
+                           LIMIT %s)""",
+                    (SCAN_JOB_RETENTION_DAYS, batch_size),
+                )
+                count = cur.rowcount
+            conn.commit()
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+
+# ── event helpers ─────────────────────────────────────────
+
+@timed("db")
+def insert_events(rows: list):
+    """Insert (user_id, event_name, meta) rows with a single multi-row INSERT."""
+    import json
+    if not rows:
+        return
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                "INSERT INTO events (user_id, event_name, meta) VALUES %s",
+                [(user_id, event_name, json.dumps(meta or {})) for user_id, event_name, meta in rows],
+                page_size=len(rows),
             )
         conn.commit()
-    finally:
-        conn.close()
 
 
 # ── stripe session helpers ────────────────────────────────
 
+@timed("db")
 def save_stripe_session(user_id, stripe_session_id, plan):
-    conn = get_conn()
-    try:
+    with get_conn() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 "INSERT INTO stripe_sessions (user_id, stripe_session_id, plan) VALUES (%s, %s, %s)",
                 (user_id, stripe_session_id, plan),
             )
         conn.commit()
-    finally:
-        conn.close()
 
 
-def complete_stripe_session(stripe_session_id):
-    conn = get_conn()
-    try:
+def _complete_checkout(cur, stripe_session_id, user_id, plan) -> dict | None:
+    # The pending -> completed transition is the exactly-once gate: only the
+    # caller that flips it (or first records the session) unlocks the user.
+    cur.execute(
+        """INSERT INTO stripe_sessions (user_id, stripe_session_id, plan, status)
+           VALUES (%s, %s, %s, 'completed')
+           ON CONFLICT (stripe_session_id) DO UPDATE SET status = 'completed'
+           WHERE stripe_sessions.status <> 'completed'
+           RETURNING user_id, plan""",
+        (user_id, stripe_session_id, plan),
+    )
+    row = cur.fetchone()
+    if not row:
+        return None
+    version = _unlock_user(cur, row["user_id"])
+    return {"user_id": row["user_id"], "plan": row["plan"], "entitlement_version": version}
+
+
+@timed("db")
+def complete_checkout(stripe_session_id, user_id, plan) -> dict | None:
+    """Mark a paid checkout completed and unlock its user, once.
+
+    Returns the unlock ({user_id, plan, entitlement_version}) if this call
+    applied it, None if the session was already completed.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            unlock = _complete_checkout(cur, stripe_session_id, user_id, plan)
+        conn.commit()
+        # Also when a webhook already applied it: the user is about to re-read
+        note_write(user_id)
+        return unlock
+
+
+@timed("db")
+def get_user_by_id(user_id):
+    with read_conn(user_id) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT * FROM users WHERE id = %s", (user_id,))
+            row = cur.fetchone()
+            return dict(row) if row else None
+
+
+# ── event maintenance ─────────────────────────────────────
+
+def event_maintenance(months_ahead: int, retention_months: int) -> dict | None:
+    """Create upcoming events partitions, roll events up into events_daily and
+    drop raw partitions older than retention_months (0 = keep everything),
+    along with events_default rows from those months.
+
+    Runs in one transaction under an advisory lock; returns None when another
+    process is already doing it.
+    """
+    from datetime import date
+    with get_conn(request_scoped=False) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (EVENT_MAINTENANCE_LOCK,))
+            if not cur.fetchone()["locked"]:
+                conn.rollback()
+                return None
+
+            cur.execute("SELECT ensure_event_partitions(%s) AS created", (months_ahead,))
+            created = cur.fetchone()["created"]
+
+            # Re-aggregate from the last rolled-up day: distinct users can't be
+            # summed, so a day is always recomputed whole.
+            cur.execute(
+                """INSERT INTO events_daily (day, event_name, events, users)
+                   SELECT created_at::date, event_name, COUNT(*), COUNT(DISTINCT user_id)
+                   FROM events
+                   WHERE created_at >= COALESCE((SELECT MAX(day) FROM events_daily), '-infinity')
+                   GROUP BY 1, 2
+                   ON CONFLICT (day, event_name) DO UPDATE SET
+                       events = EXCLUDED.events, users = EXCLUDED.users"""
+            )
+            rolled_up = cur.rowcount
+
+            dropped = []
+            default_deleted = 0
+            if retention_months > 0:
+                today = date.today()
+                months = today.year * 12 + today.month - 1 - retention_months
+                cutoff = f"events_p{months // 12:04d}{months % 12 + 1:02d}"
+                cur.execute(
+                    """SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                       WHERE i.inhparent = 'events'::regclass AND c.relname ~ '^events_p[0-9]{6}$'
+                       ORDER BY c.relname"""
+                )
+                # Names sort chronologically; everything before the cutoff month goes
+                dropped = [r["relname"] for r in cur.fetchall() if r["relname"] < cutoff]
+                for name in dropped:
+                    cur.execute(f'DROP TABLE "{name}"')
+                cur.execute(
+                    "DELETE FROM events_default WHERE created_at < make_date(%s, %s, 1)",
+                    (months // 12, months % 12 + 1),
+                )
+                default_deleted = cur.rowcount
+        conn.commit()
+        return {
+            "partitions_created": created, "days_rolled_up": rolled_up,
+            "partitions_dropped": dropped, "default_rows_deleted": default_deleted,
+        }
+
+
+# ── scan archive ──────────────────────────────────────────
+#
+# Scans older than the retention age move to scans_archive in small
+# batches (see services/archive.py). Each batch row-locks only the rows it
+# moves, copies them with the bulky fields compressed and deletes them from
+# scans in the same transaction. Batches go strictly oldest first (no SKIP
+# LOCKED: a batch waits for a locked row rather than jumping past it), so at
+# any point every archived scan is older than every scan left in scans --
+# get_history relies on that to continue a page in the archive.
+
+SCAN_ARCHIVE_COLUMNS = (
+    "id, user_id, created_at, direction, interest_score, red_flag_risk, emotional_distance, "
+    "ghost_probability, reply_window, confidence, hidden_signals_count, archetype, summary, enriched, detail"
+)
+
+
+def compress_detail(scan: dict) -> bytes:
+    import json
+    import zlib
+    detail = {k: scan.get(k) for k in ("message_text", "hidden_signals", "replies")}
+    return zlib.compress(json.dumps(detail, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def decompress_detail(blob) -> dict:
+    import json
+    import zlib
+    return json.loads(zlib.decompress(bytes(blob))) if blob else {}
+
+
+@timed("db")
+def archive_scan_batch(older_than_days: int, batch_size: int) -> dict:
+    """Move up to batch_size scans older than older_than_days into scans_archive."""
+    with get_conn(request_scoped=False) as conn:
         with conn.cursor() as cur:
             cur.execute(
-                "UPDATE stripe_sessions SET status='completed' WHERE stripe_session_id=%s RETURNING user_id, plan",
-                (stripe_session_id,),
+                """SELECT s.*, pg_column_size(s.*) AS row_bytes FROM scans s
+                   WHERE s.created_at < NOW() - make_interval(days => %s)
+                   ORDER BY s.created_at, s.id
+                   LIMIT %s
+                   FOR UPDATE""",
+                (older_than_days, batch_size),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                conn.rollback()
+                return {"moved": 0, "raw_bytes": 0, "archived_bytes": 0}
+            values = []
+            for r in rows:
+                detail = compress_detail(r)
+                values.append((
+                    r["id"], r["user_id"], r["created_at"], r["direction"], r["interest_score"],
+                    r["red_flag_risk"], r["emotional_distance"], r["ghost_probability"], r["reply_window"],
+                    r["confidence"], r["hidden_signals_count"], r["archetype"], r["summary"], r["enriched"],
+                    psycopg2.Binary(detail),
+                ))
+            execute_values(
+                cur,
+                f"INSERT INTO scans_archive ({SCAN_ARCHIVE_COLUMNS}) VALUES %s ON CONFLICT (id) DO NOTHING",
+                values,
+                page_size=len(values),
             )
+            cur.execute(
+                "SELECT COALESCE(SUM(pg_column_size(a.*)), 0) AS bytes FROM scans_archive a WHERE id = ANY(%s::uuid[])",
+                ([r["id"] for r in rows],),
+            )
+            archived_bytes = cur.fetchone()["bytes"]
+            cur.execute("DELETE FROM scans WHERE id = ANY(%s::uuid[])", ([r["id"] for r in rows],))
+            moved = cur.rowcount
+            cur.execute(
+                "UPDATE users SET has_archived_scans = TRUE WHERE id = ANY(%s::uuid[]) AND NOT has_archived_scans",
+                (list({r["user_id"] for r in rows}),),
+            )
+        conn.commit()
+        return {
+            "moved": moved,
+            "raw_bytes": sum(r["row_bytes"] for r in rows),
+            "archived_bytes": int(archived_bytes),
+        }
+
+
+def scan_storage() -> dict:
+    """On-disk bytes of scans and scans_archive, indexes and TOAST included."""
+    with get_conn(request_scoped=False) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """SELECT pg_total_relation_size('scans') AS scans_bytes,
+                          pg_indexes_size('scans') AS scans_index_bytes,
+                          pg_total_relation_size('scans_archive') AS archive_bytes,
+                          (SELECT COUNT(*) FROM scans_archive) AS archive_rows"""
+            )
+            row = dict(cur.fetchone())
+        conn.rollback()
+        return row
+
+
+def vacuum_scans():
+    """VACUUM (ANALYZE) scans so deleted rows' space is reusable (it cannot run
+    inside a transaction, so this borrows a connection in autocommit)."""
+    conn = _checkout()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM (ANALYZE) scans")
+    finally:
+        conn.autocommit = False
+        _checkin(conn)
+
+
+@timed("db")
+def get_archived_scan(scan_id, user_id=None):
+    """An archived scan shaped like a scans row (detail decompressed)."""
+    with read_conn(user_id) as conn:
+        with conn.cursor() as cur:
+            if user_id is None:
+                cur.execute("SELECT * FROM scans_archive WHERE id = %s", (scan_id,))
+            else:
+                cur.execute("SELECT * FROM scans_archive WHERE id = %s AND user_id = %s", (scan_id, user_id))
             row = cur.fetchone()
+    return archived_scan(row) if row else None
+
+
+def archived_scan(row) -> dict:
+    """A scans_archive row shaped like a scans row (detail decompressed)."""
+    scan = dict(row)
+    scan.update(decompress_detail(scan.pop("detail")))
+    return scan
+
+
+# ── stripe webhook events ─────────────────────────────────
+
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.environ.get("STRIPE_EVENT_MAX_ATTEMPTS", "5"))
+
+
+@timed("db")
+def insert_stripe_event(event_id: str, event_type: str, payload: str, created: int) -> bool:
+    """Record a verified webhook event. False if it was already received."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """INSERT INTO stripe_events (id, type, payload, stripe_created)
+                   VALUES (%s, %s, %s, to_timestamp(%s) AT TIME ZONE 'UTC')
+                   ON CONFLICT (id) DO NOTHING""",
+                (event_id, event_type, payload, created),
+            )
+            inserted = cur.rowcount == 1
+        conn.commit()
+        return inserted
+
+
+@timed("db")
+def apply_stripe_events(limit: int = 50) -> tuple[int, list]:
+    """Apply up to limit pending events, oldest first, in one transaction.
+
+    Returns (events taken, unlocks applied). A failing event is rolled back
+    to its savepoint and retried on a later run, up to STRIPE_EVENT_MAX_ATTEMPTS.
+    """
+    with get_conn(request_scoped=False) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """SELECT id, type, payload FROM stripe_events
+                   WHERE processed_at IS NULL AND attempts < %s
+                   ORDER BY stripe_created, received_at
+                   LIMIT %s
+                   FOR UPDATE SKIP LOCKED""",
+                (STRIPE_EVENT_MAX_ATTEMPTS, limit),
+            )
+            events = cur.fetchall()
+            unlocks = []
+            for event in events:
+                cur.execute("SAVEPOINT stripe_event")
+                try:
+                    unlock = _apply_stripe_event(cur, event)
+                except Exception as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT stripe_event")
+                    cur.execute(
+                        "UPDATE stripe_events SET attempts = attempts + 1, error = %s WHERE id = %s",
+                        (str(e), event["id"]),
+                    )
+                    print(f"Stripe event {event['id']} failed: {e}")
+                    continue
+                cur.execute(
+                    "UPDATE stripe_events SET processed_at = NOW(), attempts = attempts + 1, error = NULL WHERE id = %s",
+                    (event["id"],),
+                )
+                if unlock:
+                    unlocks.append(unlock)
+        conn.commit()
+        return len(events), unlocks
+
+
+@timed("db")
+def purge_stripe_events(max_age_seconds: int, batch_size: int = 1000) -> int:
+    """Delete stripe_events applied more than max_age_seconds ago, batch_size
+    rows per transaction. Failed events are kept. Returns how many were deleted."""
+    deleted = 0
+    with get_conn(request_scoped=False) as conn:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """DELETE FROM stripe_events WHERE id IN (
+                           SELECT id FROM stripe_events
+                           WHERE processed_at < NOW() - make_interval(secs => %s)
+                           LIMIT %s)""",
+                    (max_age_seconds, batch_size),
+                )
+                count = cur.rowcount
             conn.commit()
-            if row:
-                return dict(row)
-    finally:
-        conn.close()
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+
+def _apply_stripe_event(cur, event: dict) -> dict | None:
+    if event["type"] == "checkout.session.completed":
+        session = event["payload"]["data"]["object"]
+        metadata = session.get("metadata") or {}
+        if metadata.get("user_id") and metadata.get("plan"):
+            return _complete_checkout(cur, session["id"], metadata["user_id"], metadata["plan"])
     return None
 
 
-def get_user_by_id(user_id):
-    conn = get_conn()
-    try:
+# ── analysis cache ────────────────────────────────────────
+
+GET_CACHED_ANALYSIS_SQL = """UPDATE analysis_cache SET hits = hits + 1
+                             WHERE cache_key = %s AND created_at > NOW() - make_interval(secs => %s)
+                             RETURNING result"""
+PUT_CACHED_ANALYSIS_SQL = """INSERT INTO analysis_cache (cache_key, result) VALUES (%s, %s::jsonb)
+                             ON CONFLICT (cache_key) DO UPDATE SET result = EXCLUDED.result, created_at = NOW()"""
+
+
+def purge_cached_analyses(max_age_seconds: int, batch_size: int) -> int:
+    """Delete analysis_cache rows older than max_age_seconds, batch_size rows
+    per transaction. Returns how many were deleted."""
+    deleted = 0
+    with get_conn(request_scoped=False) as conn:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """DELETE FROM analysis_cache WHERE cache_key IN (
+                           SELECT cache_key FROM analysis_cache
+                           WHERE created_at < NOW() - make_interval(secs => %s)
+                           LIMIT %s)""",
+                    (max_age_seconds, batch_size),
+                )
+                count = cur.rowcount
+            conn.commit()
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+
+@timed("db")
+def get_cached_analysis(cache_key: str, max_age_seconds: int):
+    with get_conn(request_scoped=False) as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT * FROM users WHERE id = %s", (user_id,))
+            cur.execute(GET_CACHED_ANALYSIS_SQL, (cache_key, max_age_seconds))
             row = cur.fetchone()
-            return dict(row) if row else None
-    finally:
-        conn.close()
+        conn.commit()
+        return row["result"] if row else None
+
+
+@timed("db")
+def put_cached_analysis(cache_key: str, result: dict):
+    import json
+    with get_conn(request_scoped=False) as conn:
+        with conn.cursor() as cur:
+            cur.execute(PUT_CACHED_ANALYSIS_SQL, (cache_key, json.dumps(result)))
+        conn.commit()
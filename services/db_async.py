@@ -0,0 +1,159 @@
+import os
+
+from psycopg.rows import dict_row
+from psycopg.types.string import TextLoader
+from psycopg_pool import AsyncConnectionPool
+
+from services import db
+from services.db import DATABASE_URL, FREE_SCANS_PER_DAY, is_unlocked
+from services.metrics import timed
+
+DB_ASYNC_POOL_MIN = int(os.environ.get("DB_ASYNC_POOL_MIN", "1"))
+DB_ASYNC_POOL_MAX = int(os.environ.get("DB_ASYNC_POOL_MAX", "20"))
+
+
+# ── async connection pool ─────────────────────────────────
+#
+# The helpers asgi.py needs on its hot paths, on psycopg 3's asyncio driver.
+# They run the SQL constants from services/db.py, so the two drivers cannot
+# drift apart; everything else (jobs, webhooks, admin) stays on the sync pool.
+# The pool is opened and closed by asgi.py's lifespan, i.e. once per worker
+# process after the fork.
+
+_pool = None
+_replica_pool = None
+
+
+async def _configure(conn):
+    # Match psycopg2: uuid columns come back as str, not uuid.UUID.
+    conn.adapters.register_loader("uuid", TextLoader)
+
+
+def _new_pool(dsn: str) -> AsyncConnectionPool:
+    return AsyncConnectionPool(
+        dsn,
+        min_size=DB_ASYNC_POOL_MIN,
+        max_size=DB_ASYNC_POOL_MAX,
+        kwargs={"row_factory": dict_row},
+        configure=_configure,
+        check=AsyncConnectionPool.check_connection if db.DB_POOL_PING else None,
+        open=False,
+    )
+
+
+async def open_pool():
+    global _pool, _replica_pool
+    _pool = _new_pool(DATABASE_URL)
+    await _pool.open()
+    if db.DATABASE_REPLICA_URL:
+        _replica_pool = _new_pool(db.DATABASE_REPLICA_URL)
+        await _replica_pool.open()
+
+
+async def close_pool():
+    global _pool, _replica_pool
+    for pool in (_pool, _replica_pool):
+        if pool is not None:
+            await pool.close()
+    _pool = _replica_pool = None
+
+
+def _connection():
+    if _pool is None:
+        raise RuntimeError("Async pool is not open (run under asgi.py's lifespan).")
+    # Commits on a clean exit, rolls back on an exception.
+    return _pool.connection()
+
+
+def _read_connection(user_id=None):
+    # Same routing as db.read_conn: replica unless this user wrote recently
+    if _replica_pool is None or db.prefers_primary(user_id):
+        return _connection()
+    return _replica_pool.connection()
+
+
+# ── helpers (see the sync versions in services/db.py) ─────
+
+@timed("db")
+async def get_or_create_user(device_id: str) -> dict:
+    async with _connection() as conn:
+        cur = await conn.execute(db.USER_BY_DEVICE_SQL, (device_id,))
+        row = await cur.fetchone()
+        if row:
+            return row
+        cur = await conn.execute(db.CREATE_USER_SQL, (device_id,))
+        return await cur.fetchone()
+
+
+@timed("db")
+async def reserve_scan(device_id: str) -> tuple[dict, bool, bool]:
+    async with _connection() as conn:
+        cur = await conn.execute(db.RESERVE_USER_SQL, (device_id,))
+        user = await cur.fetchone()
+        unlocked = is_unlocked(user)
+        reserved = False
+        if not unlocked and user["free_scans_used_today"] < FREE_SCANS_PER_DAY:
+            cur = await conn.execute(db.RESERVE_FREE_SCAN_SQL, (1, user["id"]))
+            user = await cur.fetchone()
+            reserved = True
+        return user, unlocked, reserved
+
+
+@timed("db")
+async def release_free_scan(user_id):
+    async with _connection() as conn:
+        await conn.execute(db.RELEASE_FREE_SCAN_SQL, (1, user_id))
+
+
+@timed("db")
+async def save_scan(user_id, data: dict) -> dict:
+    async with _connection() as conn:
+        cur = await conn.execute(db.INSERT_SCAN_SQL, db.scan_params(user_id, data))
+        scan = await cur.fetchone()
+        await conn.execute(db.TRENDS_UPSERT_SQL, db.trends_params(scan))
+    db.note_write(user_id)
+    return scan
+
+
+@timed("db")
+async def get_history(user_id: str, limit: int = 10, before: tuple = None) -> list:
+    async with _read_connection(user_id) as conn:
+        cur = await conn.execute(*db.history_query(user_id, limit, before))
+        rows, archived = db.live_history(await cur.fetchall())
+        if len(rows) < limit and archived:
+            cur = await conn.execute(
+                *db.history_query(user_id, limit - len(rows), db.archive_before(rows, before), archive=True)
+            )
+            rows += await cur.fetchall()
+        return rows
+
+
+async def entitlement_bumps(within_seconds: int) -> dict:
+    async with _connection() as conn:
+        cur = await conn.execute(db.ENTITLEMENT_BUMPS_SQL, (within_seconds,))
+        return {str(r["id"]): r["entitlement_version"] for r in await cur.fetchall()}
+
+
+@timed("db")
+async def enqueue_scan_job(user_id, message_text: str, direction: str, reserved: bool,
+                           max_attempts: int = 3, tier: str = "full") -> dict:
+    async with _connection() as conn:
+        cur = await conn.execute(
+            db.ENQUEUE_SCAN_JOB_SQL, (user_id, message_text, direction, reserved, max_attempts, tier),
+        )
+        return await cur.fetchone()
+
+
+@timed("db")
+async def get_cached_analysis(cache_key: str, max_age_seconds: int):
+    async with _connection() as conn:
+        cur = await conn.execute(db.GET_CACHED_ANALYSIS_SQL, (cache_key, max_age_seconds))
+        row = await cur.fetchone()
+        return row["result"] if row else None
+
+
+@timed("db")
+async def put_cached_analysis(cache_key: str, result: dict):
+    import json
+    async with _connection() as conn:
+        await conn.execute(db.PUT_CACHED_ANALYSIS_SQL, (cache_key, json.dumps(result)))
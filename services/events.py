@@ -0,0 +1,144 @@
+import os
+import atexit
+import threading
+from collections import deque
+
+from services.db import insert_events, touch_users, event_maintenance
+from services.metrics import EVENTS
+
+EVENT_BATCH_SIZE = int(os.environ.get("EVENT_BATCH_SIZE", "200"))
+EVENT_FLUSH_INTERVAL = float(os.environ.get("EVENT_FLUSH_INTERVAL", "2.0"))
+EVENT_BUFFER_MAX = int(os.environ.get("EVENT_BUFFER_MAX", "10000"))
+# Partition upkeep and daily rollup (see migrations/009), run by worker.py;
+# 0 = off, in which case events past the last monthly partition go to
+# events_default (012).
+EVENT_MAINTENANCE_INTERVAL = int(os.environ.get("EVENT_MAINTENANCE_INTERVAL", "3600"))
+EVENT_PARTITIONS_AHEAD = int(os.environ.get("EVENT_PARTITIONS_AHEAD", "3"))
+# Drop raw events partitions older than this many months (after rolling
+# them up); 0 = keep everything. Opt-in: dropped events can't be recovered.
+EVENT_RETENTION_MONTHS = int(os.environ.get("EVENT_RETENTION_MONTHS", "0"))
+
+
+# ── buffered event pipeline ───────────────────────────────
+#
+# log_event() only appends to an in-memory deque. A background thread per
+# process writes the buffer to the events table in multi-row batches when it
+# reaches EVENT_BATCH_SIZE or every EVENT_FLUSH_INTERVAL seconds. When the
+# buffer is full new events are dropped and counted rather than blocking the
+# request.
+#
+# users.last_seen rides along: touch_user() only records the id, and each
+# flush updates every user seen since the last one in a single statement.
+
+_buffer = deque()
+_seen = set()
+_cond = threading.Condition()
+_flush_lock = threading.Lock()
+_thread_pid = None
+
+
+def log_event(user_id, event_name: str, meta: dict = None):
+    """Queue an analytics event for the next batch insert."""
+    _ensure_flusher()
+    with _cond:
+        if len(_buffer) >= EVENT_BUFFER_MAX:
+            EVENTS.labels("dropped").inc()
+            return
+        _buffer.append((user_id, event_name, meta or {}))
+        EVENTS.labels("queued").inc()
+        if len(_buffer) >= EVENT_BATCH_SIZE:
+            _cond.notify()
+
+
+def touch_user(user_id):
+    """Mark the user as active; last_seen is written with the next flush."""
+    _ensure_flusher()
+    with _cond:
+        if len(_seen) < EVENT_BUFFER_MAX:
+            _seen.add(user_id)
+
+
+def flush_events() -> int:
+    """Write everything currently buffered. Returns the number of rows written."""
+    written = 0
+    with _flush_lock:
+        _flush_seen()
+        while True:
+            with _cond:
+                batch = [_buffer.popleft() for _ in range(min(len(_buffer), EVENT_BATCH_SIZE))]
+            if not batch:
+                return written
+            try:
+                insert_events(batch)
+                ok = len(batch)
+            except Exception as e:
+                print(f"Event flush failed ({e}); retrying {len(batch)} events one at a time")
+                ok = _insert_one_by_one(batch)
+            written += ok
+            EVENTS.labels("written").inc(ok)
+            if ok < len(batch):
+                EVENTS.labels("failed").inc(len(batch) - ok)
+                return written
+
+
+def _insert_one_by_one(batch: list) -> int:
+    # One bad row fails the whole multi-row INSERT; this keeps the rest.
+    ok = 0
+    for row in batch:
+        try:
+            insert_events([row])
+            ok += 1
+        except Exception as e:
+            print(f"Dropped event {row[1]!r}: {e}")
+    return ok
+
+
+def _flush_seen():
+    with _cond:
+        user_ids = list(_seen)
+        _seen.clear()
+    if not user_ids:
+        return
+    try:
+        touch_users(user_ids)
+    except Exception as e:
+        print(f"last_seen update failed for {len(user_ids)} users: {e}")
+
+
+def run_event_maintenance() -> dict | None:
+    """Partition upkeep, rollup and retention for events. None if another
+    process holds the maintenance lock."""
+    result = event_maintenance(EVENT_PARTITIONS_AHEAD, EVENT_RETENTION_MONTHS)
+    if result:
+        print(
+            f"events maintenance: created={result['partitions_created']} "
+            f"rolled_up={result['days_rolled_up']} dropped={result['partitions_dropped']} "
+            f"default_rows_deleted={result['default_rows_deleted']}"
+        )
+    return result
+
+
+def _run_flusher():
+    while True:
+        with _cond:
+            if len(_buffer) < EVENT_BATCH_SIZE:
+                _cond.wait(EVENT_FLUSH_INTERVAL)
+        flush_events()
+
+
+def _ensure_flusher():
+    global _thread_pid
+    pid = os.getpid()
+    if _thread_pid == pid:
+        return
+    with _cond:
+        if _thread_pid == pid:
+            return
+        # Events queued before a fork belong to the parent, which flushes them.
+        _buffer.clear()
+        _seen.clear()
+        _thread_pid = pid
+        threading.Thread(target=_run_flusher, name="event-flusher", daemon=True).start()
+
+
+atexit.register(flush_events)
@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import math
+
+# Fitted weights written by scripts/calibrate_heuristics.py; the defaults
+# below are used until that has been run.
+HEURISTIC_WEIGHTS = os.environ.get(
+    "HEURISTIC_WEIGHTS", os.path.join(os.path.dirname(__file__), "heuristic_weights.json"),
+)
+
+
+# ── local heuristic scorer ────────────────────────────────
+#
+# A rough, instant stand-in for the model: a fixed feature vector per message
+# (length, punctuation, emoji, hits in small word/phrase tables) and one
+# linear model per score. Used for the provisional meters streamed before the
+# model answers and as the whole answer when the AI layer is unavailable.
+# Costs one regex pass and a few dot products -- well under a millisecond.
+
+FEATURES = (
+    "length", "words", "short", "questions", "exclaims", "emoji", "ellipsis", "caps",
+    "you", "me", "warm", "plans", "distance", "latency", "apology", "control", "direction_me",
+)
+SCORES = ("interest_score", "red_flag_risk", "emotional_distance", "ghost_probability")
+ARCHETYPES = ("Hot/Cold", "Avoidant-Leaning", "Anxious-Leaning", "Direct Communicator", "Unclear Pattern")
+
+# word or phrase -> lexical feature
+LEXICON = {
+    **dict.fromkeys((
+        "love", "miss", "cute", "babe", "baby", "excited", "haha", "hahaha", "lol", "lmao", "xx", "xoxo",
+        "<3", "can't wait", "cant wait", "so glad", "thinking about you", "had fun", "you're sweet",
+    ), "warm"),
+    **dict.fromkeys((
+        "tomorrow", "tonight", "weekend", "let's", "lets", "we should", "see you", "when are you",
+        "are you free", "dinner", "drinks", "coffee", "next week", "pick you up",
+    ), "plans"),
+    **dict.fromkeys((
+        "busy", "maybe", "idk", "whatever", "fine", "later", "k", "kk", "ok", "okay", "sure", "we'll see",
+        "not sure", "no worries", "cool", "nvm", "hmm",
+    ), "distance"),
+    **dict.fromkeys((
+        "just saw", "sorry for the late", "late reply", "slow reply", "been busy", "been crazy",
+        "fell asleep", "got distracted", "been swamped", "sorry i was",
+    ), "latency"),
+    **dict.fromkeys(("sorry", "apologies", "my bad"), "apology"),
+    **dict.fromkeys((
+        "why didn't you", "why did you", "who was", "where were you", "your fault", "don't tell",
+        "delete", "jealous", "you always", "you never", "answer me", "crazy", "prove",
+    ), "control"),
+}
+_PHRASES = sorted((k for k in LEXICON if " " in k), key=len, reverse=True)
+_PHRASE_RE = re.compile("|".join(re.escape(p) for p in _PHRASES))
+_WORD_RE = re.compile(r"<3|[a-z']+")
+_EMOJI_RE = re.compile("[\U0001F300-\U0001FAFF☀-➿]")
+_INDEX = {name: i for i, name in enumerate(FEATURES)}
+
+# Hand-set starting point; scripts/calibrate_heuristics.py replaces these.
+DEFAULT_WEIGHTS = {
+    "features": list(FEATURES),
+    "scores": {
+        "interest_score": [45, {
+            "length": 12, "questions": 14, "exclaims": 6, "emoji": 8, "warm": 20, "plans": 22,
+            "short": -14, "distance": -18, "latency": -4, "you": 6,
+        }],
+        "red_flag_risk": [20, {
+            "control": 45, "caps": 12, "questions": 6, "distance": 4, "warm": -6,
+        }],
+        "emotional_distance": [40, {
+            "short": 22, "distance": 24, "latency": 10, "warm": -22, "plans": -14, "emoji": -6,
+            "questions": -6, "length": -8,
+        }],
+        "ghost_probability": [40, {
+            "short": 20, "distance": 22, "latency": 14, "ellipsis": 4, "plans": -22, "warm": -14,
+            "questions": -10, "length": -6, "apology": 4,
+        }],
+    },
+    # Typical (interest, distance, ghost) per archetype; nearest one wins
+    "archetypes": {
+        "Hot/Cold": [55, 50, 50],
+        "Avoidant-Leaning": [30, 70, 65],
+        "Anxious-Leaning": [70, 30, 35],
+        "Direct Communicator": [75, 20, 20],
+        "Unclear Pattern": [45, 45, 45],
+    },
+}
+
+
+def _compile(weights: dict) -> dict:
+    # Dense vectors in FEATURES order, so scoring is a plain dot product
+    names = weights.get("features", FEATURES)
+    scores = {}
+    for score in SCORES:
+        bias, coefs = weights["scores"][score]
+        if isinstance(coefs, dict):
+            coefs = [coefs.get(name, 0.0) for name in FEATURES]
+        else:
+            by_name = dict(zip(names, coefs))
+            coefs = [by_name.get(name, 0.0) for name in FEATURES]
+        scores[score] = (float(bias), [float(c) for c in coefs])
+    return {"scores": scores, "archetypes": weights.get("archetypes", DEFAULT_WEIGHTS["archetypes"])}
+
+
+def load_weights(path: str = HEURISTIC_WEIGHTS) -> dict:
+    try:
+        with open(path) as f:
+            return _compile(json.load(f))
+    except FileNotFoundError:
+        return _compile(DEFAULT_WEIGHTS)
+    except (ValueError, KeyError) as e:
+        print(f"Ignoring heuristic weights in {path}: {e}")
+        return _compile(DEFAULT_WEIGHTS)
+
+
+_model = load_weights()
+
+
+def features(message_text: str, direction: str = "they") -> list:
+    text = message_text.lower()
+    words = _WORD_RE.findall(text)
+    n = len(words) or 1
+    counts = dict.fromkeys(("warm", "plans", "distance", "latency", "apology", "control"), 0)
+    for phrase in _PHRASE_RE.findall(text):
+        counts[LEXICON[phrase]] += 1
+    for w in words:
+        kind = LEXICON.get(w)
+        if kind:
+            counts[kind] += 1
+    letters = sum(c.isalpha() for c in message_text) or 1
+
+    x = [0.0] * len(FEATURES)
+    x[_INDEX["length"]] = min(math.log1p(len(message_text)) / 6, 1.0)
+    x[_INDEX["words"]] = min(n / 60, 1.0)
+    x[_INDEX["short"]] = 1.0 if len(words) <= 3 else 0.0
+    x[_INDEX["questions"]] = min(message_text.count("?"), 3) / 3
+    x[_INDEX["exclaims"]] = min(message_text.count("!"), 3) / 3
+    x[_INDEX["emoji"]] = min(len(_EMOJI_RE.findall(message_text)), 3) / 3
+    x[_INDEX["ellipsis"]] = 1.0 if "..." in message_text or "…" in message_text else 0.0
+    x[_INDEX["caps"]] = sum(c.isupper() for c in message_text) / letters if len(message_text) > 8 else 0.0
+    x[_INDEX["you"]] = min(sum(w in ("you", "your", "you're", "u") for w in words) / n * 5, 1.0)
+    x[_INDEX["me"]] = min(sum(w in ("i", "me", "my", "i'm") for w in words) / n * 5, 1.0)
+    for kind, count in counts.items():
+        x[_INDEX[kind]] = min(count, 3) / 3
+    x[_INDEX["direction_me"]] = 1.0 if direction == "me" else 0.0
+    return x
+
+
+def predict(x: list, model: dict = None) -> dict:
+    model = model or _model
+    return {
+        score: max(0, min(100, round(bias + sum(w * v for w, v in zip(coefs, x)))))
+        for score, (bias, coefs) in model["scores"].items()
+    }
+
+
+def archetype_for(scores: dict, model: dict = None) -> str:
+    model = model or _model
+    point = (scores["interest_score"], scores["emotional_distance"], scores["ghost_probability"])
+    return min(
+        model["archetypes"].items(),
+        key=lambda kv: sum((a - b) ** 2 for a, b in zip(point, kv[1])),
+    )[0]
+
+
+def _reply_window(ghost: int) -> str:
+    if ghost < 30:
+        return "Likely 1-3 hours"
+    if ghost < 60:
+        return "Likely 6-12 hours"
+    return "Likely 1-2 days"
+
+
+def score(message_text: str, direction: str = "they") -> dict:
+    """A provisional core-tier analysis (same fields as ai.ScanCore)."""
+    x = features(message_text, direction)
+    scores = predict(x)
+    archetype = archetype_for(scores)
+    signals = sum(1 for kind in ("warm", "plans", "distance", "latency", "apology", "control") if x[_INDEX[kind]])
+    return {
+        **scores,
+        "archetype": archetype,
+        "summary": f"Quick read: the pattern suggests {archetype.lower()} signals. "
+                   "A full scan will sharpen this.",
+        "reply_window": _reply_window(scores["ghost_probability"]),
+        "confidence": "Low",
+        "hidden_signals_count": max(1, min(5, signals)),
+    }
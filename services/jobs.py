@@ -0,0 +1,183 @@
+import os
+import time
+import random
+import signal
+import threading
+
+from services.db import (
+    claim_scan_job, complete_scan_job, complete_enrich_job, fail_scan_job,
+    requeue_stale_scan_jobs, release_free_scan, scan_job_stats, get_scan, enqueue_enrich_jobs, purge_scan_jobs,
+)
+from services.events import log_event, flush_events, run_event_maintenance, EVENT_MAINTENANCE_INTERVAL
+from services.cache import purge_expired as purge_expired_analyses
+from services.ai import analyze_message, enrich_analysis
+from services.resilience import AIUnavailable
+from services.stripe_payments import process_stripe_events, purge_processed_events
+
+SCAN_WORKER_CONCURRENCY = int(os.environ.get("SCAN_WORKER_CONCURRENCY", "4"))
+SCAN_JOB_MAX_ATTEMPTS = int(os.environ.get("SCAN_JOB_MAX_ATTEMPTS", "3"))
+SCAN_JOB_POLL_INTERVAL = float(os.environ.get("SCAN_JOB_POLL_INTERVAL", "0.5"))
+SCAN_JOB_RETRY_BASE = float(os.environ.get("SCAN_JOB_RETRY_BASE", "2.0"))
+# A job still "running" after this long belongs to a dead worker.
+SCAN_JOB_TIMEOUT = int(os.environ.get("SCAN_JOB_TIMEOUT", "120"))
+SCAN_JOB_STATS_INTERVAL = int(os.environ.get("SCAN_JOB_STATS_INTERVAL", "60"))
+
+
+# ── background scan worker ────────────────────────────────
+#
+# Run with `python worker.py`. Each of SCAN_WORKER_CONCURRENCY threads claims
+# one job at a time from scan_jobs (SKIP LOCKED, so any number of worker
+# processes can share the table), runs the AI call and stores the scan.
+# Threads are enough here: the work is almost entirely waiting on OpenAI.
+
+_stop = threading.Event()
+_lock = threading.Lock()
+_stats = {"done": 0, "retried": 0, "failed": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+
+def process_one() -> bool:
+    """Claim and run a single job. Returns False if there was nothing to do."""
+    job = claim_scan_job()
+    if job is None:
+        return False
+
+    wait = float(job["queued_seconds"] or 0)
+    with _lock:
+        _stats["wait_seconds_total"] += wait
+        _stats["wait_seconds_max"] = max(_stats["wait_seconds_max"], wait)
+
+    try:
+        if job["kind"] == "enrich":
+            _run_enrich_job(job)
+        else:
+            result = analyze_message(job["message_text"], job["direction"], tier=job["tier"])
+            result["message_text"] = job["message_text"]
+            result["direction"] = job["direction"]
+            complete_scan_job(job, result)
+    except Exception as e:
+        delay = SCAN_JOB_RETRY_BASE * 2 ** (job["attempts"] - 1) * random.uniform(0.5, 1.5)
+        if isinstance(e, AIUnavailable):
+            # Don't hammer an open breaker; wait it out
+            delay = max(delay, e.retry_after)
+        if fail_scan_job(job, str(e), delay):
+            if job["reserved"]:
+                release_free_scan(job["user_id"])
+            with _lock:
+                _stats["failed"] += 1
+            print(f"Scan job {job['id']} failed after {job['attempts']} attempts: {e}")
+        else:
+            with _lock:
+                _stats["retried"] += 1
+        return True
+
+    if job["kind"] != "enrich":
+        log_event(job["user_id"], "scan_completed", {"async": True})
+    with _lock:
+        _stats["done"] += 1
+    return True
+
+
+def _run_enrich_job(job: dict):
+    scan = get_scan(job["scan_id"], job["user_id"])
+    if scan is None or scan["enriched"]:
+        # Deleted, or already enriched on view: nothing left to generate
+        complete_enrich_job(job, None)
+        return
+    enrichment = enrich_analysis(scan["message_text"], scan["direction"], scan)
+    complete_enrich_job(job, enrichment)
+
+
+def worker_stats() -> dict:
+    with _lock:
+        return dict(_stats)
+
+
+def _worker_loop():
+    while not _stop.is_set():
+        try:
+            busy = process_one()
+        except Exception as e:
+            print(f"Scan worker error: {e}")
+            busy = False
+        if not busy:
+            _stop.wait(SCAN_JOB_POLL_INTERVAL)
+
+
+def _report():
+    # Safety net for webhook events the web process didn't get to apply
+    try:
+        for unlock in process_stripe_events():
+            enqueue_enrich_jobs(unlock["user_id"])
+        purge_processed_events()
+    except Exception as e:
+        print(f"Stripe event processing failed: {e}")
+
+    try:
+        requeued, failed = requeue_stale_scan_jobs(SCAN_JOB_TIMEOUT)
+        for job in failed:
+            if job["reserved"]:
+                release_free_scan(job["user_id"])
+            with _lock:
+                _stats["failed"] += 1
+            print(f"Scan job {job['id']} failed: worker timed out on its last attempt")
+        queue = scan_job_stats()
+    except Exception as e:
+        print(f"Scan queue stats unavailable: {e}")
+        return
+    stats = worker_stats()
+    print(
+        f"scan queue: queued={queue['queued']} running={queue['running']} "
+        f"oldest_queued={float(queue['oldest_queued_seconds']):.1f}s failed_1h={queue['failed_last_hour']} "
+        f"requeued={requeued} | worker: done={stats['done']} retried={stats['retried']} "
+        f"failed={stats['failed']} max_wait={stats['wait_seconds_max']:.1f}s"
+    )
+
+
+def run_maintenance() -> bool:
+    """Events maintenance, then the purges that ride along with it. Only one
+    process at a time gets through (advisory lock); returns False for the
+    others, and when maintenance fails."""
+    try:
+        if run_event_maintenance() is None:
+            return False
+    except Exception as e:
+        print(f"Events maintenance failed: {e}")
+        return False
+    for name, purge in (("Analysis cache", purge_expired_analyses), ("Scan job", purge_scan_jobs)):
+        try:
+            purge()
+        except Exception as e:
+            print(f"{name} purge failed: {e}")
+    return True
+
+
+def run_worker(concurrency: int = SCAN_WORKER_CONCURRENCY):
+    """Run scan worker threads until SIGTERM/SIGINT."""
+    def handle_signal(signum, frame):
+        _stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    threads = [
+        threading.Thread(target=_worker_loop, name=f"scan-worker-{i}", daemon=True)
+        for i in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    print(f"Scan worker started with {concurrency} threads.")
+
+    # Maintenance runs here rather than in web processes. Several workers
+    # start at random offsets; the advisory lock lets one through.
+    next_maintenance = time.monotonic() + random.uniform(0, SCAN_JOB_STATS_INTERVAL)
+    while not _stop.wait(SCAN_JOB_STATS_INTERVAL):
+        _report()
+        if EVENT_MAINTENANCE_INTERVAL > 0 and time.monotonic() >= next_maintenance:
+            next_maintenance = time.monotonic() + EVENT_MAINTENANCE_INTERVAL
+            run_maintenance()
+
+    # Let in-flight jobs finish; anything cut off is requeued after SCAN_JOB_TIMEOUT
+    for t in threads:
+        t.join(timeout=SCAN_JOB_TIMEOUT)
+    flush_events()
+    print("Scan worker stopped.")
@@ -0,0 +1,137 @@
+import os
+import time
+import inspect
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST, multiprocess,
+)
+
+# Under gunicorn, gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR at a shared
+# directory so /metrics aggregates every worker; otherwise metrics are per process.
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+_FAST = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+_SLOW = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+
+REQUEST_SECONDS = Histogram(
+    "ghostradar_request_seconds", "HTTP request time (until the response starts)",
+    ["endpoint", "method", "status"], buckets=_SLOW,
+)
+REQUEST_CPU_SECONDS = Histogram(
+    "ghostradar_request_cpu_seconds", "CPU time of the request thread (see services/profiling.py)",
+    ["endpoint", "method"], buckets=_FAST,
+)
+REQUEST_PHASE_SECONDS = Histogram(
+    "ghostradar_request_phase_seconds", "Time spent rendering templates and serializing JSON",
+    ["endpoint", "phase"], buckets=_FAST,
+)
+DB_SECONDS = Histogram("ghostradar_db_seconds", "Time spent in services/db.py helpers", ["helper"], buckets=_FAST)
+AI_SECONDS = Histogram("ghostradar_ai_seconds", "Time spent in OpenAI calls", ["call"], buckets=_SLOW)
+AI_RESILIENCE = Counter(
+    "ghostradar_ai_resilience_total", "Calls, retries, hedges and shed load in services/resilience.py", ["event"],
+)
+AI_TOKENS = Counter("ghostradar_ai_tokens_total", "OpenAI tokens used", ["call", "kind"])
+STRIPE_SECONDS = Histogram("ghostradar_stripe_seconds", "Time spent in Stripe API calls", ["call"], buckets=_SLOW)
+CACHE_LOOKUPS = Counter("ghostradar_analysis_cache_total", "Analysis cache lookups", ["result"])
+EVENTS = Counter("ghostradar_events_total", "Buffered analytics events", ["outcome"])
+SCAN_QUEUE = Gauge(
+    "ghostradar_scan_queue", "Scan job queue (sampled on scrape)", ["stat"], multiprocess_mode="mostrecent",
+)
+
+# Context variables rather than a thread-local: each sync request has its own
+# thread and each ASGI request its own task (see asgi.py), and both get their
+# own context.
+_timings: ContextVar = ContextVar("timings", default=None)
+_started: ContextVar = ContextVar("started", default=None)
+
+
+# ── per-request timing (Server-Timing) ────────────────────
+
+def begin_request():
+    _timings.set({})
+    _started.set(time.perf_counter())
+
+
+def record(name: str, seconds: float):
+    timings = _timings.get()
+    if timings is not None:
+        total, count = timings.get(name, (0.0, 0))
+        timings[name] = (total + seconds, count + 1)
+
+
+def server_timing() -> str:
+    """Server-Timing header value for the current request."""
+    timings = _timings.get() or {}
+    parts = [
+        f'{name};dur={total * 1000:.1f};desc="{count}x"'
+        for name, (total, count) in sorted(timings.items(), key=lambda kv: -kv[1][0])
+    ]
+    started = _started.get()
+    if started is not None:
+        parts.append(f"total;dur={(time.perf_counter() - started) * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def end_request(endpoint: str, method: str, status: int):
+    started = _started.get()
+    if started is not None:
+        REQUEST_SECONDS.labels(endpoint, method, str(status)).observe(time.perf_counter() - started)
+    _timings.set(None)
+    _started.set(None)
+
+
+# ── instrumentation hooks ─────────────────────────────────
+
+_HISTOGRAMS = {"db": DB_SECONDS, "ai": AI_SECONDS, "stripe": STRIPE_SECONDS}
+
+
+@contextmanager
+def timer(category: str, name: str):
+    """Time a block into the category histogram and the request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _HISTOGRAMS[category].labels(name).observe(elapsed)
+        record(f"{category}_{name}", elapsed)
+
+
+def timed(category: str):
+    """Decorator form of timer(), labelled with the function name.
+    Works on coroutine functions too."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timer(category, fn.__name__):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(category, fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_ai_usage(call: str, usage):
+    if usage is None:
+        return
+    AI_TOKENS.labels(call, "input").inc(usage.input_tokens or 0)
+    AI_TOKENS.labels(call, "output").inc(usage.output_tokens or 0)
+
+
+# ── exposition ────────────────────────────────────────────
+
+def render() -> tuple[bytes, str]:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    from prometheus_client import REGISTRY
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,118 @@
+import os
+import hashlib
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from services.db import DATABASE_URL, MIGRATION_LOCK
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "..", "migrations")
+
+_current = False
+
+
+# ── schema migrations ─────────────────────────────────────
+#
+# migrations/NNN_name.sql files are applied once each, in name order, and
+# recorded in schema_migrations. migrate() holds a session advisory lock for
+# the whole run, so concurrent deploys/boots queue behind one runner and then
+# find nothing left to do. It runs from gunicorn's master (on_starting),
+# worker.py and `flask migrate` -- never from app import, so web workers boot
+# without touching the schema.
+
+def migration_files() -> list:
+    return sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith(".sql"))
+
+
+def _read(name: str) -> tuple[str, str]:
+    with open(os.path.join(MIGRATIONS_DIR, name), "r") as f:
+        sql = f.read()
+    return sql, hashlib.sha256(sql.encode("utf-8")).hexdigest()
+
+
+def _connect():
+    # A dedicated connection: the pool may not exist yet (gunicorn master) and
+    # a session-level lock must not leak back into it.
+    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+
+
+def _applied(cur) -> dict:
+    cur.execute(
+        """CREATE TABLE IF NOT EXISTS schema_migrations (
+               version TEXT PRIMARY KEY,
+               checksum TEXT NOT NULL,
+               applied_at TIMESTAMP DEFAULT NOW()
+           )"""
+    )
+    cur.execute("SELECT version, checksum FROM schema_migrations")
+    return {r["version"]: r["checksum"] for r in cur.fetchall()}
+
+
+def migrate() -> list:
+    """Apply pending migrations under the advisory lock. Returns their names.
+
+    Stops at the first failing file (its transaction is rolled back and it
+    stays pending), so later migrations never run against a partial schema.
+    """
+    global _current
+    conn = _connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK,))
+        try:
+            with conn.cursor() as cur:
+                applied = _applied(cur)
+            conn.commit()
+
+            done = []
+            for name in migration_files():
+                sql, checksum = _read(name)
+                if name in applied:
+                    if applied[name] != checksum:
+                        print(f"Migration {name} changed after it was applied; not re-running it.")
+                    continue
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(sql)
+                        cur.execute(
+                            "INSERT INTO schema_migrations (version, checksum) VALUES (%s, %s)",
+                            (name, checksum),
+                        )
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Migration {name} failed: {e}")
+                    raise
+                print(f"Migration {name} applied.")
+                done.append(name)
+            _current = True
+            return done
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK,))
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def pending() -> list:
+    """Migration files not yet recorded in schema_migrations (one query)."""
+    conn = _connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL AS present")
+            if not cur.fetchone()["present"]:
+                return migration_files()
+            cur.execute("SELECT version FROM schema_migrations")
+            applied = {r["version"] for r in cur.fetchall()}
+        return [name for name in migration_files() if name not in applied]
+    finally:
+        conn.close()
+
+
+def schema_is_current() -> bool:
+    """Cached per process: once the schema is seen current, it stays current."""
+    global _current
+    if not _current:
+        _current = not pending()
+    return _current
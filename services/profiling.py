@@ -0,0 +1,313 @@
+import os
+import sys
+import time
+import atexit
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import before_render_template, template_rendered
+from flask.json.provider import DefaultJSONProvider
+
+from services import metrics
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "ghostradar-profiles"))
+# Sample every worker continuously from boot, writing a profile every PROFILE_DUMP_SECONDS.
+PROFILE_SAMPLING = os.environ.get("PROFILE_SAMPLING", "0") == "1"
+PROFILE_DUMP_SECONDS = int(os.environ.get("PROFILE_DUMP_SECONDS", "300"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "10"))
+# Write a profile of every request slower than this; 0 = off.
+PROFILE_SLOW_MS = int(os.environ.get("PROFILE_SLOW_MS", "0"))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "200"))
+PROFILE_MAX_DEPTH = 128
+# The admin endpoint can only switch sampling on in workers running the sampler.
+PROFILE_ENABLED = PROFILE_SAMPLING or PROFILE_SLOW_MS > 0 or bool(os.environ.get("ADMIN_TOKEN"))
+
+# Written by request_sampling() (the admin endpoint); every worker polls it.
+CONTROL_FILE = os.path.join(PROFILE_DIR, "sampling")
+CONTROL_POLL_SECONDS = 1.0
+
+
+# ── sampling profiler ─────────────────────────────────────
+#
+# A daemon thread per worker counts every thread's Python stack each
+# PROFILE_INTERVAL_MS, for all threads while sampling is on (PROFILE_SAMPLING
+# or the admin endpoint) and for in-flight requests when PROFILE_SLOW_MS is
+# set. Profiles are collapsed stacks, as read by flamegraph.pl and speedscope.
+
+_lock = threading.Lock()
+_inflight = {}          # thread id -> _Capture of the request it is serving
+_samples = Counter()    # worker-wide profile being collected
+_pending = []           # (file name, Counter) for the sampler to write
+_state = {"until": 0.0, "sampling": False, "started": 0.0}
+_thread_pid = None
+
+
+class _Capture:
+    __slots__ = ("route", "samples")
+
+    def __init__(self, route: str):
+        self.route = route
+        self.samples = Counter()
+
+
+_frame_names = {}  # code object -> "func (path:line)"
+
+
+def _frame_name(code) -> str:
+    name = _frame_names.get(code)
+    if name is None:
+        path = code.co_filename
+        for root in sys.path:
+            if root and path.startswith(root):
+                path = os.path.relpath(path, root)
+                break
+        name = _frame_names[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+    return name
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _sample(worker_wide: bool):
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()} if worker_wide else {}
+    with _lock:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            capture = _inflight.get(ident)
+            if capture is None and not worker_wide:
+                continue
+            stack = _collapse(frame)
+            if capture is not None:
+                capture.samples[stack] += 1
+            if worker_wide:
+                root = capture.route if capture is not None else f"[{names.get(ident, 'thread')}]"
+                _samples[f"{root};{stack}"] += 1
+
+
+def _sampling_until() -> float:
+    if PROFILE_SAMPLING:
+        return float("inf")
+    try:
+        with open(CONTROL_FILE) as f:
+            return float(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0.0
+
+
+def _dump_samples(reason: str):
+    with _lock:
+        samples = _samples.copy()
+        _samples.clear()
+    if samples:
+        _pending.append((f"{reason}-{_stamp()}-{os.getpid()}.folded", samples))
+
+
+def _run_sampler():
+    interval = PROFILE_INTERVAL_MS / 1000
+    next_poll = 0.0
+    while True:
+        now = time.monotonic()
+        if now >= next_poll:
+            next_poll = now + CONTROL_POLL_SECONDS
+            _state["until"] = _sampling_until()
+        sampling = time.time() < _state["until"]
+        if sampling and not _state["sampling"]:
+            _state["started"] = now
+        elif _state["sampling"] and (not sampling or now - _state["started"] >= PROFILE_DUMP_SECONDS):
+            _dump_samples("sample")
+            _state["started"] = now
+        _state["sampling"] = sampling
+
+        if sampling or (PROFILE_SLOW_MS and _inflight):
+            _sample(sampling)
+        while _pending:
+            _write(*_pending.pop(0))
+        time.sleep(interval if sampling or PROFILE_SLOW_MS else CONTROL_POLL_SECONDS)
+
+
+def _ensure_sampler():
+    global _thread_pid
+    pid = os.getpid()
+    if _thread_pid == pid:
+        return
+    with _lock:
+        if _thread_pid == pid:
+            return
+        # Stacks sampled before a fork belong to the parent.
+        _samples.clear()
+        _inflight.clear()
+        _thread_pid = pid
+        threading.Thread(target=_run_sampler, name="profile-sampler", daemon=True).start()
+
+
+def request_sampling(seconds: float) -> float:
+    """Sample every worker for the next `seconds` (0 stops it). Returns the
+    deadline as a unix timestamp."""
+    until = time.time() + seconds if seconds > 0 else 0.0
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(CONTROL_FILE, "w") as f:
+        f.write(f"{until:.3f}\n")
+    return until
+
+
+def flush():
+    """Write out this worker's in-progress profile (gunicorn worker_exit)."""
+    if _state["sampling"]:
+        _dump_samples("sample")
+    while _pending:
+        _write(*_pending.pop(0))
+
+
+atexit.register(flush)
+
+
+# ── profile files ─────────────────────────────────────────
+
+def _stamp() -> str:
+    return time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + f"{time.time() % 1:.3f}"[1:]
+
+
+def _write(name: str, samples: Counter):
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, name)
+        with open(path + ".tmp", "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(path + ".tmp", path)
+        for old in list_profiles()[PROFILE_MAX_FILES:]:
+            os.remove(os.path.join(PROFILE_DIR, old["name"]))
+    except OSError as e:
+        print(f"Writing profile {name} failed: {e}")
+
+
+def list_profiles() -> list:
+    """Profile files in PROFILE_DIR, newest first."""
+    try:
+        entries = [e for e in os.scandir(PROFILE_DIR) if e.name.endswith(".folded")]
+    except FileNotFoundError:
+        return []
+    files = [{"name": e.name, "bytes": e.stat().st_size, "mtime": e.stat().st_mtime} for e in entries]
+    return sorted(files, key=lambda f: -f["mtime"])
+
+
+# ── per-request CPU vs wall time ──────────────────────────
+#
+# Wall time includes waiting on Postgres, OpenAI and Stripe; the request
+# thread's CPU time doesn't, so a route whose CPU is close to its wall time
+# is spending it in Python (templates, JSON, pydantic), not on I/O. Jinja
+# rendering and JSON serialization are timed as phases of their own.
+
+_request: ContextVar = ContextVar("profile_request", default=None)
+_routes = {}  # route -> {"count", "wall", "cpu", "<phase>": seconds}
+
+
+def begin_request(route: str):
+    _request.set((time.perf_counter(), time.thread_time(), {}))
+    if PROFILE_ENABLED:
+        _ensure_sampler()
+        _inflight[threading.get_ident()] = _Capture(route)
+
+
+def end_request(route: str, method: str):
+    state = _request.get()
+    if state is None:
+        return
+    _request.set(None)
+    started, cpu_started, phases = state
+    wall = time.perf_counter() - started
+    cpu = time.thread_time() - cpu_started
+    metrics.REQUEST_CPU_SECONDS.labels(route, method).observe(cpu)
+    metrics.record("cpu", cpu)
+    for phase, seconds in phases.items():
+        metrics.REQUEST_PHASE_SECONDS.labels(route, phase).observe(seconds)
+    with _lock:
+        stats = _routes.setdefault(route, Counter())
+        stats.update(dict(phases, count=1, wall=wall, cpu=cpu))
+        capture = _inflight.pop(threading.get_ident(), None)
+    if capture is not None and PROFILE_SLOW_MS and wall * 1000 >= PROFILE_SLOW_MS and capture.samples:
+        slug = route.strip("/").replace("/", "_").replace("<", "").replace(">", "") or "root"
+        _pending.append((f"slow-{_stamp()}-{os.getpid()}-{slug}-{wall * 1000:.0f}ms.folded", capture.samples))
+
+
+def _add_phase(name: str, seconds: float):
+    state = _request.get()
+    if state is not None:
+        state[2][name] = state[2].get(name, 0.0) + seconds
+    metrics.record(name, seconds)
+
+
+@contextmanager
+def phase(name: str):
+    """Attribute a block's wall time to the current request as `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_phase(name, time.perf_counter() - start)
+
+
+def route_stats() -> dict:
+    """This worker's per-route averages (ms) since it started. cpu_share near
+    1 means the route is CPU-bound; near 0, it is waiting on I/O."""
+    with _lock:
+        routes = {route: dict(stats) for route, stats in _routes.items()}
+    result = {}
+    for route, totals in routes.items():
+        count = totals.pop("count")
+        result[route] = {
+            "count": count,
+            "cpu_share": round(totals["cpu"] / totals["wall"], 3) if totals["wall"] else None,
+            **{f"{key}_ms": round(seconds * 1000 / count, 2) for key, seconds in totals.items()},
+        }
+    return result
+
+
+def status() -> dict:
+    return {
+        "pid": os.getpid(),
+        "sampling": _state["sampling"],
+        "sampling_until": _state["until"] if _state["until"] != float("inf") else None,
+        "interval_ms": PROFILE_INTERVAL_MS,
+        "slow_ms": PROFILE_SLOW_MS,
+        "routes": route_stats(),
+        "profiles": list_profiles()[:50],
+    }
+
+
+# ── Jinja and JSON phases ─────────────────────────────────
+
+_render_started: ContextVar = ContextVar("render_started", default=None)
+
+
+def _before_render(sender, template, context, **extra):
+    _render_started.set(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    started = _render_started.get()
+    if started is not None:
+        _render_started.set(None)
+        _add_phase("render", time.perf_counter() - started)
+
+
+before_render_template.connect(_before_render)
+template_rendered.connect(_after_render)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with serialization timed as the "json" phase."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        with phase("json"):
+            return super().dumps(obj, **kwargs)
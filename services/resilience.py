@@ -0,0 +1,408 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import openai
+
+from services.metrics import AI_RESILIENCE
+
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "2"))
+OPENAI_RETRY_BASE = float(os.environ.get("OPENAI_RETRY_BASE", "0.5"))
+OPENAI_RETRY_CAP = float(os.environ.get("OPENAI_RETRY_CAP", "8"))
+# Per-attempt HTTP timeout (services/ai.py builds the clients with it).
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "30"))
+# Overall budget for one call() including retries; keep it below gunicorn's
+# timeout so the worker answers 503 instead of being killed.
+AI_DEADLINE = float(os.environ.get("AI_DEADLINE", "45"))
+# Start a second, identical request when the first is slower than this (0 = off).
+OPENAI_HEDGE_AFTER = float(os.environ.get("OPENAI_HEDGE_AFTER", "0"))
+
+# Per-process share of the org quota: divide by the number of worker processes.
+OPENAI_RPM = float(os.environ.get("OPENAI_RPM", "0"))  # 0 = unlimited
+OPENAI_TPM = float(os.environ.get("OPENAI_TPM", "0"))
+
+AI_CONCURRENCY_INITIAL = float(os.environ.get("AI_CONCURRENCY_INITIAL", "8"))
+AI_CONCURRENCY_MIN = float(os.environ.get("AI_CONCURRENCY_MIN", "1"))
+AI_CONCURRENCY_MAX = float(os.environ.get("AI_CONCURRENCY_MAX", "64"))
+AI_TARGET_LATENCY = float(os.environ.get("AI_TARGET_LATENCY", "8"))
+# How long a request may queue for a slot / quota before we shed it.
+AI_QUEUE_TIMEOUT = float(os.environ.get("AI_QUEUE_TIMEOUT", "5"))
+# How often a coroutine waiting for a slot checks again (it must not block the loop).
+AI_ASYNC_POLL = float(os.environ.get("AI_ASYNC_POLL", "0.02"))
+
+AI_BREAKER_FAILURES = int(os.environ.get("AI_BREAKER_FAILURES", "5"))
+AI_BREAKER_COOLDOWN = float(os.environ.get("AI_BREAKER_COOLDOWN", "30"))
+
+
+class AIUnavailable(Exception):
+    """The AI layer is overloaded or failing; callers should answer 503."""
+
+    def __init__(self, message: str, retry_after: float = 5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# ── adaptive concurrency (AIMD) ───────────────────────────
+
+class AdaptiveLimiter:
+    """Caps in-flight AI calls; the cap grows by ~1 per window of healthy calls
+    and is cut multiplicatively on errors or latency above the target."""
+
+    def __init__(self, initial, minimum, maximum, target_latency):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def has_capacity(self) -> bool:
+        with self._cond:
+            return self.in_flight < int(self.limit)
+
+    def release(self, latency: float, overloaded: bool):
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(self.minimum, self.limit * 0.5)
+            elif latency > self.target_latency:
+                self.limit = max(self.minimum, self.limit * 0.9)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+# ── rate limiting (RPM / TPM) ─────────────────────────────
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (0 = now). Takes it when available."""
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            self._refill()
+            amount = min(amount, self.capacity)
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0
+            return (amount - self.tokens) / self.rate
+
+    def adjust(self, delta: float):
+        """Correct an estimate once the real token usage is known."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+# ── circuit breaker ───────────────────────────────────────
+
+class CircuitBreaker:
+    """Opens after N consecutive failures; after the cooldown lets one trial
+    call through (half-open) and closes again if it succeeds."""
+
+    def __init__(self, failures: int, cooldown: float):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "open":
+                raise AIUnavailable("AI temporarily unavailable.", self.cooldown - (time.monotonic() - self.opened_at))
+            if state == "half-open":
+                if self.trial_in_flight:
+                    raise AIUnavailable("AI temporarily unavailable.", 1)
+                self.trial_in_flight = True
+
+    def cancel(self):
+        """The call never reached OpenAI; give up a half-open trial slot."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record(self, ok: bool):
+        with self._lock:
+            self.trial_in_flight = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+limiter = AdaptiveLimiter(AI_CONCURRENCY_INITIAL, AI_CONCURRENCY_MIN, AI_CONCURRENCY_MAX, AI_TARGET_LATENCY)
+requests_bucket = TokenBucket(OPENAI_RPM)
+tokens_bucket = TokenBucket(OPENAI_TPM)
+breaker = CircuitBreaker(AI_BREAKER_FAILURES, AI_BREAKER_COOLDOWN)
+_hedge_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ai-hedge")
+
+
+def _count(name: str, n: int = 1):
+    AI_RESILIENCE.labels(name).inc(n)
+
+
+# Errors that mean "OpenAI is struggling": retried, and they shrink the limit.
+_TRANSIENT = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def is_transient(e: Exception) -> bool:
+    if isinstance(e, _TRANSIENT):
+        return True
+    return isinstance(e, openai.APIStatusError) and e.status_code >= 500
+
+
+def _retry_after(e: Exception):
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _retry_delay(e: Exception, attempt: int, deadline: float) -> float:
+    """Jittered backoff, at least the server's Retry-After but never more than
+    OPENAI_RETRY_CAP. Raises AIUnavailable when another attempt (queueing
+    plus a full timeout) would not finish before the call's deadline."""
+    delay = random.uniform(0, min(OPENAI_RETRY_CAP, OPENAI_RETRY_BASE * 2 ** attempt))
+    delay = min(max(delay, _retry_after(e) or 0), OPENAI_RETRY_CAP)
+    if time.monotonic() + delay + AI_QUEUE_TIMEOUT + OPENAI_TIMEOUT > deadline:
+        raise AIUnavailable(f"AI request failed: {e}", max(delay, 1)) from e
+    return delay
+
+
+def _wait_for_quota(estimated_tokens: int):
+    for bucket, amount in ((requests_bucket, 1), (tokens_bucket, estimated_tokens)):
+        delay = bucket.wait_time(amount)
+        if delay > AI_QUEUE_TIMEOUT:
+            _count("shed")
+            raise AIUnavailable("AI rate limit reached, try again shortly.", delay)
+        while delay > 0:
+            time.sleep(delay)
+            delay = bucket.wait_time(amount)
+
+
+async def _wait_for_quota_async(estimated_tokens: int):
+    for bucket, amount in ((requests_bucket, 1), (tokens_bucket, estimated_tokens)):
+        delay = bucket.wait_time(amount)
+        if delay > AI_QUEUE_TIMEOUT:
+            _count("shed")
+            raise AIUnavailable("AI rate limit reached, try again shortly.", delay)
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = bucket.wait_time(amount)
+
+
+async def _acquire_async(timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not limiter.try_acquire():
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(AI_ASYNC_POLL)
+    return True
+
+
+def _finish(start: float, ok: bool, overloaded: bool, usage: dict, estimated_tokens: int):
+    limiter.release(time.monotonic() - start, overloaded)
+    # Refusals and bad requests are our problem, not an outage
+    breaker.record(ok or not overloaded)
+    if not ok and overloaded:
+        _count("failures")
+    if usage.get("tokens"):
+        tokens_bucket.adjust(usage["tokens"] - estimated_tokens)
+
+
+@contextmanager
+def guard(estimated_tokens: int = 0):
+    """Admission control for one AI call: breaker, quota and a concurrency slot.
+
+    Yields a dict the caller may fill with "tokens" (actual usage).
+    """
+    breaker.before_call()
+    try:
+        _wait_for_quota(estimated_tokens)
+        if not limiter.acquire(AI_QUEUE_TIMEOUT):
+            _count("shed")
+            raise AIUnavailable("AI is busy, try again shortly.", 2)
+    except AIUnavailable:
+        breaker.cancel()
+        raise
+
+    usage = {}
+    start = time.monotonic()
+    ok = False
+    overloaded = False
+    try:
+        yield usage
+        ok = True
+    except Exception as e:
+        overloaded = is_transient(e)
+        raise
+    finally:
+        _finish(start, ok, overloaded, usage, estimated_tokens)
+
+
+@asynccontextmanager
+async def guard_async(estimated_tokens: int = 0):
+    """guard() for coroutines: the same breaker, buckets and limiter, but
+    waits with asyncio.sleep instead of blocking the event loop."""
+    breaker.before_call()
+    try:
+        await _wait_for_quota_async(estimated_tokens)
+        if not await _acquire_async(AI_QUEUE_TIMEOUT):
+            _count("shed")
+            raise AIUnavailable("AI is busy, try again shortly.", 2)
+    except AIUnavailable:
+        breaker.cancel()
+        raise
+
+    usage = {}
+    start = time.monotonic()
+    ok = False
+    overloaded = False
+    try:
+        yield usage
+        ok = True
+    except Exception as e:
+        overloaded = is_transient(e)
+        raise
+    finally:
+        _finish(start, ok, overloaded, usage, estimated_tokens)
+
+
+def _attempt(fn, estimated_tokens: int):
+    with guard(estimated_tokens) as usage:
+        response = fn()
+        tokens = getattr(getattr(response, "usage", None), "total_tokens", None)
+        if tokens:
+            usage["tokens"] = tokens
+        return response
+
+
+def _attempt_hedged(fn, estimated_tokens: int):
+    first = _hedge_pool.submit(_attempt, fn, estimated_tokens)
+    done, _ = wait([first], timeout=OPENAI_HEDGE_AFTER)
+    if done or not limiter.has_capacity():
+        return first.result()
+    _count("hedges")
+    second = _hedge_pool.submit(_attempt, fn, estimated_tokens)
+    done, _ = wait([first, second], return_when=FIRST_COMPLETED)
+    winner = done.pop()
+    if winner is second:
+        _count("hedge_wins")
+    # The loser keeps running in the background; its result is discarded.
+    try:
+        return winner.result()
+    except Exception:
+        other = second if winner is first else first
+        return other.result()
+
+
+def call(fn, estimated_tokens: int = 0):
+    """Run fn (one OpenAI request) with admission control, jittered retries on
+    transient errors and optional hedging. Raises AIUnavailable when the AI
+    layer is down or overloaded."""
+    _count("calls")
+    attempt = 0
+    deadline = time.monotonic() + AI_DEADLINE
+    while True:
+        try:
+            if OPENAI_HEDGE_AFTER > 0:
+                return _attempt_hedged(fn, estimated_tokens)
+            return _attempt(fn, estimated_tokens)
+        except AIUnavailable:
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            if attempt >= OPENAI_MAX_RETRIES:
+                raise AIUnavailable(f"AI request failed: {e}") from e
+            attempt += 1
+            delay = _retry_delay(e, attempt, deadline)
+            _count("retries")
+            time.sleep(delay)
+
+
+async def _attempt_async(fn, estimated_tokens: int):
+    async with guard_async(estimated_tokens) as usage:
+        response = await fn()
+        tokens = getattr(getattr(response, "usage", None), "total_tokens", None)
+        if tokens:
+            usage["tokens"] = tokens
+        return response
+
+
+async def call_async(fn, estimated_tokens: int = 0):
+    """call() for an async fn (one AsyncOpenAI request). Same admission
+    control and retries; no hedging -- a slow call only holds a coroutine,
+    not a worker thread."""
+    _count("calls")
+    attempt = 0
+    deadline = time.monotonic() + AI_DEADLINE
+    while True:
+        try:
+            return await _attempt_async(fn, estimated_tokens)
+        except AIUnavailable:
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            if attempt >= OPENAI_MAX_RETRIES:
+                raise AIUnavailable(f"AI request failed: {e}") from e
+            attempt += 1
+            delay = _retry_delay(e, attempt, deadline)
+            _count("retries")
+            await asyncio.sleep(delay)
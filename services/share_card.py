@@ -0,0 +1,107 @@
+import os
+import tempfile
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+# Bump whenever the card layout changes: it is part of the cache file name and
+# of the card URL, so cached PNGs (on disk and in browsers) are never stale.
+TEMPLATE_VERSION = "1"
+SHARE_CARD_DIR = os.environ.get("SHARE_CARD_DIR", os.path.join(tempfile.gettempdir(), "ghostradar-cards"))
+SHARE_CARD_FONT = os.environ.get("SHARE_CARD_FONT", "DejaVuSans.ttf")
+SHARE_CARD_FONT_BOLD = os.environ.get("SHARE_CARD_FONT_BOLD", "DejaVuSans-Bold.ttf")
+
+# Same layout as the old canvas card (600x400), rendered at 2x for previews.
+W, H = 600, 400
+SCALE = 2
+
+_SCORES = (
+    ("Interest", "interest_score", "#06d6a0"),
+    ("Ghost Risk", "ghost_probability", "#ef4444"),
+    ("Red Flags", "red_flag_risk", "#f59e0b"),
+    ("Distance", "emotional_distance", "#7c3aed"),
+)
+_fonts = {}
+
+
+# ── share card rendering ──────────────────────────────────
+#
+# Cards are rendered once per scan and template version and kept in
+# SHARE_CARD_DIR; the scores on a saved scan never change, so a cached file
+# is valid for as long as TEMPLATE_VERSION is.
+
+def card_url(scan_id) -> str:
+    return f"/share/{scan_id}.png?v={TEMPLATE_VERSION}"
+
+
+def card_etag(scan_id) -> str:
+    return f"{scan_id}-v{TEMPLATE_VERSION}"
+
+
+def card_path(scan_id) -> str:
+    return os.path.join(SHARE_CARD_DIR, f"{scan_id}-v{TEMPLATE_VERSION}.png")
+
+
+def write_card(scan: dict) -> str:
+    """Render the card for scan into the cache and return its path."""
+    path = card_path(scan["id"])
+    os.makedirs(SHARE_CARD_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    render_card(scan).save(tmp, "PNG", optimize=True)
+    # Atomic, so concurrent renders of the same card can't serve a torn file
+    os.replace(tmp, path)
+    return path
+
+
+def render_card(scan: dict) -> Image.Image:
+    img = Image.new("RGB", (W * SCALE, H * SCALE))
+    _gradient(img, (0, 0), (W, H), "#0a0a0f", "#1a1025", diagonal=True)
+    draw = ImageDraw.Draw(img)
+
+    # Accent line
+    _gradient(img, (40, 58), (W - 80, 3), "#7c3aed", "#06d6a0")
+    draw.text(_xy(40, 48), "GhostRadar", fill="#a855f7", font=_font(28, bold=True), anchor="ls")
+
+    start_y = 110
+    col_w = (W - 80) / 4
+    for i, (label, key, color) in enumerate(_SCORES):
+        value = scan.get(key) or 0
+        cx = 40 + col_w * i + col_w / 2
+        cy = start_y + 50
+        box = [_px(cx - 42), _px(cy - 42), _px(cx + 42), _px(cy + 42)]
+        draw.ellipse(box, outline="#27272a", width=_px(5))
+        if value > 0:
+            draw.arc(box, start=-90, end=-90 + 360 * min(value, 100) / 100, fill=color, width=_px(5))
+        draw.text(_xy(cx, start_y + 58), str(value), fill="#ffffff", font=_font(26, bold=True), anchor="ms")
+        draw.text(_xy(cx, start_y + 110), label, fill="#71717a", font=_font(12), anchor="ms")
+
+    draw.text(_xy(40, 310), f"Reply window: {scan.get('reply_window') or '—'}", fill="#71717a", font=_font(14), anchor="ls")
+    draw.text(_xy(40, 335), f"Confidence: {scan.get('confidence') or '—'}", fill="#71717a", font=_font(14), anchor="ls")
+    draw.text(_xy(W - 40, H - 20), "ghostradar.app", fill="#52525b", font=_font(12), anchor="rs")
+    return img
+
+
+def _px(v: float) -> int:
+    return round(v * SCALE)
+
+
+def _xy(x: float, y: float) -> tuple:
+    return _px(x), _px(y)
+
+
+def _font(size: int, bold: bool = False):
+    key = (size, bold)
+    if key not in _fonts:
+        try:
+            _fonts[key] = ImageFont.truetype(SHARE_CARD_FONT_BOLD if bold else SHARE_CARD_FONT, _px(size))
+        except OSError:
+            _fonts[key] = ImageFont.load_default(_px(size))
+    return _fonts[key]
+
+
+def _gradient(img: Image.Image, origin: tuple, size: tuple, start: str, end: str, diagonal: bool = False):
+    w, h = _px(size[0]), _px(size[1])
+    mask = Image.linear_gradient("L").rotate(90).resize((w, h))  # left to right
+    if diagonal:
+        mask = ImageChops.add(mask, Image.linear_gradient("L").resize((w, h)), scale=2)
+    band = Image.composite(Image.new("RGB", (w, h), end), Image.new("RGB", (w, h), start), mask)
+    img.paste(band, _xy(*origin))
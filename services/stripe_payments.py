@@ -1,31 +1,57 @@
 import os
+import threading
 import stripe
 
-stripe.api_key = os.environ.get("STRIPE_SECRET_KEY")
+from services.metrics import timed
+from services.db import apply_stripe_events, purge_stripe_events
+from services.events import log_event
+from services.auth import revoke_entitlement
 
+STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY")
 APP_URL = os.environ.get("APP_URL", "http://localhost:5000")
 PRICE_MONTHLY = os.environ.get("STRIPE_PRICE_MONTHLY")
+STRIPE_EVENT_BATCH_SIZE = int(os.environ.get("STRIPE_EVENT_BATCH_SIZE", "50"))
+# Applied webhook events are kept this long for debugging; 0 = keep forever.
+STRIPE_EVENT_RETENTION_DAYS = int(os.environ.get("STRIPE_EVENT_RETENTION_DAYS", "30"))
 
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
 
+
+def get_client() -> stripe.StripeClient:
+    """The process's Stripe client, built on first use (per worker process)."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = stripe.StripeClient(STRIPE_SECRET_KEY)
+                _client_pid = pid
+    return _client
+
+
+@timed("stripe")
 def create_checkout_session(user_id: str, plan: str = "monthly") -> str:
     """Create a Stripe Checkout session and return the URL."""
     price_id = PRICE_MONTHLY
     mode = "subscription"
 
-    session = stripe.checkout.Session.create(
-        mode=mode,
-        line_items=[{"price": price_id, "quantity": 1}],
-        success_url=f"{APP_URL}/success?session_id={{CHECKOUT_SESSION_ID}}",
-        cancel_url=f"{APP_URL}/cancel",
-        metadata={"user_id": str(user_id), "plan": plan},
-    )
+    session = get_client().checkout.sessions.create(params={
+        "mode": mode,
+        "line_items": [{"price": price_id, "quantity": 1}],
+        "success_url": f"{APP_URL}/success?session_id={{CHECKOUT_SESSION_ID}}",
+        "cancel_url": f"{APP_URL}/cancel",
+        "metadata": {"user_id": str(user_id), "plan": plan},
+    })
     return session.url, session.id
 
 
+@timed("stripe")
 def verify_session(session_id: str) -> dict | None:
     """Retrieve a Stripe Checkout session to verify payment."""
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        session = get_client().checkout.sessions.retrieve(session_id)
         if session.payment_status == "paid":
             return {
                 "user_id": session.metadata.get("user_id"),
@@ -40,3 +66,40 @@ def construct_webhook_event(payload: bytes, sig_header: str) -> stripe.Event:
     """Construct and verify a Stripe webhook event."""
     webhook_secret = os.environ.get("STRIPE_WEBHOOK_SECRET")
     return stripe.Webhook.construct_event(payload, sig_header, webhook_secret)
+
+
+# ── webhook event processing ──────────────────────────────
+#
+# /webhook/stripe only stores the verified event (deduplicated by event id)
+# and answers 200. process_stripe_events() applies what is pending: right
+# after the webhook response is sent, and periodically from worker.py (the
+# ghostradar-worker service in render.yaml) as a safety net, which also
+# purges applied events past STRIPE_EVENT_RETENTION_DAYS. /api/confirm goes through the same complete_checkout
+# transition, so whichever path arrives first unlocks and the other no-ops.
+
+def record_unlock(unlock: dict, via: str):
+    """Side effects of an applied unlock, outside the DB transaction."""
+    revoke_entitlement(unlock["user_id"], unlock["entitlement_version"])
+    log_event(unlock["user_id"], "purchase_completed", {"plan": unlock["plan"], "via": via})
+
+
+def process_stripe_events() -> list:
+    """Apply every pending webhook event. Returns the unlocks applied."""
+    unlocks = []
+    while True:
+        taken, applied = apply_stripe_events(STRIPE_EVENT_BATCH_SIZE)
+        for unlock in applied:
+            record_unlock(unlock, "webhook")
+        unlocks.extend(applied)
+        if taken < STRIPE_EVENT_BATCH_SIZE:
+            return unlocks
+
+
+def purge_processed_events() -> int:
+    """Delete applied webhook events older than STRIPE_EVENT_RETENTION_DAYS."""
+    if STRIPE_EVENT_RETENTION_DAYS <= 0:
+        return 0
+    deleted = purge_stripe_events(STRIPE_EVENT_RETENTION_DAYS * 86400)
+    if deleted:
+        print(f"stripe events: purged {deleted} applied events")
+    return deleted
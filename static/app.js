@@ -7,6 +7,7 @@
   let direction = 'they';
   let lastResult = null;
   let scanCount = 0;
+  const scanMode = document.body.dataset.scanMode || 'sync';
 
   // ── DOM refs ──
   const textarea      = document.getElementById('scan-input');
@@ -20,6 +21,7 @@
   // ── Init ──
   logEvent('landed_app');
   loadHistory();
+  if (new URLSearchParams(window.location.search).has('reveal')) revealLastScan();
 
   // ── Direction toggle ──
   dirBtns.forEach(btn => {
@@ -42,7 +44,7 @@
     showScanner();
 
     try {
-      const res = await fetch('/api/scan', {
+      const res = await fetch(scanMode === 'async' ? '/api/scan' : '/api/scan/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ message_text: text, direction }),
@@ -60,19 +62,38 @@
         throw new Error(err.error || 'Scan failed');
       }
 
-      const data = await res.json();
+      // Render each field as the server streams it, instead of waiting
+      // for the whole analysis. Queued (async) scans are polled instead.
+      const shown = new Set();
+      let revealed = false;
+      const reveal = () => {
+        if (revealed) return;
+        revealed = true;
+        hideScanner();
+        resultsSection.classList.add('visible');
+        resultsSection.scrollIntoView({ behavior: 'smooth', block: 'start' });
+      };
+      const data = res.status === 202
+        ? await pollScanJob((await res.json()).job_id)
+        : await readScanStream(res, (name, value) => {
+            reveal();
+            shown.add(name);
+            renderField(name, value);
+          }, provisional => {
+            // Instant local estimate; overwritten as the model's fields arrive
+            reveal();
+            Object.keys(METERS).concat('archetype').forEach(name => renderField(name, provisional[name]));
+          });
+
       lastResult = data;
       window.__lastResult = data;
       scanCount++;
-
-      // Stage the scanner text transitions
-      await stageText('Detecting signals…', 600);
-      await stageText('Estimating ghost risk…', 600);
-      await stageText('Compiling analysis…', 400);
+      // Provisional (AI unavailable) results are not saved and have no id
+      if (data.id) localStorage.setItem('ghostradar_last_scan', data.id);
 
       hideScanner();
       scanBtn.disabled = false;
-      renderResults(data);
+      renderResults(data, shown);
       loadHistory();
 
     } catch (err) {
@@ -82,6 +103,63 @@
     }
   }
 
+  // ── After purchase: reopen the last scan with its paid fields ──
+  async function revealLastScan() {
+    const id = localStorage.getItem('ghostradar_last_scan');
+    if (!id) return;
+    scannerText.textContent = 'Decrypting hidden signals…';
+    scannerOverlay.classList.add('active');
+    try {
+      const res = await fetch('/api/scan/' + encodeURIComponent(id));
+      if (!res.ok) return;
+      const data = await res.json();
+      lastResult = data;
+      window.__lastResult = data;
+      renderResults(data);
+    } catch (e) { /* ignore */ } finally {
+      hideScanner();
+    }
+  }
+
+  // ── Poll a queued scan until the worker finishes it ──
+  async function pollScanJob(jobId) {
+    for (;;) {
+      await new Promise(resolve => setTimeout(resolve, 1000));
+      const res = await fetch('/api/scan/jobs/' + encodeURIComponent(jobId));
+      if (!res.ok) throw new Error('Scan failed');
+      const job = await res.json();
+      if (job.status === 'done') return job.result;
+      if (job.status === 'failed') throw new Error(job.error || 'Scan failed');
+    }
+  }
+
+  // ── SSE reader: calls onField per "field" event, resolves with "done" ──
+  async function readScanStream(res, onField, onProvisional) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) throw new Error('Scan interrupted');
+      buf += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buf.indexOf('\n\n')) !== -1) {
+        const frame = buf.slice(0, sep);
+        buf = buf.slice(sep + 2);
+        let event = 'message', payload = '';
+        frame.split('\n').forEach(line => {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) payload += line.slice(6);
+        });
+        const msg = JSON.parse(payload);
+        if (event === 'field') onField(msg.name, msg.value);
+        else if (event === 'provisional') onProvisional(msg);
+        else if (event === 'done') return msg;
+        else if (event === 'error') throw new Error(msg.error || 'Scan failed');
+      }
+    }
+  }
+
   // ── Scanner animation ──
   function showScanner() {
     scannerText.textContent = 'Scanning tone…';
@@ -92,33 +170,55 @@
     scannerOverlay.classList.remove('active');
   }
 
-  function stageText(text, delay) {
-    return new Promise(resolve => {
-      setTimeout(() => {
-        scannerText.textContent = text;
-        resolve();
-      }, delay);
-    });
-  }
-
   // ── Render results ──
-  function renderResults(data) {
-    resultsSection.classList.add('visible');
+  const METERS = {
+    interest_score:     ['meter-interest', false],
+    red_flag_risk:      ['meter-redflag', true],
+    emotional_distance: ['meter-distance', true],
+    ghost_probability:  ['meter-ghost', true],
+  };
 
-    // Meters
-    animateMeter('meter-interest', data.interest_score, colorForScore(data.interest_score, false));
-    animateMeter('meter-redflag', data.red_flag_risk, colorForScore(data.red_flag_risk, true));
-    animateMeter('meter-distance', data.emotional_distance, colorForScore(data.emotional_distance, true));
-    animateMeter('meter-ghost', data.ghost_probability, colorForScore(data.ghost_probability, true));
+  // Render a single streamed field
+  function renderField(name, value) {
+    if (METERS[name]) {
+      const [id, danger] = METERS[name];
+      animateMeter(id, value, colorForScore(value, danger));
+    } else if (name === 'archetype') {
+      renderArchetype(value);
+    } else if (name === 'summary') {
+      document.getElementById('summary-panel').classList.remove('panel-locked');
+      document.getElementById('summary-text').textContent = value || '';
+    } else if (name === 'reply_window') {
+      document.getElementById('pred-window').textContent = value || '—';
+    } else if (name === 'confidence') {
+      document.getElementById('pred-confidence').textContent = value || '—';
+    }
+  }
 
-    // Archetype — always visible
+  function renderArchetype(archetype) {
     const archetypeEl = document.getElementById('archetype-badge');
-    if (data.archetype) {
-      archetypeEl.textContent = data.archetype;
+    if (archetype) {
+      archetypeEl.textContent = archetype;
       archetypeEl.style.display = 'inline-block';
     } else {
       archetypeEl.style.display = 'none';
     }
+  }
+
+  // `shown` holds meters already animated from the stream
+  function renderResults(data, shown) {
+    const alreadyVisible = shown && shown.size > 0;
+    resultsSection.classList.add('visible');
+
+    // Meters
+    Object.keys(METERS).forEach(name => {
+      if (shown && shown.has(name)) return;
+      const [id, danger] = METERS[name];
+      animateMeter(id, data[name], colorForScore(data[name], danger));
+    });
+
+    // Archetype — always visible
+    renderArchetype(data.archetype);
 
     // Hidden signals panel
     const hsPanel = document.getElementById('hidden-signals-panel');
@@ -161,7 +261,9 @@
     }
 
     // Scroll to results
-    resultsSection.scrollIntoView({ behavior: 'smooth', block: 'start' });
+    if (!alreadyVisible) {
+      resultsSection.scrollIntoView({ behavior: 'smooth', block: 'start' });
+    }
 
     // Locked panels → open paywall
     document.querySelectorAll('.panel-locked').forEach(el => {
@@ -287,15 +389,41 @@
     });
   });
 
-  // ── Event logger ──
+  // ── Event logger (coalesced into one POST per second) ──
+  let eventQueue = [];
+  let eventTimer = null;
+
   function logEvent(name, meta) {
+    eventQueue.push({ event_name: name, meta: meta || {} });
+    if (!eventTimer) eventTimer = setTimeout(flushEvents, 1000);
+  }
+
+  function flushEvents(useBeacon) {
+    clearTimeout(eventTimer);
+    eventTimer = null;
+    if (!eventQueue.length) return;
+    const body = JSON.stringify({ events: eventQueue });
+    eventQueue = [];
+    if (useBeacon && navigator.sendBeacon) {
+      navigator.sendBeacon('/api/event', new Blob([body], { type: 'application/json' }));
+      return;
+    }
     fetch('/api/event', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ event_name: name, meta: meta || {} }),
+      body,
+      keepalive: true,
     }).catch(() => {});
   }
 
+  // Checkout redirects and tab closes must not lose queued events
+  window.addEventListener('pagehide', () => flushEvents(true));
+  document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') flushEvents(true);
+  });
+
+  window.logEvent = logEvent;
+
   // ── Utils ──
   function esc(s) {
     const d = document.createElement('div');
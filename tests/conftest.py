@@ -0,0 +1,34 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def database():
+    """A migrated throwaway Postgres (bench/pg_fixture.py) that services.db
+    points at; skipped when no Postgres is available."""
+    from bench.pg_fixture import postgres
+    from services import db, migrations
+
+    fixture = postgres()
+    try:
+        url = fixture.__enter__()
+    except (RuntimeError, OSError) as e:
+        pytest.skip(f"No Postgres for tests: {e}")
+    patch = pytest.MonkeyPatch()
+    patch.setattr(db, "DATABASE_URL", url)
+    patch.setitem(db._DSNS, "primary", url)
+    patch.setattr(migrations, "DATABASE_URL", url)
+    db.reset_pool()
+    try:
+        migrations.migrate()
+        yield url
+    finally:
+        db.close_pool()
+        patch.undo()
+        fixture.__exit__(None, None, None)
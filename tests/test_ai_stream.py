@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from services.ai import _complete_fields
+
+DOC = {
+    "interest_score": 42,
+    "summary": "He said \"ok, sure: later\" and {left}",
+    "hidden_signals": [{"signal": "short replies", "weight": 0.5}, {"signal": "no questions"}],
+    "replies": {"warm": "Hey!", "direct": "Are we still on?"},
+    "enriched": True,
+    "confidence": None,
+    "ghost_probability": 70,
+}
+
+
+def _stream(text: str, step: int = 1):
+    """Feed text in step-sized deltas the way analyze_message_stream does."""
+    buf, pos, seen = "", 0, []
+    for i in range(0, len(text), step):
+        buf += text[i:i + step]
+        fields, pos = _complete_fields(buf, pos)
+        seen.extend(fields.items())
+    return seen
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("step", [1, 3, 1000])
+def test_fields_arrive_once_in_order(indent, step):
+    seen = _stream(json.dumps(DOC, indent=indent), step)
+    assert seen == list(DOC.items())
+
+
+def test_number_at_end_of_buffer_waits_for_terminator():
+    fields, pos = _complete_fields('{"a": 4')
+    assert fields == {}
+    fields, pos = _complete_fields('{"a": 42', pos)
+    assert fields == {}
+    fields, pos = _complete_fields('{"a": 42,', pos)
+    assert fields == {"a": 42}
+
+
+def test_resume_offset_skips_parsed_fields():
+    buf = '{"a": 1, "b": "two", "c'
+    fields, pos = _complete_fields(buf)
+    assert fields == {"a": 1, "b": "two"}
+    fields, _ = _complete_fields(buf + '": [3]}', pos)
+    assert fields == {"c": [3]}
+
+
+@pytest.mark.parametrize("buf", ["", "   ", '["a", 1]', '{"a"', '{"a": "unterminated'])
+def test_incomplete_or_non_object_yields_nothing(buf):
+    assert _complete_fields(buf)[0] == {}
@@ -0,0 +1,62 @@
+from scripts.build_static import minify_css, minify_js
+
+
+def test_css_drops_comments_and_whitespace():
+    css = """
+    /* header */
+    .a , .b {
+        color : red ;
+        margin: 0 auto;
+    }
+    """
+    assert minify_css(css) == ".a,.b{color :red;margin:0 auto}\n"
+
+
+def test_css_keeps_quoted_strings():
+    css = """.a::before { content: "a; b, c: d /* not a comment */"; }
+    .b { font-family: 'Open Sans', sans-serif; }"""
+    assert minify_css(css) == (
+        '.a::before{content:"a; b, c: d /* not a comment */"}'
+        ".b{font-family:'Open Sans',sans-serif}\n"
+    )
+
+
+def test_css_keeps_url_data():
+    css = ".a { background: url(data:image/svg+xml;utf8,<svg a='1, 2'/>) no-repeat; }"
+    assert minify_css(css) == ".a{background:url(data:image/svg+xml;utf8,<svg a='1, 2'/>) no-repeat}\n"
+
+
+def test_css_escaped_quote_in_string():
+    assert minify_css('.a { content: "say \\"hi; there\\"" ; }') == '.a{content:"say \\"hi; there\\""}\n'
+
+
+def test_js_strips_indentation_blank_lines_and_line_comments():
+    js = """
+    // setup
+    function f() {
+        return 1;
+    }
+
+    """
+    assert minify_js(js) == "function f() {\nreturn 1;\n}\n"
+
+
+def test_js_keeps_code_after_block_comment():
+    js = """/* x */ init();
+    /* multi
+       line */ go();
+    /**/ /* y */ last();"""
+    assert minify_js(js) == "init();\ngo();\nlast();\n"
+
+
+def test_js_drops_multiline_comment():
+    js = """/*
+     * docs
+     */
+    run();"""
+    assert minify_js(js) == "run();\n"
+
+
+def test_js_leaves_trailing_comments_alone():
+    # Only comments that start a line are removed; the rest needs a real parser.
+    assert minify_js('a = "/* s */"; // c\n') == 'a = "/* s */"; // c\n'
@@ -0,0 +1,73 @@
+import pytest
+
+import app
+from services import metrics
+
+
+@pytest.fixture
+def logged(monkeypatch):
+    events = []
+    monkeypatch.setattr(app, "log_event", lambda user_id, name, meta: events.append((user_id, name, meta)))
+    return events
+
+
+def _dropped() -> float:
+    return metrics.EVENTS.labels("dropped")._value.get()
+
+
+def test_single_event(logged):
+    assert app._log_events("u", {"event_name": "share_clicked", "meta": {"via": "card"}})
+    assert logged == [("u", "share_clicked", {"via": "card"})]
+
+
+def test_defaults(logged):
+    assert app._log_events("u", {})
+    assert logged == [("u", "unknown", {})]
+
+
+def test_events_envelope(logged):
+    body = {"events": [{"event_name": "a"}, {"event_name": "b", "meta": {"n": 1}}]}
+    assert app._log_events("u", body)
+    assert logged == [("u", "a", {}), ("u", "b", {"n": 1})]
+
+
+def test_bare_list(logged):
+    assert app._log_events("u", [{"event_name": "a"}, {"event_name": "b"}])
+    assert [name for _, name, _ in logged] == ["a", "b"]
+
+
+def test_envelope_that_is_not_a_list_is_one_event(logged):
+    assert app._log_events("u", {"event_name": "a", "events": "nope"})
+    assert [name for _, name, _ in logged] == ["a"]
+
+
+@pytest.mark.parametrize("body", [None, "event", 3, True])
+def test_other_bodies_are_rejected(logged, body):
+    assert not app._log_events("u", body)
+    assert logged == []
+
+
+def test_invalid_entries_are_dropped_and_counted(logged):
+    before = _dropped()
+    body = [
+        {"event_name": "ok"},
+        "not an object",
+        {"event_name": 7},
+        {"event_name": ""},
+        {"event_name": "x" * (app.MAX_EVENT_NAME_LENGTH + 1)},
+        {"event_name": "nul\x00"},
+        {"event_name": "meta", "meta": ["not", "an", "object"]},
+        {"event_name": "big", "meta": {"blob": "x" * app.MAX_EVENT_META_BYTES}},
+        {"event_name": "nul_meta", "meta": {"s": "a\x00b"}},
+    ]
+    assert app._log_events("u", body)
+    assert [name for _, name, _ in logged] == ["ok"]
+    assert _dropped() - before == len(body) - 1
+
+
+def test_batch_is_capped(logged):
+    before = _dropped()
+    extra = 7
+    assert app._log_events("u", [{"event_name": "e"}] * (app.MAX_EVENTS_PER_POST + extra))
+    assert len(logged) == app.MAX_EVENTS_PER_POST
+    assert _dropped() - before == extra
@@ -0,0 +1,71 @@
+import uuid
+
+import pytest
+
+from services import db
+
+
+@pytest.fixture
+def device(database, monkeypatch):
+    monkeypatch.setattr(db, "FREE_SCANS_PER_DAY", 2)
+    return f"test-{uuid.uuid4()}"
+
+
+def _set_day(user_id, days_ago: int):
+    with db.get_conn(request_scoped=False) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE users SET free_scans_day = CURRENT_DATE - %s WHERE id = %s", (days_ago, user_id),
+            )
+        conn.commit()
+
+
+def _used(device_id) -> int:
+    with db.get_conn(request_scoped=False) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT free_scans_used_today FROM users WHERE device_id = %s", (device_id,))
+            return cur.fetchone()["free_scans_used_today"]
+
+
+def test_daily_limit(device):
+    assert db.reserve_scan(device)[2]
+    assert db.reserve_scan(device)[2]
+    user, unlocked, reserved = db.reserve_scan(device)
+    assert not unlocked and not reserved
+    assert user["free_scans_used_today"] == 2
+
+
+def test_reserve_is_all_or_none(device):
+    assert db.reserve_scan(device)[2]
+    assert not db.reserve_scan(device, scans=2)[2]
+    assert _used(device) == 1
+
+
+def test_release_same_day(device):
+    user, _, reserved = db.reserve_scan(device, scans=2)
+    assert reserved
+    db.release_free_scan(user["id"])
+    assert _used(device) == 1
+    db.release_free_scan(user["id"], scans=5)
+    assert _used(device) == 0
+
+
+def test_new_day_resets_the_count(device):
+    user, _, _ = db.reserve_scan(device, scans=2)
+    assert not db.reserve_scan(device)[2]
+    _set_day(user["id"], 1)
+    user, _, reserved = db.reserve_scan(device)
+    assert reserved
+    assert user["free_scans_used_today"] == 1
+
+
+def test_release_after_rollover_does_not_touch_the_new_day(device):
+    # A scan reserved yesterday that fails after midnight must not hand
+    # back one of today's scans.
+    user, _, _ = db.reserve_scan(device, scans=2)
+    _set_day(user["id"], 1)
+    db.release_free_scan(user["id"])
+    assert _used(device) == 2
+    user, _, reserved = db.reserve_scan(device, scans=2)
+    assert reserved
+    assert user["free_scans_used_today"] == 2
@@ -0,0 +1,53 @@
+import pytest
+
+from services import heuristics
+
+
+@pytest.fixture(autouse=True)
+def default_weights(monkeypatch):
+    # Independent of any fitted heuristic_weights.json on the machine
+    monkeypatch.setattr(heuristics, "_model", heuristics._compile(heuristics.DEFAULT_WEIGHTS))
+
+
+@pytest.mark.parametrize("text", [
+    "", "k", "haha that was so fun, are you free tomorrow for dinner? 😊",
+    "WHY DIDN'T YOU ANSWER ME", "sorry for the late reply... been swamped", "x" * 5000,
+])
+@pytest.mark.parametrize("direction", ["they", "me"])
+def test_score_shape(text, direction):
+    result = heuristics.score(text, direction)
+    for name in heuristics.SCORES:
+        assert isinstance(result[name], int) and 0 <= result[name] <= 100
+    assert result["archetype"] in heuristics.ARCHETYPES
+    assert result["archetype"].lower() in result["summary"]
+    assert result["confidence"] == "Low"
+    assert 1 <= result["hidden_signals_count"] <= 5
+    assert result["reply_window"].startswith("Likely")
+
+
+def test_warm_plans_read_more_interested_than_a_brush_off():
+    warm = heuristics.score("haha I had fun, can't wait to see you tomorrow! dinner?")
+    cold = heuristics.score("k")
+    assert warm["interest_score"] > cold["interest_score"]
+    assert warm["ghost_probability"] < cold["ghost_probability"]
+    assert warm["emotional_distance"] < cold["emotional_distance"]
+
+
+def test_controlling_message_raises_red_flags():
+    neutral = heuristics.score("sounds good, see you then")
+    control = heuristics.score("Why didn't you answer me? Where were you? You always do this")
+    assert control["red_flag_risk"] > neutral["red_flag_risk"]
+
+
+def test_phrases_count_before_words():
+    x = heuristics.features("can't wait")
+    assert x[heuristics._INDEX["warm"]] > 0
+
+
+def test_direction_feature():
+    assert heuristics.features("hi", "me")[heuristics._INDEX["direction_me"]] == 1.0
+    assert heuristics.features("hi", "they")[heuristics._INDEX["direction_me"]] == 0.0
+
+
+def test_score_is_deterministic():
+    assert heuristics.score("maybe later") == heuristics.score("maybe later")
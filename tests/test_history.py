@@ -0,0 +1,30 @@
+import base64
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app import _decode_cursor, _encode_cursor
+
+
+def _b64(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    scan = {"created_at": datetime(2026, 3, 1, 12, 30, 5, 123456), "id": uuid.uuid4()}
+    cursor = _encode_cursor(scan)
+    assert "=" not in cursor
+    assert _decode_cursor(cursor) == (scan["created_at"], str(scan["id"]))
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    _b64("no separator"),
+    _b64("2026-03-01T12:30:05|not-a-uuid"),
+    _b64(f"yesterday|{uuid.uuid4()}"),
+    _b64(f"2026-03-01T12:30:05|{uuid.uuid4()}|extra"),
+    base64.urlsafe_b64encode(b"\xff\xfe|x").decode(),
+])
+def test_invalid_cursor_is_none(cursor):
+    assert _decode_cursor(cursor) is None
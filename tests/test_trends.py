@@ -0,0 +1,16 @@
+import pytest
+
+from app import _slope
+
+
+@pytest.mark.parametrize("values, expected", [
+    ([], 0.0),
+    ([50], 0.0),
+    ([10, 20], 10.0),
+    ([30, 30, 30, 30], 0.0),
+    ([1, 2, 3, 4, 5], 1.0),
+    ([90, 70, 50, 30], -20.0),
+    ([0, 10, 0, 10], 2.0),
+])
+def test_slope(values, expected):
+    assert _slope(values) == pytest.approx(expected)
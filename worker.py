@@ -0,0 +1,11 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.migrations import schema_is_current, migrate
+from services.jobs import run_worker
+
+if __name__ == "__main__":
+    if not schema_is_current():
+        migrate()
+    run_worker()